@@ -152,6 +152,28 @@ STATIC_ROOT = BASE_DIR / 'staticfiles'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 MEDIA_URL = '/media/'
 
+# Файлы индексов каталога (подсказки поиска и т.п.), общие для всех воркеров
+STORE_INDEX_DIR = os.path.join(BASE_DIR, 'indexes')
+
+# Кэш ответов списка товаров (store.list_cache). При нескольких воркерах
+# используйте store.cache_backends.LRUFileBasedCache, чтобы сброс по тегам
+# был общим для всех процессов.
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'product_list': {
+        'BACKEND': config('PRODUCT_LIST_CACHE_BACKEND',
+                          default='django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': config('PRODUCT_LIST_CACHE_LOCATION', default='product-list'),
+        'TIMEOUT': config('PRODUCT_LIST_CACHE_TIMEOUT', default=300, cast=int),
+        'OPTIONS': {
+            'MAX_ENTRIES': config('PRODUCT_LIST_CACHE_MAX_ENTRIES', default=2000, cast=int),
+            'CULL_FREQUENCY': config('PRODUCT_LIST_CACHE_CULL_FREQUENCY', default=4, cast=int),
+        },
+    },
+}
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/4.2/ref/settings/#default-auto-field
 
@@ -166,7 +188,16 @@ REST_FRAMEWORK = {
         'rest_framework_simplejwt.authentication.JWTAuthentication',
     ),
     'DEFAULT_PAGINATION_CLASS': 'rest_framework.pagination.PageNumberPagination',
-    'PAGE_SIZE': 9
+    'PAGE_SIZE': 9,
+    'DEFAULT_RENDERER_CLASSES': (
+        'store.renderers.ORJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ),
+    'DEFAULT_PARSER_CLASSES': (
+        'store.renderers.ORJSONParser',
+        'rest_framework.parsers.FormParser',
+        'rest_framework.parsers.MultiPartParser',
+    ),
 }
 
 
@@ -204,6 +235,18 @@ ADMINS = [
 # YOOKASSA
 YOOKASSA_SECRET_KEY = config('YOOKASSA_SECRET_KEY')
 YOOKASSA_ACCOUNT_ID = config('YOOKASSA_ACCOUNT_ID')
+# Для нагрузочных тестов — адрес заглушки: manage.py run_payment_gateway_stub
+YOOKASSA_API_URL = config('YOOKASSA_API_URL', default='https://api.yookassa.ru/v3')
+YOOKASSA_RETURN_URL = config('YOOKASSA_RETURN_URL', default='https://www.example.com/return_url')
+YOOKASSA_CONNECT_TIMEOUT = config('YOOKASSA_CONNECT_TIMEOUT', default=3, cast=float)
+YOOKASSA_READ_TIMEOUT = config('YOOKASSA_READ_TIMEOUT', default=10, cast=float)
+YOOKASSA_POOL_SIZE = config('YOOKASSA_POOL_SIZE', default=10, cast=int)
+# После стольких ошибок подряд запросы к ЮKassa не выполняются RESET секунд
+YOOKASSA_BREAKER_FAILURES = config('YOOKASSA_BREAKER_FAILURES', default=5, cast=int)
+YOOKASSA_BREAKER_RESET = config('YOOKASSA_BREAKER_RESET', default=30, cast=float)
+
+# Номера заказов: каждый процесс резервирует столько значений за один запрос
+ORDER_NUMBER_BLOCK_SIZE = config('ORDER_NUMBER_BLOCK_SIZE', default=100, cast=int)
 
 CORS_ALLOWED_ORIGINS = [
     "http://localhost:3000",
@@ -33,7 +33,8 @@ class FavoriteProductsView(APIView):
     permission_classes = [IsAuthenticated]
 
     def get(self, request):
-        favorites = FavoriteProducts.objects.filter(user_profile__user=request.user)
+        favorites = FavoriteProducts.objects.filter(
+            user_profile__user=request.user).select_related('product')
         products = [item.product for item in favorites]
         serializer = ProductNameSerializer(products, many=True)
         return Response(serializer.data)
@@ -1,11 +1,19 @@
+import io
+
 from django.contrib.admin.widgets import FilteredSelectMultiple
+from django.core.exceptions import PermissionDenied
+from django.template.response import TemplateResponse
+from django.urls import path
 from django.db import models  # Добавьте импорт
 from django.contrib import admin
 
 from django import forms
 from django.forms.widgets import CheckboxSelectMultiple
+from django.utils.html import format_html, format_html_join
 
-from .models import Product, ProductImage, Menu, Category, Collection, ImageCollection, Size, ProductColor, Color, Order, OrderItem, PaymentRecord
+from .models import Product, ProductImage, Menu, Category, Collection, ImageCollection, Size, ProductColor, Color, Order, OrderItem, PaymentRecord, OutboundEmail
+from .variants import VariantMatrix
+from .fulfilment import import_fulfilment
 
 admin.site.register(ProductImage)
 admin.site.register(PaymentRecord)
@@ -45,10 +53,24 @@ class ProductAdmin(admin.ModelAdmin, forms.ModelForm):
     formfield_overrides = {
         models.ManyToManyField: {'widget': CheckboxSelectMultiple}
     }
-    exclude = ['views']
+    exclude = ['views', 'views_count']
+    readonly_fields = ['variants']
     filter_vertical = ('colors', 'category')
     inlines = [ProductColorInline]
 
+    @admin.display(description='Остатки по цветам и размерам')
+    def variants(self, obj):
+        if not obj.pk:
+            return '-'
+        matrix = VariantMatrix.for_product(obj)
+        rows = (
+            (entry['color'].color_name, ', '.join(
+                '%s: %s' % (size.name, quantity) for size, quantity in entry['sizes']) or '-')
+            for entry in matrix.colors.values()
+        )
+        return format_html('<table>{}</table>', format_html_join(
+            '', '<tr><td>{}</td><td>{}</td></tr>', rows))
+
 
 class OrderItemInline(admin.TabularInline):
     model = OrderItem
@@ -65,14 +87,56 @@ class PaymentActionForm(forms.Form):
     action = forms.ChoiceField(choices=CHOICES, widget=forms.RadioSelect)
 
 
+class FulfilmentImportForm(forms.Form):
+    file = forms.FileField(label='CSV службы доставки')
+
+
 class OrderAdmin(admin.ModelAdmin):
     readonly_fields = ('order_number', 'user', 'created_at', 'amount')
     inlines = [OrderItemInline]  # Добавляем inlines
 
     list_display = ('order_number', 'user', 'created_at', 'status', 'amount')
 
+    def get_urls(self):
+        urls = [
+            path('import-fulfilment/', self.admin_site.admin_view(self.import_fulfilment_view),
+                 name='store_order_import_fulfilment'),
+        ]
+        return urls + super().get_urls()
+
+    def import_fulfilment_view(self, request):
+        # Массовое обновление доставки из CSV (store.fulfilment)
+        if not self.has_change_permission(request):
+            raise PermissionDenied
+        report = None
+        form = FulfilmentImportForm(request.POST or None, request.FILES or None)
+        if request.method == 'POST' and form.is_valid():
+            # Файл читается построчно, без загрузки целиком в память
+            lines = io.TextIOWrapper(form.cleaned_data['file'].file, encoding='utf-8-sig', newline='')
+            try:
+                report = import_fulfilment(lines)
+            except (UnicodeDecodeError, ValueError) as e:
+                form.add_error('file', str(e))
+            else:
+                self.message_user(request, str(report))
+        context = dict(
+            self.admin_site.each_context(request),
+            opts=self.model._meta,
+            title='Импорт из CSV службы доставки',
+            form=form,
+            report=report,
+        )
+        return TemplateResponse(request, 'admin/store/order/import_fulfilment.html', context)
+
 
 admin.site.register(Order, OrderAdmin)
 
 
+@admin.register(OutboundEmail)
+class OutboundEmailAdmin(admin.ModelAdmin):
+    list_display = ('subject', 'status', 'attempts', 'next_attempt_at', 'created_at', 'sent_at')
+    list_filter = ('status',)
+    readonly_fields = ('attempts', 'last_error', 'created_at', 'sent_at')
+
+
 admin.site.site_header = 'Администрирование сайта'
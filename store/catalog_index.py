@@ -0,0 +1,320 @@
+import json
+import mmap
+import os
+import string
+import struct
+from array import array
+from bisect import bisect_left
+
+from django.conf import settings
+from django.db import connection, transaction
+
+from . import list_cache
+from .models import Product, ProductColor, Category
+from .utils import DebouncedTask
+
+# Формат файла: заголовок, JSON со словарями значений, колонки
+# (id, цена, дата, просмотры) и битовые маски товаров для каждого значения
+# категории, меню, коллекции, цвета и размера. Строки отсортированы по id.
+# Файл отображается в память, колонки читаются без копирования.
+MAGIC = b'CAT1'
+HEADER = struct.Struct('<4sII')
+
+COLUMNS = (
+    ('id', 'q'),
+    ('price', 'd'),
+    ('date', 'd'),
+    ('views', 'q'),
+)
+BITSET_GROUPS = ('category', 'menu', 'collection', 'color', 'size')
+
+# Параметры запроса, которые индекс умеет обработать; с остальными — запрос в базу
+SUPPORTED_PARAMS = {'menu', 'size', 'color', 'category', 'collection',
+                    'min_price', 'max_price', 'ordering', 'page'}
+ORDERING_COLUMNS = {'price': 'price', 'date': 'date'}
+
+# SQLite LIKE (icontains) без учёта регистра сравнивает только латиницу:
+# «платье» не находит «Платье». Индекс сравнивает так же, как база
+ASCII_LOWER = str.maketrans(string.ascii_uppercase, string.ascii_lowercase)
+
+BIT_POSITIONS = tuple(
+    tuple(bit for bit in range(8) if byte & (1 << bit)) for byte in range(256)
+)
+
+
+def fold_case(value):
+    """Регистр как в icontains базы: SQLite — только ASCII, остальные — UPPER() для всего Unicode."""
+    if connection.vendor == 'sqlite':
+        return value.translate(ASCII_LOWER)
+    return value.upper()
+
+
+def get_index_path():
+    return os.path.join(settings.STORE_INDEX_DIR, 'catalog.idx')
+
+
+def build_catalog_index(path=None):
+    path = path or get_index_path()
+    rows = list(Product.objects.order_by('id').values_list(
+        'id', 'price', 'date', 'collection_id', 'views_count'))
+    positions = {row[0]: position for position, row in enumerate(rows)}
+    bitset_size = (len(rows) + 7) // 8
+    groups = {group: {} for group in BITSET_GROUPS}
+
+    def mark(group, key, product_id):
+        bitset = groups[group].get(key)
+        if bitset is None:
+            bitset = groups[group][key] = bytearray(bitset_size)
+        position = positions.get(product_id)
+        if position is not None:
+            bitset[position >> 3] |= 1 << (position & 7)
+
+    collection_names = dict(Product.objects.filter(collection__isnull=False).values_list(
+        'collection_id', 'collection__collection_name').distinct())
+    for product_id, _, _, collection_id, _ in rows:
+        if collection_id is not None:
+            mark('collection', (collection_id, collection_names[collection_id]), product_id)
+
+    category_names = dict(Category.objects.values_list('id', 'category_name'))
+    product_categories = list(Product.category.through.objects.values_list('product_id', 'category_id'))
+    for product_id, category_id in product_categories:
+        mark('category', (category_id, category_names[category_id]), product_id)
+
+    category_menus = {}
+    for category_id, menu_name in Category.menu_item.through.objects.values_list(
+            'category_id', 'menu__menu_name'):
+        category_menus.setdefault(category_id, []).append(menu_name)
+    for product_id, category_id in product_categories:
+        for menu_name in category_menus.get(category_id, ()):
+            mark('menu', menu_name, product_id)
+
+    for product_id, color_name, size_name in ProductColor.objects.values_list(
+            'product_id', 'color__color_name', 'size__name').distinct():
+        if color_name is not None:
+            mark('color', color_name, product_id)
+        if size_name is not None:
+            mark('size', size_name, product_id)
+
+    columns = {
+        'id': array('q', (row[0] for row in rows)),
+        'price': array('d', (float(row[1]) for row in rows)),
+        'date': array('d', (row[2].timestamp() if row[2] else float('-inf') for row in rows)),
+        'views': array('q', (row[4] for row in rows)),
+    }
+    meta = json.dumps({
+        group: list(groups[group]) for group in BITSET_GROUPS
+    }, ensure_ascii=False).encode()
+
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = '%s.%d.tmp' % (path, os.getpid())
+    with open(tmp_path, 'wb') as f:
+        f.write(HEADER.pack(MAGIC, len(rows), len(meta)))
+        f.write(meta)
+        for name, _ in COLUMNS:
+            columns[name].tofile(f)
+        for group in BITSET_GROUPS:
+            for bitset in groups[group].values():
+                f.write(bitset)
+    os.replace(tmp_path, path)
+    return len(rows)
+
+
+def column_offsets(count, meta_size):
+    offsets = {}
+    offset = HEADER.size + meta_size
+    for name, typecode in COLUMNS:
+        offsets[name] = offset
+        offset += array(typecode).itemsize * count
+    return offsets
+
+
+def update_views(views_counts):
+    """
+    Записывает {id товара: просмотры} в колонку views файла индекса на месте,
+    без пересборки. Процессы, отобразившие файл, видят новые значения сразу.
+    """
+    try:
+        f = open(get_index_path(), 'r+b')
+    except FileNotFoundError:
+        return 0
+    updated = 0
+    with f, mmap.mmap(f.fileno(), 0) as data:
+        magic, count, meta_size = HEADER.unpack_from(data)
+        if magic != MAGIC:
+            return 0
+        offsets = column_offsets(count, meta_size)
+        with memoryview(data) as view:
+            ids = view[offsets['id']:offsets['id'] + 8 * count].cast('q')
+            views = view[offsets['views']:offsets['views'] + 8 * count].cast('q')
+            try:
+                for product_id, views_count in views_counts.items():
+                    # Строки отсортированы по id
+                    position = bisect_left(ids, product_id)
+                    if position < count and ids[position] == product_id:
+                        views[position] = views_count
+                        updated += 1
+            finally:
+                ids.release()
+                views.release()
+    return updated
+
+
+class CatalogIndex:
+    def __init__(self, path):
+        with open(path, 'rb') as f:
+            self._data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, count, meta_size = HEADER.unpack_from(self._data)
+        if magic != MAGIC:
+            raise ValueError('Неизвестный формат индекса каталога: %s' % path)
+        self.count = count
+        view = memoryview(self._data)
+        offset = HEADER.size
+        meta = json.loads(bytes(view[offset:offset + meta_size]))
+        offset += meta_size
+
+        self.columns = {}
+        for name, typecode in COLUMNS:
+            size = array(typecode).itemsize * count
+            self.columns[name] = view[offset:offset + size].cast(typecode)
+            offset += size
+
+        self._bitset_size = (count + 7) // 8
+        self._bitset_offsets = {}
+        for group in BITSET_GROUPS:
+            offsets = self._bitset_offsets[group] = {}
+            for key in meta[group]:
+                offsets[tuple(key) if isinstance(key, list) else key] = offset
+                offset += self._bitset_size
+        self._view = view
+        self._bitsets = {}
+        self.all = (1 << count) - 1
+
+    def bitset(self, offset):
+        bitset = self._bitsets.get(offset)
+        if bitset is None:
+            bitset = self._bitsets[offset] = int.from_bytes(
+                self._view[offset:offset + self._bitset_size], 'little')
+        return bitset
+
+    def exact(self, group, value):
+        offset = self._bitset_offsets[group].get(value)
+        return 0 if offset is None else self.bitset(offset)
+
+    def icontains(self, group, value):
+        value = fold_case(value)
+        mask = 0
+        for (_, name), offset in self._bitset_offsets[group].items():
+            if value in fold_case(name or ''):
+                mask |= self.bitset(offset)
+        return mask
+
+    def positions(self, mask):
+        data = mask.to_bytes(self._bitset_size, 'little')
+        return [
+            byte_index * 8 + bit
+            for byte_index, byte in enumerate(data) if byte
+            for bit in BIT_POSITIONS[byte]
+        ]
+
+    def resolve(self, params):
+        """
+        Повторяет ProductViewSet.get_queryset + ProductFilter + OrderingFilter
+        и возвращает отсортированный список id товаров.
+        """
+        mask = self.all
+        if params.get('menu'):
+            mask &= self.exact('menu', params['menu'])
+        if params.get('size'):
+            mask &= self.exact('size', params['size'])
+        if params.get('color'):
+            mask &= self.exact('color', params['color'])
+        if params.get('category'):
+            mask &= self.icontains('category', params['category'])
+        if params.get('collection'):
+            mask &= self.icontains('collection', params['collection'])
+        positions = self.positions(mask)
+
+        price = self.columns['price']
+        min_price, max_price = params.get('min_price'), params.get('max_price')
+        ordering = []
+        if min_price is not None:
+            positions = [position for position in positions if price[position] >= float(min_price)]
+            ordering = ['price']
+        if max_price is not None:
+            positions = [position for position in positions if price[position] <= float(max_price)]
+            ordering = ['price'] if min_price is not None else ['-price']
+
+        ordering_param = params.get('ordering')
+        if ordering_param == 'views_count':
+            ordering = ['-views']
+        elif ordering_param:
+            fields = [field.strip() for field in ordering_param.split(',')]
+            fields = [field for field in fields if field.lstrip('-') in ORDERING_COLUMNS]
+            if fields:
+                ordering = fields
+
+        if ordering:
+            sort_columns = [
+                (self.columns[ORDERING_COLUMNS.get(field.lstrip('-'), field.lstrip('-'))],
+                 -1 if field.startswith('-') else 1)
+                for field in ordering
+            ]
+            # Позиция в файле совпадает с порядком id — сортировка стабильна по id
+            positions.sort(key=lambda position: tuple(
+                direction * column[position] for column, direction in sort_columns))
+
+        ids = self.columns['id']
+        return [ids[position] for position in positions]
+
+
+_index = None
+_index_stat = None
+
+def rebuild_catalog_index():
+    # Теги кэша списка, сброшенные до начала сборки: пока она шла, их страницы
+    # могли закэшироваться из старого индекса
+    tags = list_cache.pop_index_rebuild_tags()
+    try:
+        return build_catalog_index()
+    finally:
+        list_cache.invalidate_tags(tags)
+
+
+rebuild_task = DebouncedTask(rebuild_catalog_index)
+
+
+def get_index():
+    global _index, _index_stat
+    path = get_index_path()
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        rebuild_task.schedule()
+        return None
+    # Пересборка заменяет файл (новый inode); update_views меняет его на месте,
+    # и отображение в памяти уже содержит новые значения
+    if _index is None or _index_stat != stat.st_ino:
+        _index = CatalogIndex(path)
+        _index_stat = stat.st_ino
+    return _index
+
+
+def resolve_product_ids(query_params):
+    """Список id товаров по параметрам запроса или None, если нужен запрос в базу."""
+    if not set(query_params) <= SUPPORTED_PARAMS:
+        return None
+    params = {key: query_params.get(key) for key in query_params}
+    for key in ('min_price', 'max_price'):
+        if params.get(key) is not None:
+            try:
+                float(params[key])
+            except ValueError:
+                return None
+    index = get_index()
+    if index is None:
+        return None
+    return index.resolve(params)
+
+
+def schedule_rebuild():
+    transaction.on_commit(rebuild_task.schedule)
@@ -0,0 +1,114 @@
+from django.db import transaction
+
+from .models import Order, OrderItem, Product, Color, Size
+
+# Оформление заказа фиксированным числом запросов при любом размере корзины:
+# товары, цвета и размеры загружаются одним запросом каждый, позиции и их
+# связи с цветами/размерами создаются через bulk_create, всё в одной транзакции.
+# Цена берётся из базы, цена из запроса клиента игнорируется.
+
+CLIENT_FIELDS = (
+    'first_name', 'last_name', 'email', 'phone', 'city', 'delivery_method', 'street',
+    'house', 'apartment_office', 'postal_code', 'courier_comment',
+)
+
+
+class CheckoutError(Exception):
+    pass
+
+
+def _positive_int(value):
+    if isinstance(value, bool):
+        return None
+    try:
+        value = int(value)
+    except (TypeError, ValueError):
+        return None
+    return value if value > 0 else None
+
+
+def _optional_id(value):
+    if value in (None, '', 0):
+        return None
+    value = _positive_int(value)
+    if value is None:
+        raise CheckoutError("Некорректные данные продукта")
+    return value
+
+
+def parse_lines(product_data_list):
+    """Позиции корзины: [{'product_id', 'quantity', 'color_id', 'size_id'}]."""
+    if not isinstance(product_data_list, list):
+        raise CheckoutError("Некорректные данные продукта")
+    lines = []
+    for product_data in product_data_list:
+        if not isinstance(product_data, dict):
+            raise CheckoutError("Некорректные данные продукта")
+        product_id = _positive_int(product_data.get("product_id"))
+        quantity = _positive_int(product_data.get("quantity"))
+        if product_id is None or quantity is None:
+            raise CheckoutError("Некорректные данные продукта")
+        lines.append({
+            'product_id': product_id,
+            'quantity': quantity,
+            'color_id': _optional_id(product_data.get("color_id")),
+            'size_id': _optional_id(product_data.get("size_id")),
+        })
+    return lines
+
+
+def _load(model, ids, message):
+    objects = model.objects.in_bulk(set(ids))
+    for pk in ids:
+        if pk not in objects:
+            raise CheckoutError(message.format(pk))
+    return objects
+
+
+def get_unpaid_order(order_number, user_profile=None):
+    """Неоплаченный заказ для повторной попытки оплаты после ошибки платёжного сервиса."""
+    order = Order.objects.filter(order_number=str(order_number), status='created').first()
+    if order is None or (order.user_id is not None and (
+            user_profile is None or order.user_id != user_profile.pk)):
+        raise CheckoutError("Заказ {} не найден или уже оплачен".format(order_number))
+    return order
+
+
+def create_order(lines, client_data, order_number, user_profile=None):
+    """Создаёт заказ с позициями; сумма считается по ценам товаров в базе."""
+    with transaction.atomic():
+        products = _load(Product, [line['product_id'] for line in lines],
+                         "Продукт с ID {} не найден")
+        colors = _load(Color, [line['color_id'] for line in lines if line['color_id']],
+                       "Цвет с ID {} не найден")
+        sizes = _load(Size, [line['size_id'] for line in lines if line['size_id']],
+                      "Размер с ID {} не найден")
+
+        total_amount = sum(
+            (products[line['product_id']].price * line['quantity'] for line in lines), 0)
+
+        order = Order.objects.create(
+            user=user_profile,
+            status='created',
+            amount=total_amount,
+            order_number=order_number,
+            **{field: client_data.get(field) for field in CLIENT_FIELDS}
+        )
+
+        order_items = OrderItem.objects.bulk_create([
+            OrderItem(order=order, product=products[line['product_id']], quantity=line['quantity'])
+            for line in lines
+        ])
+        if any(item.pk is None for item in order_items):
+            # База без RETURNING в bulk_create — ключи читаются отдельно
+            order_items = list(order.order_items.order_by('pk'))
+
+        OrderItem.colors.through.objects.bulk_create([
+            OrderItem.colors.through(orderitem_id=item.pk, color_id=line['color_id'])
+            for item, line in zip(order_items, lines) if line['color_id']
+        ])
+        OrderItem.sizes.through.objects.bulk_create([
+            OrderItem.sizes.through(orderitem_id=item.pk, size_id=line['size_id'])
+            for item, line in zip(order_items, lines) if line['size_id']
+        ])
+    return order
@@ -0,0 +1,88 @@
+import copy
+
+from django.db.models import Count
+from rest_framework.request import Request
+
+from .models import Product, ProductColor
+
+# Фасет -> параметр запроса, который он не учитывает при подсчёте
+FACET_PARAMS = {
+    'sizes': 'size',
+    'colors': 'color',
+    'categories': 'category',
+    'collections': 'collection',
+}
+
+
+def request_without_param(request, param):
+    params = request.query_params.copy()
+    params.pop(param, None)
+    django_request = copy.copy(request._request)
+    django_request.GET = params
+    return Request(django_request)
+
+
+def _product_ids(queryset):
+    return queryset.order_by().values('pk')
+
+
+def size_counts(queryset):
+    rows = ProductColor.objects.filter(
+        product__in=_product_ids(queryset), size__isnull=False,
+    ).values('size_id', 'size__name').annotate(
+        count=Count('product', distinct=True)).order_by('size_id')
+    return [{'id': row['size_id'], 'name': row['size__name'], 'count': row['count']} for row in rows]
+
+
+def color_counts(queryset):
+    rows = ProductColor.objects.filter(product__in=_product_ids(queryset)).values(
+        'color_id', 'color__color_name', 'color__color_hex',
+    ).annotate(count=Count('product', distinct=True)).order_by('color_id')
+    return [
+        {'id': row['color_id'], 'color_name': row['color__color_name'],
+         'color_hex': row['color__color_hex'], 'count': row['count']}
+        for row in rows
+    ]
+
+
+def category_counts(queryset):
+    rows = Product.category.through.objects.filter(product__in=_product_ids(queryset)).values(
+        'category_id', 'category__category_name',
+    ).annotate(count=Count('product', distinct=True)).order_by('category_id')
+    return [
+        {'id': row['category_id'], 'category_name': row['category__category_name'], 'count': row['count']}
+        for row in rows
+    ]
+
+
+def collection_counts(queryset):
+    rows = Product.objects.filter(pk__in=_product_ids(queryset), collection__isnull=False).values(
+        'collection_id', 'collection__collection_name',
+    ).annotate(count=Count('id')).order_by('collection_id')
+    return [
+        {'id': row['collection_id'], 'collection_name': row['collection__collection_name'],
+         'count': row['count']}
+        for row in rows
+    ]
+
+
+FACET_COUNTERS = {
+    'sizes': size_counts,
+    'colors': color_counts,
+    'categories': category_counts,
+    'collections': collection_counts,
+}
+
+
+def get_facets(view, request):
+    """
+    Количество товаров по каждому значению фасета при текущих фильтрах.
+    Фильтр самого фасета при подсчёте не применяется, поэтому можно
+    выбрать другое значение. Один GROUP BY запрос на фасет.
+    """
+    facets = {}
+    for facet, param in FACET_PARAMS.items():
+        facet_request = request_without_param(request, param)
+        queryset = view.get_filtered_queryset(facet_request)
+        facets[facet] = FACET_COUNTERS[facet](queryset)
+    return facets
@@ -0,0 +1,149 @@
+import csv
+from dataclasses import dataclass, field
+from datetime import datetime
+from itertools import islice
+
+from django.core.exceptions import ValidationError
+from django.core.validators import URLValidator
+from django.db import transaction
+
+from . import mail_queue, tracking
+from .models import Order
+
+# Массовое обновление заказов из CSV службы доставки. Файл читается потоком,
+# пачками по CHUNK_SIZE строк: одна выборка заказов по номерам и один
+# bulk_update на пачку. Письма покупателям ставятся в очередь одной вставкой
+# на пачку (mail_queue.batch), отправляет их send_queued_emails.
+CHUNK_SIZE = 1000
+KEY_COLUMN = 'order_number'
+FIELDS = ('delivery_date', 'track_number', 'website_url', 'status')
+DATE_FORMATS = ('%Y-%m-%d', '%d.%m.%Y', '%d/%m/%Y')
+MAX_ERRORS = 100
+
+STATUS_VALUES = {}
+for value, label in Order.CHOICES_ORDER:
+    STATUS_VALUES[value.lower()] = value
+    STATUS_VALUES[label.strip().lower()] = value
+
+_validate_url = URLValidator()
+
+
+@dataclass
+class ImportReport:
+    rows: int = 0
+    matched: int = 0
+    changed: int = 0
+    rejected: int = 0
+    errors: list = field(default_factory=list)
+
+    def reject(self, line, message):
+        self.rejected += 1
+        if len(self.errors) < MAX_ERRORS:
+            self.errors.append((line, message))
+
+    def __str__(self):
+        return (f'Строк: {self.rows}, найдено заказов: {self.matched}, '
+                f'изменено: {self.changed}, отклонено: {self.rejected}')
+
+
+def _parse_date(value):
+    for date_format in DATE_FORMATS:
+        try:
+            return datetime.strptime(value, date_format).date()
+        except ValueError:
+            pass
+    raise ValueError(f'некорректная дата "{value}"')
+
+
+def parse_row(row):
+    """Значения для обновления из строки CSV; пустая ячейка — без изменений."""
+    values = {}
+    for name in FIELDS:
+        value = (row.get(name) or '').strip()
+        if not value:
+            continue
+        if name == 'delivery_date':
+            value = _parse_date(value)
+        elif name == 'status':
+            if value.lower() not in STATUS_VALUES:
+                raise ValueError(f'неизвестный статус "{value}"')
+            value = STATUS_VALUES[value.lower()]
+        elif name == 'website_url':
+            if len(value) > Order._meta.get_field('website_url').max_length:
+                raise ValueError('слишком длинная ссылка')
+            try:
+                _validate_url(value)
+            except ValidationError:
+                raise ValueError(f'некорректная ссылка "{value}"')
+        elif name == 'track_number' and len(value) > Order._meta.get_field('track_number').max_length:
+            raise ValueError('слишком длинный трек-номер')
+        values[name] = value
+    return values
+
+
+def open_reader(lines):
+    """csv.DictReader с определением разделителя (',', ';' или табуляция)."""
+    lines = iter(lines)
+    header = next(lines, '')
+    try:
+        dialect = csv.Sniffer().sniff(header, delimiters=',;\t')
+    except csv.Error:
+        dialect = csv.excel
+    reader = csv.DictReader(lines, fieldnames=next(csv.reader([header], dialect)), dialect=dialect)
+    reader.fieldnames = [name.strip().lower() for name in reader.fieldnames]
+    if KEY_COLUMN not in reader.fieldnames:
+        raise ValueError(f'В файле нет колонки {KEY_COLUMN}')
+    if not set(FIELDS) & set(reader.fieldnames):
+        raise ValueError('В файле нет ни одной колонки из: ' + ', '.join(FIELDS))
+    return reader
+
+
+def apply_chunk(rows, report):
+    """rows — [(номер строки, строка CSV)]."""
+    updates = {}
+    for line, row in rows:
+        report.rows += 1
+        order_number = (row.get(KEY_COLUMN) or '').strip()
+        if not order_number:
+            report.reject(line, 'не указан номер заказа')
+            continue
+        try:
+            values = parse_row(row)
+        except ValueError as e:
+            report.reject(line, str(e))
+            continue
+        # Повтор номера в файле: применяются все строки по порядку
+        updates.setdefault(order_number, []).append((line, values))
+
+    orders = Order.objects.in_bulk(list(updates), field_name='order_number')
+    changed = []
+    for order_number, order_updates in updates.items():
+        order = orders.get(order_number)
+        if order is None:
+            for line, _ in order_updates:
+                report.reject(line, f'заказ {order_number} не найден')
+            continue
+        report.matched += len(order_updates)
+        for _, values in order_updates:
+            for name, value in values.items():
+                setattr(order, name, value)
+        if order.changed_fields & set(FIELDS):
+            changed.append(order)
+
+    if changed:
+        with transaction.atomic(), mail_queue.batch():
+            tracking.bulk_update(changed, list(FIELDS))
+    report.changed += len(changed)
+
+
+def import_fulfilment(lines, chunk_size=CHUNK_SIZE):
+    """Применяет CSV (итератор строк) к заказам и возвращает ImportReport."""
+    reader = open_reader(lines)
+    report = ImportReport()
+    # Номер строки файла с учётом заголовка
+    numbered = ((reader.line_num + 1, row) for row in reader)
+    while True:
+        chunk = list(islice(numbered, chunk_size))
+        if not chunk:
+            return report
+        apply_chunk(chunk, report)
@@ -0,0 +1,100 @@
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import F, Window
+from django.db.models.functions import RowNumber
+
+from .models import Product
+from .projections import CategoryProjection, CollectionNameProjection, ProductNameProjection
+from .versions import bump_versions, get_versions
+
+HOME_PAGE_CACHE_KEY = 'store:home_page'
+# Поколение снимка — строка CatalogVersion: кэш по умолчанию у каждого
+# процесса свой, а версия в базе общая для всех
+HOME_PAGE_VERSION_KEY = 'store:home_page'
+
+CATEGORIES_COUNT = 8
+PRODUCTS_PER_CATEGORY = 4
+COLLECTIONS_COUNT = 5
+COLLECTIONS_WITH_PRODUCTS_COUNT = 4
+PRODUCTS_PER_COLLECTION = 2
+
+
+def _top_products(queryset, partition_field, order_field, limit):
+    # N последних записей в каждой группе одним запросом (ROW_NUMBER() OVER PARTITION BY)
+    return queryset.annotate(
+        rank=Window(RowNumber(), partition_by=F(partition_field),
+                    order_by=F(order_field).desc())
+    ).filter(rank__lte=limit)
+
+
+def build_home_page(request):
+    context = {'request': request}
+
+    all_collections_data = CollectionNameProjection(context).serialize_queryset()
+    collections_data_by_id = {item['id']: item for item in all_collections_data}
+    latest_collection_ids = sorted(collections_data_by_id, reverse=True)
+
+    categories_data_list = CategoryProjection().serialize(CategoryProjection().rows()[:CATEGORIES_COUNT])
+    category_rows = list(_top_products(
+        Product.category.through.objects.filter(
+            category_id__in=[category['id'] for category in categories_data_list]),
+        'category_id', 'product_id', PRODUCTS_PER_CATEGORY,
+    ).values_list('category_id', 'product_id'))
+
+    collection_ids = latest_collection_ids[:COLLECTIONS_WITH_PRODUCTS_COUNT]
+    collection_rows = list(_top_products(
+        Product.objects.filter(collection_id__in=collection_ids),
+        'collection_id', 'id', PRODUCTS_PER_COLLECTION,
+    ).values_list('collection_id', 'id'))
+
+    product_ids = {product_id for _, product_id in category_rows + collection_rows}
+    products_data = {
+        item['id']: item
+        for item in ProductNameProjection(context).serialize_ids(sorted(product_ids))
+    }
+
+    def serialize_products(ids):
+        return [products_data[product_id] for product_id in sorted(ids, reverse=True)
+                if product_id in products_data]
+
+    categories_data = []
+    for category in categories_data_list:
+        categories_data.append({
+            'category': category,
+            'products': serialize_products(
+                product_id for category_id, product_id in category_rows if category_id == category['id']),
+        })
+
+    collections_data = []
+    for collection_id in collection_ids:
+        collections_data.append({
+            'collection': collections_data_by_id[collection_id],
+            'products': serialize_products(
+                product_id for row_collection_id, product_id in collection_rows
+                if row_collection_id == collection_id),
+        })
+
+    return {
+        'all_collections': all_collections_data,
+        'collections': [collections_data_by_id[collection_id]
+                        for collection_id in latest_collection_ids[:COLLECTIONS_COUNT]],
+        'categories': categories_data,
+        'collections_with_products': collections_data,
+    }
+
+
+def get_home_page(request):
+    # Снимок хранится отдельно для каждого хоста: в нём абсолютные ссылки на изображения
+    generation, _ = get_versions([HOME_PAGE_VERSION_KEY]).get(HOME_PAGE_VERSION_KEY, (0, None))
+    key = '%s:%s:%s' % (HOME_PAGE_CACHE_KEY, generation, request.build_absolute_uri('/'))
+    data = cache.get(key)
+    if data is None:
+        data = build_home_page(request)
+        cache.set(key, data, None)
+    return data
+
+
+def invalidate_home_page():
+    # После коммита: иначе запрос в другом процессе собрал бы снимок из
+    # старых данных уже под новым поколением
+    transaction.on_commit(lambda: bump_versions([HOME_PAGE_VERSION_KEY]))
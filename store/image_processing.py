@@ -0,0 +1,78 @@
+import base64
+import io
+
+from colorthief import ColorThief
+from PIL import Image, ImageFilter, ImageOps
+
+# Функции выполняются в процессах пула, поэтому модуль не импортирует Django:
+# на вход и на выход передаются только байты и простые типы.
+
+PIL_FORMATS = {
+    'jpeg': 'JPEG',
+    'webp': 'WEBP',
+}
+
+
+def _encode(image, image_format, quality):
+    buffer = io.BytesIO()
+    if image_format == 'jpeg':
+        if image.mode != 'RGB':
+            # JPEG без прозрачности — подкладываем белый фон
+            background = Image.new('RGB', image.size, (255, 255, 255))
+            background.paste(image, mask=image.getchannel('A') if 'A' in image.getbands() else None)
+            image = background
+        image.save(buffer, PIL_FORMATS[image_format], quality=quality, optimize=True, progressive=True)
+    else:
+        image.save(buffer, PIL_FORMATS[image_format], quality=quality, method=4)
+    return buffer.getvalue()
+
+
+def render_renditions(data, widths, formats, quality):
+    """
+    Уменьшенные копии изображения фиксированной ширины.
+    Ширины не больше исходной пропускаются (без увеличения).
+    Возвращает {'width', 'height', 'files': {формат: {ширина: байты}}}.
+    """
+    with Image.open(io.BytesIO(data)) as source:
+        image = ImageOps.exif_transpose(source)
+        if image.mode not in ('RGB', 'RGBA'):
+            image = image.convert('RGBA' if 'transparency' in image.info or 'A' in image.getbands() else 'RGB')
+        width, height = image.size
+        files = {image_format: {} for image_format in formats}
+        for target_width in sorted(widths):
+            if target_width >= width:
+                continue
+            target_height = max(1, round(height * target_width / width))
+            resized = image.resize((target_width, target_height), Image.LANCZOS)
+            for image_format in formats:
+                files[image_format][target_width] = _encode(resized, image_format, quality)
+    return {'width': width, 'height': height, 'files': files}
+
+
+def render_placeholder(data, width, quality):
+    """
+    Основной цвет (colorthief) и крошечное размытое превью в виде data URI.
+    Возвращает ('#rrggbb', 'data:image/webp;base64,...').
+    """
+    with Image.open(io.BytesIO(data)) as source:
+        image = ImageOps.exif_transpose(source)
+        if image.mode != 'RGB':
+            image = image.convert('RGBA')
+            background = Image.new('RGB', image.size, (255, 255, 255))
+            background.paste(image, mask=image.getchannel('A'))
+            image = background
+        # Цвет считается по уменьшенной копии: почти тот же результат, но быстрее
+        sample = image.copy()
+        sample.thumbnail((150, 150))
+        buffer = io.BytesIO()
+        sample.save(buffer, 'PNG')
+        buffer.seek(0)
+        red, green, blue = ColorThief(buffer).get_color(quality=1)
+
+        height = max(1, round(image.height * width / image.width))
+        preview = image.resize((width, height), Image.BILINEAR).filter(ImageFilter.GaussianBlur(1))
+        buffer = io.BytesIO()
+        # WebP без служебных таблиц JPEG: превью 16px занимает ~100 байт
+        preview.save(buffer, 'WEBP', quality=quality)
+    placeholder = 'data:image/webp;base64,' + base64.b64encode(buffer.getvalue()).decode()
+    return '#%02x%02x%02x' % (red, green, blue), placeholder
@@ -0,0 +1,16 @@
+from . import home, list_cache
+from .models import ProductImage, ProductColor
+from .versions import bump_versions, version_key
+
+
+def images_changed(model, images):
+    """
+    Сброс кэшей после bulk_update изображений: массовое обновление
+    не отправляет сигналы, которые сделал бы save().
+    """
+    bump_versions([version_key(model)])
+    home.invalidate_home_page()
+    if model is ProductImage:
+        product_ids = ProductColor.images.through.objects.filter(
+            productimage__in=images).values_list('productcolor__product_id', flat=True)
+        list_cache.schedule_invalidation(f'product:{product_id}' for product_id in product_ids)
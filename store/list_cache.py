@@ -0,0 +1,200 @@
+import hashlib
+import json
+import threading
+import time
+
+from django.core.cache import caches
+from django.db import transaction
+
+from .models import Product, ProductColor, Category, Collection
+
+# Кэш ответов ProductViewSet.list. Запись хранит данные ответа и версии
+# своих тегов; запись действительна, пока версии всех тегов не изменились.
+# Теги страницы:
+#   catalog          — любая правка справочников (категории, меню, цвета...)
+#   products         — любая правка товара (страницы без фильтров по значению)
+#   menu:<название>, size:<название>, color:<название>,
+#   category:<id>, collection:<id> — правка товара с этим значением
+#   product:<id>     — товар на странице (картинки и т.п.)
+#   views            — сортировка по просмотрам
+CACHE_ALIAS = 'product_list'
+KEY_PREFIX = 'store:product_list'
+HITS_KEY = f'{KEY_PREFIX}:stats:hits'
+MISSES_KEY = f'{KEY_PREFIX}:stats:misses'
+
+EXACT_FILTERS = ('menu', 'size', 'color')
+CONTAINS_FILTERS = {
+    'category': (Category, 'category_name'),
+    'collection': (Collection, 'collection_name'),
+}
+
+
+def get_cache():
+    return caches[CACHE_ALIAS]
+
+
+def _hash(value):
+    return hashlib.md5(json.dumps(value, ensure_ascii=False).encode()).hexdigest()
+
+
+def tag_key(tag):
+    return f'{KEY_PREFIX}:tag:{_hash(tag)}'
+
+
+def page_key(request):
+    # Порядок параметров и ?page=1 не влияют на ответ
+    params = sorted(
+        (key, values) for key, values in request.query_params.lists()
+        if not (key == 'page' and values == ['1'])
+    )
+    # Ссылки next/previous и адреса картинок абсолютные
+    return f'{KEY_PREFIX}:page:{_hash([request.scheme, request.get_host(), params])}'
+
+
+def request_tags(request):
+    params = request.query_params
+    tags = {'catalog'}
+    narrowed = False
+    for param in EXACT_FILTERS:
+        value = params.get(param)
+        if value:
+            tags.add(f'{param}:{value.lower()}')
+            narrowed = True
+    for param, (model, field_name) in CONTAINS_FILTERS.items():
+        value = params.get(param)
+        if value:
+            ids = model.objects.filter(**{f'{field_name}__icontains': value}).values_list('id', flat=True)
+            tags.update(f'{param}:{object_id}' for object_id in ids)
+            narrowed = True
+    if not narrowed:
+        tags.add('products')
+    if params.get('ordering') == 'views_count':
+        tags.add('views')
+    return tags
+
+
+def product_tags(product_ids):
+    """Теги всех страниц, на которые может попасть каждый из товаров."""
+    product_ids = [product_id for product_id in product_ids if product_id is not None]
+    if not product_ids:
+        return set()
+    tags = {'products'}
+    for product_id, collection_id in Product.objects.filter(pk__in=product_ids).values_list(
+            'id', 'collection_id'):
+        tags.add(f'product:{product_id}')
+        if collection_id is not None:
+            tags.add(f'collection:{collection_id}')
+    for category_id, menu_name in Product.category.through.objects.filter(
+            product_id__in=product_ids).values_list('category_id', 'category__menu_item__menu_name'):
+        tags.add(f'category:{category_id}')
+        if menu_name:
+            tags.add(f'menu:{menu_name.lower()}')
+    for color_name, size_name in ProductColor.objects.filter(product_id__in=product_ids).values_list(
+            'color__color_name', 'size__name').distinct():
+        if color_name:
+            tags.add(f'color:{color_name.lower()}')
+        if size_name:
+            tags.add(f'size:{size_name.lower()}')
+    return tags
+
+
+def get_tag_versions(tags):
+    cache = get_cache()
+    keys = {tag_key(tag): tag for tag in tags}
+    versions = cache.get_many(keys)
+    missing = [key for key in keys if key not in versions]
+    if missing:
+        for key in missing:
+            cache.add(key, time.time_ns(), None)
+        versions.update(cache.get_many(missing))
+    return {keys[key]: version for key, version in versions.items()}
+
+
+def invalidate_tags(tags):
+    if tags:
+        version = time.time_ns()
+        get_cache().set_many({tag_key(tag): version for tag in tags}, None)
+
+
+# Теги, которые сбрасываются ещё раз после пересборки индекса каталога
+_rebuild_tags = set()
+_rebuild_lock = threading.Lock()
+
+
+def invalidate_after_index_rebuild(tags):
+    """
+    Страницы, отфильтрованные по индексу каталога (store.catalog_index),
+    до его пересборки в фоне содержат старые данные, но закэшировались бы
+    уже под новыми версиями тегов. Эти теги сбрасываются повторно,
+    когда пересборка закончится.
+    """
+    with _rebuild_lock:
+        _rebuild_tags.update(tags)
+
+
+def pop_index_rebuild_tags():
+    with _rebuild_lock:
+        tags = set(_rebuild_tags)
+        _rebuild_tags.clear()
+    return tags
+
+
+def _invalidate_now_and_after_rebuild(tags):
+    invalidate_tags(tags)
+    invalidate_after_index_rebuild(tags)
+
+
+def schedule_invalidation(tags):
+    # Сброс после коммита, чтобы другой запрос не закэшировал старые данные
+    tags = set(tags)
+    if tags:
+        transaction.on_commit(lambda: _invalidate_now_and_after_rebuild(tags))
+
+
+def _record(stat_key):
+    cache = get_cache()
+    cache.add(stat_key, 0, None)
+    try:
+        cache.incr(stat_key)
+    except ValueError:
+        pass
+
+
+def get_page(request):
+    """Данные закэшированного ответа или None."""
+    entry = get_cache().get(page_key(request))
+    if entry is not None:
+        tags = entry['tags']
+        versions = get_cache().get_many([tag_key(tag) for tag in tags])
+        if all(versions.get(tag_key(tag)) == version for tag, version in tags.items()):
+            _record(HITS_KEY)
+            return entry['data']
+    _record(MISSES_KEY)
+    return None
+
+
+def set_page(request, data, scope_versions):
+    """
+    scope_versions — версии тегов запроса, полученные до выборки данных:
+    правка во время выборки сделает запись недействительной.
+    """
+    product_ids = [item['id'] for item in data.get('results', ()) if 'id' in item]
+    tags = dict(scope_versions)
+    tags.update(get_tag_versions(f'product:{product_id}' for product_id in product_ids))
+    get_cache().set(page_key(request), {'tags': tags, 'data': data})
+
+
+def get_stats():
+    cache = get_cache()
+    stats = cache.get_many([HITS_KEY, MISSES_KEY])
+    hits, misses = stats.get(HITS_KEY, 0), stats.get(MISSES_KEY, 0)
+    total = hits + misses
+    return {
+        'hits': hits,
+        'misses': misses,
+        'hit_ratio': hits / total if total else 0.0,
+    }
+
+
+def reset_stats():
+    get_cache().delete_many([HITS_KEY, MISSES_KEY])
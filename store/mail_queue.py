@@ -0,0 +1,190 @@
+import logging
+import os
+import threading
+from contextlib import contextmanager
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.mail import EmailMultiAlternatives, get_connection
+from django.db import transaction
+from django.db.models import prefetch_related_objects
+from django.template.loader import get_template
+from django.template.utils import get_app_template_dirs
+from django.utils import timezone
+
+from .models import OutboundEmail
+
+logger = logging.getLogger(__name__)
+
+# Письма не отправляются в запросе и в Order.save(): они сохраняются в
+# OutboundEmail в той же транзакции, что и заказ, а команда send_queued_emails
+# отправляет их пачками через одно SMTP-соединение. Неудачные попытки
+# повторяются с экспоненциальной задержкой.
+EMAIL_TEMPLATES_DIR = 'email_templates'
+BATCH_SIZE = 50
+MAX_ATTEMPTS = 6
+RETRY_BASE_DELAY = 60
+RETRY_MAX_DELAY = 6 * 60 * 60
+# Взятые в работу письма не видны другим обработчикам это время
+CLAIM_TIMEOUT = 10 * 60
+
+
+_local = threading.local()
+
+
+def enqueue(subject, message, recipient_list, from_email=None, html_template='', order=None):
+    recipients = [recipient for recipient in recipient_list if recipient]
+    if not recipients:
+        return None
+    email = OutboundEmail(
+        subject=subject[:255],
+        body=message,
+        html_template=html_template,
+        order=order,
+        from_email=from_email or settings.DEFAULT_FROM_EMAIL,
+        recipients=recipients,
+    )
+    pending = getattr(_local, 'pending', None)
+    if pending is not None:
+        pending.append(email)
+    else:
+        email.save()
+    return email
+
+
+@contextmanager
+def batch():
+    """Письма, поставленные внутри блока, сохраняются одним bulk_create в конце."""
+    if getattr(_local, 'pending', None) is not None:
+        # Вложенный блок — сохранит внешний
+        yield
+        return
+    _local.pending = []
+    try:
+        yield
+        OutboundEmail.objects.bulk_create(_local.pending)
+    finally:
+        _local.pending = None
+
+
+_templates = {}
+
+
+def email_template(name):
+    template = _templates.get(name)
+    if template is None:
+        template = _templates[name] = get_template(name)
+    return template
+
+
+def precompile_templates():
+    """Загружает и компилирует все шаблоны email_templates один раз на процесс."""
+    directories = [str(directory) for engine in settings.TEMPLATES for directory in engine.get('DIRS', [])]
+    directories += [str(directory) for directory in get_app_template_dirs('templates')]
+    names = set()
+    for directory in directories:
+        root = os.path.join(directory, EMAIL_TEMPLATES_DIR)
+        for current, _, files in os.walk(root):
+            for filename in files:
+                path = os.path.relpath(os.path.join(current, filename), directory)
+                names.add(path.replace(os.sep, '/'))
+    for name in sorted(names):
+        email_template(name)
+    return sorted(names)
+
+
+def retry_delay(attempts):
+    return timedelta(seconds=min(RETRY_MAX_DELAY, RETRY_BASE_DELAY * 2 ** (attempts - 1)))
+
+
+def claim_batch(batch_size=BATCH_SIZE):
+    """
+    Письма, которые пора отправлять. Время следующей попытки сдвигается на
+    CLAIM_TIMEOUT, чтобы параллельный обработчик их не взял, а письма упавшего
+    обработчика вернулись в очередь.
+    """
+    now = timezone.now()
+    with transaction.atomic():
+        emails = list(
+            OutboundEmail.objects.select_for_update(skip_locked=True)
+            .filter(status='pending', next_attempt_at__lte=now)
+            .order_by('next_attempt_at', 'pk')[:batch_size]
+        )
+        OutboundEmail.objects.filter(pk__in=[email.pk for email in emails]).update(
+            next_attempt_at=now + timedelta(seconds=CLAIM_TIMEOUT))
+    return emails
+
+
+def build_message(email, connection):
+    message = EmailMultiAlternatives(
+        email.subject, email.body, email.from_email, email.recipients, connection=connection)
+    if email.html_template:
+        html = email_template(email.html_template).render({'order': email.order})
+        message.attach_alternative(html, 'text/html')
+    return message
+
+
+def _failed(email, error, now):
+    email.attempts += 1
+    email.last_error = error
+    if email.attempts >= MAX_ATTEMPTS:
+        email.status = 'failed'
+    else:
+        email.next_attempt_at = now + retry_delay(email.attempts)
+
+
+def send_batch(batch_size=BATCH_SIZE):
+    """Отправляет одну пачку писем. Возвращает (отправлено, ошибок)."""
+    emails = claim_batch(batch_size)
+    if not emails:
+        return 0, 0
+    # Заказы и позиции для HTML-шаблонов — одним набором запросов на пачку
+    prefetch_related_objects(
+        [email for email in emails if email.order_id],
+        'order', 'order__order_items__product', 'order__order_items__colors',
+        'order__order_items__sizes',
+    )
+
+    sent = failed = 0
+    connection = get_connection(fail_silently=False)
+    try:
+        connection.open()
+    except Exception as e:
+        logger.warning('Не удалось подключиться к почтовому серверу: %s', e)
+        now = timezone.now()
+        for email in emails:
+            _failed(email, f'Соединение: {e}', now)
+        failed = len(emails)
+    else:
+        try:
+            for email in emails:
+                try:
+                    # Одно открытое соединение на всю пачку
+                    connection.send_messages([build_message(email, connection)])
+                except Exception as e:
+                    logger.warning('Письмо %s не отправлено: %s', email.pk, e)
+                    _failed(email, str(e), timezone.now())
+                    failed += 1
+                else:
+                    email.attempts += 1
+                    email.status = 'sent'
+                    email.sent_at = timezone.now()
+                    email.last_error = ''
+                    sent += 1
+        finally:
+            connection.close()
+
+    OutboundEmail.objects.bulk_update(
+        emails, ['status', 'attempts', 'next_attempt_at', 'last_error', 'sent_at'])
+    return sent, failed
+
+
+def drain(batch_size=BATCH_SIZE):
+    """Отправляет все письма, которые пора отправить."""
+    total_sent = total_failed = 0
+    while True:
+        sent, failed = send_batch(batch_size)
+        total_sent += sent
+        total_failed += failed
+        if sent + failed < batch_size:
+            return total_sent, total_failed
@@ -0,0 +1,63 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.test import RequestFactory
+from rest_framework.renderers import JSONRenderer
+
+from store.models import Product, Category, Collection, Menu
+from store.projections import (CategoryProjection, CollectionNameProjection, MenuProjection,
+                               ProductNameProjection)
+from store.renderers import ORJSONRenderer
+from store.serializers import (CategorySerializer, CollectionNameSerializer, MenuSerializer,
+                               ProductNameSerializer)
+
+
+class Command(BaseCommand):
+    help = 'Сравнивает скорость ModelSerializer + JSONRenderer и проекций + orjson на списках'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--limit', type=int, default=500,
+                            help='Количество объектов в списке')
+        parser.add_argument('--repeat', type=int, default=5,
+                            help='Количество повторов, берётся лучшее время')
+
+    def handle(self, *args, **options):
+        limit, repeat = options['limit'], options['repeat']
+        context = {'request': RequestFactory().get('/')}
+        cases = [
+            ('product', ProductNameSerializer, ProductNameProjection,
+             lambda: Product.objects.select_related('collection').order_by('pk')[:limit]),
+            ('category', CategorySerializer, CategoryProjection,
+             lambda: Category.objects.order_by('pk')[:limit]),
+            ('collection', CollectionNameSerializer, CollectionNameProjection,
+             lambda: Collection.objects.prefetch_related('images').order_by('pk')[:limit]),
+            ('menu', MenuSerializer, MenuProjection,
+             lambda: Menu.objects.prefetch_related('menu_item').order_by('pk')[:limit]),
+        ]
+        for name, serializer_class, projection_class, get_queryset in cases:
+            def serializer_render():
+                data = serializer_class(get_queryset(), many=True, context=context).data
+                return JSONRenderer().render(data)
+
+            def projection_render():
+                data = projection_class(context).serialize_queryset(get_queryset())
+                return ORJSONRenderer().render(data)
+
+            old_time, old_output = self.measure(serializer_render, repeat)
+            new_time, new_output = self.measure(projection_render, repeat)
+            same = 'совпадает' if old_output == new_output else 'ОТЛИЧАЕТСЯ'
+            self.stdout.write(
+                f'{name}: {old_time * 1000:.1f} мс -> {new_time * 1000:.1f} мс '
+                f'(x{old_time / new_time:.1f}), {len(new_output)} байт, вывод {same}')
+            if old_output != new_output:
+                self.stderr.write(self.style.ERROR(f'{name}: вывод проекции отличается от сериализатора'))
+        self.stdout.write(self.style.SUCCESS('Готово'))
+
+    def measure(self, func, repeat):
+        best, output = None, None
+        for _ in range(repeat):
+            started = time.perf_counter()
+            output = func()
+            elapsed = time.perf_counter() - started
+            best = elapsed if best is None else min(best, elapsed)
+        return best, output
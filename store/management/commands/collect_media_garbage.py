@@ -0,0 +1,52 @@
+import os
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from store.media_gc import find_orphans, upload_directories
+
+
+class Command(BaseCommand):
+    help = 'Удаляет файлы из MEDIA_ROOT, на которые не ссылается ни одна запись'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true',
+                            help='Только вывести список файлов')
+        parser.add_argument('--batch-size', type=int, default=500,
+                            help='Количество файлов в одной пачке удаления')
+        parser.add_argument('--min-age', type=int, default=24,
+                            help='Не трогать файлы моложе указанного числа часов')
+        parser.add_argument('--directory', action='append', dest='directories',
+                            help='Каталог внутри MEDIA_ROOT (по умолчанию — каталоги upload_to)')
+
+    def handle(self, *args, **options):
+        root = settings.MEDIA_ROOT
+        directories = options['directories'] or upload_directories()
+        orphans = find_orphans(root, directories, min_age=options['min_age'] * 3600)
+
+        found = total_size = 0
+        batch = []
+        for name, size in orphans:
+            found += 1
+            total_size += size
+            if options['dry_run']:
+                self.stdout.write(name)
+                continue
+            batch.append(name)
+            if len(batch) >= options['batch_size']:
+                self.delete_batch(root, batch)
+                batch = []
+        if batch:
+            self.delete_batch(root, batch)
+
+        action = 'Найдено' if options['dry_run'] else 'Удалено'
+        self.stdout.write(self.style.SUCCESS(
+            f'{action} файлов: {found}, {total_size // 1024} КБ'))
+
+    def delete_batch(self, root, names):
+        for name in names:
+            try:
+                os.remove(os.path.join(root, name))
+            except FileNotFoundError:
+                pass
+        self.stdout.write(f'Удалена пачка из {len(names)} файлов')
@@ -0,0 +1,48 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from store.models import Product, ProductView
+from store.view_counter import HyperLogLog, merge_sketches
+
+
+class Command(BaseCommand):
+    help = 'Переносит просмотры из ProductView в счётчики HyperLogLog и удаляет старые строки'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=200,
+                            help='Количество товаров в одной транзакции')
+        parser.add_argument('--keep-rows', action='store_true',
+                            help='Только посчитать просмотры, не удаляя строки ProductView')
+
+    def handle(self, *args, **options):
+        through = Product.views.through
+        compacted = 0
+        last_product_id = 0
+        while True:
+            # Товары пачками по product_id: строки пачки читаются полностью,
+            # и только потом удаляются — без удаления из читаемой выборки
+            product_ids = list(through.objects.filter(product_id__gt=last_product_id).order_by(
+                'product_id').values_list('product_id', flat=True).distinct()[:options['batch_size']])
+            if not product_ids:
+                break
+            last_product_id = product_ids[-1]
+            pending = {}
+            rows = through.objects.filter(product_id__in=product_ids).values_list(
+                'product_id', 'productview__ip').iterator(chunk_size=2000)
+            for product_id, ip in rows:
+                sketch = pending.get(product_id)
+                if sketch is None:
+                    sketch = pending[product_id] = HyperLogLog()
+                sketch.add(ip)
+            compacted += self.compact(pending, options['keep_rows'])
+
+        if not options['keep_rows']:
+            ProductView.objects.filter(product__isnull=True).delete()
+        self.stdout.write(self.style.SUCCESS(f'Обработано товаров: {compacted}'))
+
+    def compact(self, pending, keep_rows):
+        with transaction.atomic():
+            merge_sketches(pending)
+            if not keep_rows:
+                Product.views.through.objects.filter(product_id__in=pending).delete()
+        return len(pending)
@@ -0,0 +1,27 @@
+from concurrent.futures import ProcessPoolExecutor
+
+from django.core.management.base import BaseCommand
+
+from store.models import ProductImage, ImageCollection
+from store.placeholders import BATCH_SIZE, compute_placeholders
+from store.renditions import RENDITION_WORKERS
+
+
+class Command(BaseCommand):
+    help = 'Считает основной цвет и размытое превью для изображений без них'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=BATCH_SIZE,
+                            help='Количество изображений в одном bulk_update')
+        parser.add_argument('--workers', type=int, default=RENDITION_WORKERS,
+                            help='Количество процессов')
+        parser.add_argument('--force', action='store_true',
+                            help='Пересчитать для всех изображений')
+
+    def handle(self, *args, **options):
+        if options['force']:
+            for model in (ProductImage, ImageCollection):
+                model.objects.update(dominant_color='', placeholder='')
+        with ProcessPoolExecutor(max_workers=options['workers']) as executor:
+            computed, failed = compute_placeholders(executor, options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f'Обработано изображений: {computed}, ошибок: {len(failed)}'))
@@ -0,0 +1,27 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from store.fulfilment import CHUNK_SIZE, import_fulfilment
+
+
+class Command(BaseCommand):
+    help = 'Обновляет дату доставки, трек-номер, ссылку и статус заказов из CSV службы доставки'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='CSV с колонкой order_number и колонками '
+                                         'delivery_date, track_number, website_url, status')
+        parser.add_argument('--chunk-size', type=int, default=CHUNK_SIZE,
+                            help='Количество строк в одном bulk_update')
+        parser.add_argument('--encoding', default='utf-8-sig')
+
+    def handle(self, *args, **options):
+        try:
+            with open(options['path'], encoding=options['encoding'], newline='') as f:
+                report = import_fulfilment(f, options['chunk_size'])
+        except (OSError, UnicodeDecodeError, ValueError) as e:
+            raise CommandError(str(e))
+
+        for line, message in report.errors:
+            self.stderr.write(f'Строка {line}: {message}')
+        if report.rejected > len(report.errors):
+            self.stderr.write(f'... и ещё {report.rejected - len(report.errors)} ошибок')
+        self.stdout.write(self.style.SUCCESS(str(report)))
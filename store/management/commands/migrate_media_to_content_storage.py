@@ -0,0 +1,119 @@
+from django.core.management.base import BaseCommand
+
+from store.images import images_changed
+from store.models import ProductImage, ImageCollection
+from store.renditions import RENDITION_FORMATS
+from store.storage import content_storage, is_content_addressed
+
+
+class Command(BaseCommand):
+    help = 'Переносит изображения в хранилище по хэшу содержимого и удаляет дубликаты'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=200,
+                            help='Количество записей в одном bulk_update')
+        parser.add_argument('--dry-run', action='store_true',
+                            help='Только посчитать, сколько места освободится')
+        parser.add_argument('--keep-originals', action='store_true',
+                            help='Не удалять старые файлы после переноса')
+
+    def handle(self, *args, **options):
+        self.dry_run = options['dry_run']
+        self.keep_originals = options['keep_originals']
+        self.stats = {'migrated': 0, 'deduplicated': 0, 'missing': 0, 'deleted': 0,
+                      'deleted_bytes': 0, 'written_bytes': 0}
+        # Только для --dry-run: файлы не создаются и не удаляются, учёт ведётся в памяти
+        self.new_names = set()
+        self.deleted_names = set()
+
+        for model in (ProductImage, ImageCollection):
+            batch, old_names = [], set()
+            # iterator() не держит в памяти всю таблицу
+            for image in model.objects.order_by('pk').iterator(chunk_size=options['batch_size']):
+                if self.migrate_image(image, old_names):
+                    batch.append(image)
+                if len(batch) >= options['batch_size']:
+                    self.flush(model, batch, old_names)
+                    batch, old_names = [], set()
+            self.flush(model, batch, old_names)
+
+        stats = self.stats
+        reclaimed = stats['deleted_bytes'] - stats['written_bytes']
+        prefix = 'Будет перенесено' if self.dry_run else 'Перенесено'
+        self.stdout.write(self.style.SUCCESS(
+            f"{prefix} файлов: {stats['migrated']}, из них дубликатов: {stats['deduplicated']}, "
+            f"удалено старых файлов: {stats['deleted']}, освобождено: {reclaimed // 1024} КБ, "
+            f"не найдено: {stats['missing']}"
+        ))
+
+    def migrate_file(self, name):
+        """Новое имя файла в хранилище по хэшу или None, если файла нет."""
+        if not content_storage.exists(name):
+            self.stats['missing'] += 1
+            return None
+        with content_storage.open(name, 'rb') as f:
+            new_name = content_storage.hashed_name(name, f)
+            if new_name in self.new_names or content_storage.exists(new_name):
+                self.stats['deduplicated'] += 1
+            else:
+                self.stats['written_bytes'] += content_storage.size(name)
+                if not self.dry_run:
+                    content_storage.save(name, f)
+        if self.dry_run:
+            self.new_names.add(new_name)
+        self.stats['migrated'] += 1
+        return new_name
+
+    def migrate_image(self, image, old_names):
+        name = image.image_url.name
+        if not name or is_content_addressed(name):
+            return False
+        new_name = self.migrate_file(name)
+        if new_name is None:
+            return False
+
+        renditions = dict(image.renditions)
+        if renditions.get('source') == name:
+            renditions['source'] = new_name
+            for image_format in RENDITION_FORMATS:
+                variants = renditions.get(image_format) or {}
+                for width, variant_name in list(variants.items()):
+                    if is_content_addressed(variant_name):
+                        continue
+                    new_variant_name = self.migrate_file(variant_name)
+                    if new_variant_name is None:
+                        # Варианты будут пересозданы
+                        renditions = {}
+                        break
+                    variants[width] = new_variant_name
+                    old_names.add(variant_name)
+                if not renditions:
+                    break
+        image.image_url.name = new_name
+        image.renditions = renditions
+        old_names.add(name)
+        return True
+
+    def flush(self, model, batch, old_names):
+        if not batch:
+            return
+        if not self.dry_run:
+            model.objects.bulk_update(batch, ['image_url', 'renditions'])
+            images_changed(model, batch)
+        if self.keep_originals:
+            return
+        # Старый файл удаляется, только если на него больше никто не ссылается;
+        # ссылки из ещё не перенесённых записей уйдут в следующих пачках
+        referenced = set()
+        if not self.dry_run:
+            for other_model in (ProductImage, ImageCollection):
+                referenced.update(other_model.objects.filter(
+                    image_url__in=old_names).values_list('image_url', flat=True))
+        for name in old_names - referenced - self.deleted_names:
+            if content_storage.exists(name):
+                self.stats['deleted_bytes'] += content_storage.size(name)
+                self.stats['deleted'] += 1
+                if self.dry_run:
+                    self.deleted_names.add(name)
+                else:
+                    content_storage.force_delete(name)
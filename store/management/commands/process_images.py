@@ -0,0 +1,52 @@
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from store import placeholders, renditions
+from store.models import ProductImage, ImageCollection
+
+
+class Command(BaseCommand):
+    help = 'Создаёт уменьшенные копии, основной цвет и превью для новых изображений'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=renditions.RENDITION_WORKERS,
+                            help='Количество процессов')
+        parser.add_argument('--interval', type=float, default=5,
+                            help='Пауза в секундах, когда новых изображений нет')
+        parser.add_argument('--once', action='store_true',
+                            help='Обработать то, что есть, и завершиться')
+
+    def handle(self, *args, **options):
+        # Изображения с ошибкой не берутся повторно до перезапуска команды
+        failed = set()
+        with ProcessPoolExecutor(max_workers=options['workers']) as executor:
+            try:
+                while True:
+                    close_old_connections()
+                    created, computed = self.process(executor, options['workers'], failed)
+                    if options['once']:
+                        self.stdout.write(self.style.SUCCESS(
+                            f'Вариантов создано: {created}, превью посчитано: {computed}, ошибок: {len(failed)}'))
+                        return
+                    if created or computed:
+                        self.stdout.write(f'Вариантов создано: {created}, превью посчитано: {computed}')
+                    else:
+                        time.sleep(options['interval'])
+            except KeyboardInterrupt:
+                pass
+
+    def process(self, executor, workers, failed):
+        created = 0
+        for model in (ProductImage, ImageCollection):
+            skipped = [pk for failed_model, pk in failed if failed_model is model]
+            images = renditions.pending_images(model).exclude(pk__in=skipped)
+            model_created, model_failed = renditions.render_images(
+                images.iterator(chunk_size=200), executor, workers * 2)
+            created += model_created
+            failed.update(model_failed)
+        computed, placeholders_failed = placeholders.compute_placeholders(executor, skip=failed)
+        failed.update(placeholders_failed)
+        return created, computed
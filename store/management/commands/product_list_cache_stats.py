@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand
+
+from store import list_cache
+
+
+class Command(BaseCommand):
+    help = 'Показывает число попаданий и промахов кэша списка товаров'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--reset', action='store_true',
+                            help='Обнулить счётчики после вывода')
+
+    def handle(self, *args, **options):
+        stats = list_cache.get_stats()
+        self.stdout.write(f"Попаданий: {stats['hits']}")
+        self.stdout.write(f"Промахов: {stats['misses']}")
+        self.stdout.write(self.style.SUCCESS(f"Доля попаданий: {stats['hit_ratio']:.1%}"))
+        if options['reset']:
+            list_cache.reset_stats()
+            self.stdout.write(self.style.SUCCESS('Счётчики обнулены'))
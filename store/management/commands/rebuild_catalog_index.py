@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from store import list_cache
+from store.catalog_index import build_catalog_index
+
+
+class Command(BaseCommand):
+    help = 'Перестраивает индекс каталога для фильтрации списка товаров'
+
+    def handle(self, *args, **options):
+        total = build_catalog_index()
+        # Страницы списка, собранные по старому индексу
+        list_cache.invalidate_tags(['catalog'])
+        self.stdout.write(self.style.SUCCESS(f'Товаров в индексе каталога: {total}'))
\ No newline at end of file
@@ -0,0 +1,32 @@
+from concurrent.futures import ProcessPoolExecutor
+
+from django.core.management.base import BaseCommand
+
+from store.models import ProductImage, ImageCollection
+from store.renditions import RENDITION_WORKERS, pending_images, render_images
+
+
+class Command(BaseCommand):
+    help = 'Создаёт уменьшенные копии JPEG/WebP для загруженных изображений'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--force', action='store_true',
+                            help='Пересоздать варианты, даже если они уже есть')
+        parser.add_argument('--workers', type=int, default=RENDITION_WORKERS,
+                            help='Количество процессов')
+
+    def handle(self, *args, **options):
+        created = failed = 0
+        with ProcessPoolExecutor(max_workers=options['workers']) as executor:
+            for model in (ProductImage, ImageCollection):
+                if options['force']:
+                    images = model.objects.exclude(image_url='').order_by('pk')
+                else:
+                    images = pending_images(model)
+                # Не больше двух задач на процесс: файлы читаются по мере обработки
+                model_created, model_failed = render_images(
+                    images.iterator(chunk_size=200), executor, options['workers'] * 2)
+                created += model_created
+                failed += len(model_failed)
+
+        self.stdout.write(self.style.SUCCESS(f'Обработано изображений: {created}, ошибок: {failed}'))
@@ -0,0 +1,26 @@
+from django.core.management.base import BaseCommand
+
+from store.models import Product
+from store.recommendations import update_recommendations
+
+
+class Command(BaseCommand):
+    help = 'Пересчитывает рекомендации для всех товаров'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500)
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        batch = []
+        total = 0
+        for product_id in Product.objects.values_list('id', flat=True).iterator():
+            batch.append(product_id)
+            if len(batch) >= batch_size:
+                update_recommendations(batch)
+                total += len(batch)
+                batch = []
+        if batch:
+            update_recommendations(batch)
+            total += len(batch)
+        self.stdout.write(self.style.SUCCESS(f'Рекомендации пересчитаны для {total} товаров'))
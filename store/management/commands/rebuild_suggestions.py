@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from store.suggest import build_suggest_index
+
+
+class Command(BaseCommand):
+    help = 'Перестраивает индекс подсказок для поиска'
+
+    def handle(self, *args, **options):
+        total = build_suggest_index()
+        self.stdout.write(self.style.SUCCESS(f'Записей в индексе подсказок: {total}'))
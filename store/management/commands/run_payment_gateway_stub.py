@@ -0,0 +1,135 @@
+import json
+import random
+import threading
+import time
+import uuid
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from django.core.management.base import BaseCommand
+
+# Заглушка API ЮKassa для нагрузочных тестов без сети:
+# YOOKASSA_API_URL=http://127.0.0.1:8010/v3
+
+
+class GatewayStubHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+    def send_json(self, status, data):
+        body = json.dumps(data, ensure_ascii=False).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def read_json(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        try:
+            return json.loads(self.rfile.read(length) or b'{}')
+        except ValueError:
+            return None
+
+    def simulate(self):
+        """Задержка и случайные ошибки; True, если ответ уже отправлен."""
+        server = self.server
+        if server.delay:
+            time.sleep(server.delay)
+        if server.failure_rate and random.random() < server.failure_rate:
+            self.send_json(500, {'type': 'error', 'code': 'internal_server_error'})
+            return True
+        return False
+
+    def do_POST(self):
+        body = self.read_json()
+        path = self.path.rstrip('/')
+        if self.simulate():
+            return
+        if path.endswith('/payments'):
+            self.create_payment(body)
+        elif path.endswith('/capture') or path.endswith('/cancel'):
+            payment = self.server.payments.get(path.split('/')[-2])
+            if payment is None:
+                self.send_json(404, {'type': 'error', 'code': 'not_found'})
+                return
+            payment['status'] = 'succeeded' if path.endswith('/capture') else 'canceled'
+            payment['paid'] = path.endswith('/capture')
+            self.send_json(200, payment)
+        else:
+            self.send_json(404, {'type': 'error', 'code': 'not_found'})
+
+    def do_GET(self):
+        if self.simulate():
+            return
+        payment = self.server.payments.get(self.path.rstrip('/').split('/')[-1])
+        if payment is None:
+            self.send_json(404, {'type': 'error', 'code': 'not_found'})
+        else:
+            self.send_json(200, payment)
+
+    def create_payment(self, body):
+        if not body or 'amount' not in body:
+            self.send_json(400, {'type': 'error', 'code': 'invalid_request',
+                                 'description': 'amount is required'})
+            return
+        server = self.server
+        key = self.headers.get('Idempotence-Key')
+        with server.lock:
+            if key and key in server.idempotence:
+                self.send_json(200, server.payments[server.idempotence[key]])
+                return
+            payment_id = str(uuid.uuid4())
+            payment = {
+                'id': payment_id,
+                'status': 'pending',
+                'paid': False,
+                'amount': body['amount'],
+                'confirmation': {
+                    'type': 'redirect',
+                    'return_url': (body.get('confirmation') or {}).get('return_url'),
+                    'confirmation_url': f'{server.public_url}/checkout/{payment_id}',
+                },
+                'created_at': datetime.now(timezone.utc).isoformat(),
+                'description': body.get('description'),
+                'test': True,
+            }
+            server.payments[payment_id] = payment
+            if key:
+                server.idempotence[key] = payment_id
+        self.send_json(200, payment)
+
+
+class Command(BaseCommand):
+    help = 'Запускает локальную заглушку API ЮKassa для нагрузочных тестов'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--host', default='127.0.0.1')
+        parser.add_argument('--port', type=int, default=8010)
+        parser.add_argument('--delay', type=float, default=0.0,
+                            help='Задержка ответа в секундах')
+        parser.add_argument('--failure-rate', type=float, default=0.0,
+                            help='Доля ответов с ошибкой 500, от 0 до 1')
+        parser.add_argument('--verbose', action='store_true', help='Печатать каждый запрос')
+
+    def handle(self, *args, **options):
+        server = ThreadingHTTPServer((options['host'], options['port']), GatewayStubHandler)
+        server.daemon_threads = True
+        server.delay = options['delay']
+        server.failure_rate = options['failure_rate']
+        server.verbose = options['verbose']
+        server.public_url = f"http://{options['host']}:{options['port']}"
+        server.payments = {}
+        server.idempotence = {}
+        server.lock = threading.Lock()
+        self.stdout.write(self.style.SUCCESS(
+            f'Заглушка ЮKassa: YOOKASSA_API_URL={server.public_url}/v3'))
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
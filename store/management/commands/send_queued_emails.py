@@ -0,0 +1,38 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from store import mail_queue
+
+
+class Command(BaseCommand):
+    help = 'Отправляет письма из очереди пачками через одно SMTP-соединение'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=mail_queue.BATCH_SIZE,
+                            help='Количество писем на одно соединение')
+        parser.add_argument('--interval', type=float, default=5,
+                            help='Пауза в секундах, когда очередь пуста')
+        parser.add_argument('--once', action='store_true',
+                            help='Отправить то, что есть, и завершиться')
+
+    def handle(self, *args, **options):
+        templates = mail_queue.precompile_templates()
+        self.stdout.write(f'Шаблонов писем загружено: {len(templates)}')
+
+        if options['once']:
+            sent, failed = mail_queue.drain(options['batch_size'])
+            self.stdout.write(self.style.SUCCESS(f'Отправлено писем: {sent}, ошибок: {failed}'))
+            return
+
+        try:
+            while True:
+                close_old_connections()
+                sent, failed = mail_queue.drain(options['batch_size'])
+                if sent or failed:
+                    self.stdout.write(f'Отправлено писем: {sent}, ошибок: {failed}')
+                else:
+                    time.sleep(options['interval'])
+        except KeyboardInterrupt:
+            pass
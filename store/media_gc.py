@@ -0,0 +1,119 @@
+import heapq
+import os
+import tempfile
+import time
+
+from django.apps import apps
+from django.db import models
+
+from .models import ProductImage, ImageCollection
+from .renditions import RENDITION_FORMATS
+
+# Поиск файлов в MEDIA_ROOT, на которые не ссылается ни одно поле FileField.
+# Ссылки из базы и пути файлов сортируются одной и той же внешней сортировкой
+# (отсортированные куски во временных файлах + heapq.merge), и два
+# отсортированных потока сливаются. В памяти — не больше одного куска.
+SORT_CHUNK_SIZE = 50000
+
+
+def file_fields():
+    for model in apps.get_models():
+        for field in model._meta.get_fields():
+            if isinstance(field, models.FileField):
+                yield model, field
+
+
+def upload_directories():
+    """Каталоги upload_to файловых полей — по умолчанию мусор ищется только в них."""
+    directories = set()
+    for _, field in file_fields():
+        if isinstance(field.upload_to, str) and field.upload_to:
+            directories.add(field.upload_to.strip('/').split('/')[0])
+    return sorted(directories)
+
+
+def iter_references(chunk_size=2000):
+    for model, field in file_fields():
+        names = model._default_manager.exclude(**{field.name: ''}).exclude(
+            **{f'{field.name}__isnull': True}).values_list(field.name, flat=True)
+        yield from names.iterator(chunk_size=chunk_size)
+    # Уменьшенные копии изображений (store.renditions)
+    for model in (ProductImage, ImageCollection):
+        for renditions in model.objects.exclude(renditions={}).values_list(
+                'renditions', flat=True).iterator(chunk_size=chunk_size):
+            for image_format in RENDITION_FORMATS:
+                yield from (renditions.get(image_format) or {}).values()
+
+
+def _write_run(directory, names):
+    names.sort()
+    run = tempfile.TemporaryFile('w+', dir=directory, encoding='utf-8')
+    run.writelines(f'{name}\n' for name in names)
+    run.seek(0)
+    return run
+
+
+def sorted_unique(names, directory, chunk_size=None):
+    """Отсортированный поток без повторов; в памяти не больше chunk_size строк."""
+    chunk_size = chunk_size or SORT_CHUNK_SIZE
+    runs, chunk = [], []
+    for name in names:
+        chunk.append(name)
+        if len(chunk) >= chunk_size:
+            runs.append(_write_run(directory, chunk))
+            chunk = []
+    if chunk:
+        runs.append(_write_run(directory, chunk))
+    try:
+        previous = None
+        for line in heapq.merge(*runs):
+            name = line.rstrip('\n')
+            if name != previous:
+                yield name
+                previous = name
+    finally:
+        for run in runs:
+            run.close()
+
+
+def walk_media_files(root, directories):
+    """Относительные пути файлов под root в порядке обхода, каталог читается потоком."""
+    pending = [directory.strip('/') for directory in directories]
+    while pending:
+        relative = pending.pop()
+        try:
+            with os.scandir(os.path.join(root, relative)) as entries:
+                for entry in entries:
+                    name = f'{relative}/{entry.name}'
+                    if entry.is_dir(follow_symlinks=False):
+                        pending.append(name)
+                    elif entry.is_file(follow_symlinks=False):
+                        yield name
+        except FileNotFoundError:
+            continue
+
+
+def iter_media_files(root, directories, tmp_dir):
+    """Файлы под root в том же порядке, что и ссылки из sorted_unique."""
+    return sorted_unique(walk_media_files(root, directories), tmp_dir)
+
+
+def find_orphans(root, directories, min_age=0, tmp_dir=None):
+    """Файлы без ссылок из базы: (относительный путь, размер)."""
+    deadline = time.time() - min_age
+    with tempfile.TemporaryDirectory(dir=tmp_dir) as directory:
+        references = sorted_unique(iter_references(), directory)
+        reference = next(references, None)
+        for name in iter_media_files(root, directories, directory):
+            while reference is not None and reference < name:
+                reference = next(references, None)
+            if reference == name:
+                continue
+            try:
+                stat = os.lstat(os.path.join(root, name))
+            except FileNotFoundError:
+                continue
+            # Свежий файл может принадлежать ещё не закоммиченной загрузке
+            if stat.st_mtime > deadline:
+                continue
+            yield name, stat.st_size
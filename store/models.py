@@ -1,5 +1,9 @@
 from django.db import models
 from django.utils.safestring import mark_safe
+from django.utils import timezone
+
+from .storage import content_storage
+from .tracking import FieldTracker
 
 
 class Menu(models.Model):
@@ -38,7 +42,14 @@ class Category(models.Model):
 
 class ImageCollection(models.Model):
     image_url = models.ImageField(
-        upload_to='products', blank=True, verbose_name='Изображение коллекции')
+        upload_to='products', blank=True, storage=content_storage, verbose_name='Изображение коллекции')
+    # Уменьшенные копии JPEG/WebP (store.renditions)
+    renditions = models.JSONField(
+        default=dict, blank=True, editable=False, verbose_name='Варианты изображения')
+    # Основной цвет и размытое превью для показа до загрузки (store.placeholders)
+    dominant_color = models.CharField(
+        max_length=7, blank=True, editable=False, verbose_name='Основной цвет')
+    placeholder = models.TextField(blank=True, editable=False, verbose_name='Превью')
 
     class Meta:
         verbose_name_plural = 'Изображение коллекции'
@@ -67,7 +78,14 @@ class Collection(models.Model):
 
 class ProductImage(models.Model):
     image_url = models.ImageField(
-        upload_to='products', blank=False, verbose_name='Изображение товара')
+        upload_to='products', blank=False, storage=content_storage, verbose_name='Изображение товара')
+    # Уменьшенные копии JPEG/WebP (store.renditions)
+    renditions = models.JSONField(
+        default=dict, blank=True, editable=False, verbose_name='Варианты изображения')
+    # Основной цвет и размытое превью для показа до загрузки (store.placeholders)
+    dominant_color = models.CharField(
+        max_length=7, blank=True, editable=False, verbose_name='Основной цвет')
+    placeholder = models.TextField(blank=True, editable=False, verbose_name='Превью')
 
     class Meta:
         verbose_name_plural = 'Изображение товаров'
@@ -172,6 +190,8 @@ class Product(models.Model):
         'self', verbose_name='Связанные товары', blank=True)
     views = models.ManyToManyField(
         'ProductView', verbose_name='Просмотры продукта')
+    views_count = models.PositiveIntegerField(
+        default=0, db_index=True, verbose_name='Количество просмотров')
 
     class Meta:
         verbose_name_plural = 'Товары'
@@ -180,16 +200,11 @@ class Product(models.Model):
     def __str__(self) -> str:
         return self.product_name
 
-    def delete(self, *args, **kwargs):
-        # Delete associated images from the filesystem
-        for image in self.images.all():
-            image.image.delete()
-
-        # Call the superclass delete() method to complete the deletion process
-        super().delete(*args, **kwargs)
 
+class ProductColor(FieldTracker, models.Model):
+    # Старый товар нужен для сброса кэша списка при переносе варианта
+    tracked_fields = ('product', 'color', 'size', 'quantity')
 
-class ProductColor(models.Model):
     product = models.ForeignKey(
         Product, on_delete=models.CASCADE, related_name='productcolors')
     color = models.ForeignKey(Color, on_delete=models.CASCADE)
@@ -215,9 +230,66 @@ class ProductColor(models.Model):
 
     image_tag.short_description = 'Image'
 
+class CatalogVersion(models.Model):
+    # Версия модели ('store.product') или объекта ('store.product:15') для ETag
+    key = models.CharField(max_length=100, unique=True)
+    version = models.PositiveBigIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        verbose_name_plural = 'Версии каталога'
+        verbose_name = 'Версия каталога'
+
+    def __str__(self):
+        return f"{self.key}: {self.version}"
+
+
+class NumberSequence(models.Model):
+    # Последнее выданное значение; процессы резервируют блоки (store.order_numbers)
+    name = models.CharField(max_length=50, unique=True)
+    value = models.PositiveBigIntegerField(default=0)
+
+    class Meta:
+        verbose_name_plural = 'Последовательности номеров'
+        verbose_name = 'Последовательность номеров'
+
+    def __str__(self):
+        return f"{self.name}: {self.value}"
+
+
+class ProductViewSketch(models.Model):
+    # Регистры HyperLogLog уникальных IP-адресов просмотров товара
+    product = models.OneToOneField(
+        Product, on_delete=models.CASCADE, related_name='view_sketch')
+    registers = models.BinaryField()
+
+    class Meta:
+        verbose_name_plural = 'Счётчики просмотров'
+        verbose_name = 'Счётчик просмотров'
+
+
+class ProductRecommendation(models.Model):
+    product = models.ForeignKey(
+        Product, on_delete=models.CASCADE, related_name='recommendations')
+    recommended = models.ForeignKey(
+        Product, on_delete=models.CASCADE, related_name='+', verbose_name='Рекомендуемый товар')
+    score = models.FloatField(verbose_name='Оценка')
+    rank = models.PositiveSmallIntegerField(verbose_name='Позиция')
+
+    class Meta:
+        verbose_name_plural = 'Рекомендации товаров'
+        verbose_name = 'Рекомендация товара'
+        ordering = ['product', 'rank']
+        unique_together = ('product', 'rank')
+
+    def __str__(self):
+        return f"{self.product_id} -> {self.recommended_id}"
+
 from profiles_app.models import Profile
 
-class Order(models.Model):
+class Order(FieldTracker, models.Model):
+    tracked_fields = ('status', 'delivery_date', 'website_url', 'track_number')
+
     CHOICES_ORDER = (
         ('Paid', 'Оплачено'),
         ('Being assembled by the seller', 'В сборке у продавца'),
@@ -282,7 +354,9 @@ class OrderItem(models.Model):
         return self.product.price * self.quantity
 
 
-class PaymentRecord(models.Model):
+class PaymentRecord(FieldTracker, models.Model):
+    tracked_fields = ('status', 'amount')
+
     order = models.OneToOneField(
         'Order', on_delete=models.CASCADE, related_name='payment_record_order')
     amount = models.DecimalField(max_digits=10, decimal_places=2)
@@ -296,3 +370,36 @@ class PaymentRecord(models.Model):
 
     def __str__(self) -> str:
         return str(self.order)
+
+
+class OutboundEmail(models.Model):
+    # Очередь исходящих писем; отправляет команда send_queued_emails
+    STATUS_CHOICES = (
+        ('pending', 'Ожидает отправки'),
+        ('sent', 'Отправлено'),
+        ('failed', 'Ошибка'),
+    )
+
+    subject = models.CharField(max_length=255, verbose_name='Тема')
+    body = models.TextField(verbose_name='Текст')
+    # HTML-версия рендерится при отправке из шаблона с контекстом {'order': order}
+    html_template = models.CharField(max_length=255, blank=True, verbose_name='Шаблон HTML')
+    order = models.ForeignKey(
+        Order, on_delete=models.SET_NULL, null=True, blank=True, related_name='+', verbose_name='Заказ')
+    from_email = models.CharField(max_length=255, verbose_name='Отправитель')
+    recipients = models.JSONField(default=list, verbose_name='Получатели')
+    status = models.CharField(
+        max_length=10, choices=STATUS_CHOICES, default='pending', verbose_name='Статус')
+    attempts = models.PositiveSmallIntegerField(default=0, verbose_name='Попыток')
+    next_attempt_at = models.DateTimeField(default=timezone.now, verbose_name='Следующая попытка')
+    last_error = models.TextField(blank=True, verbose_name='Последняя ошибка')
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name='Создано')
+    sent_at = models.DateTimeField(null=True, blank=True, verbose_name='Отправлено')
+
+    class Meta:
+        verbose_name_plural = 'Очередь писем'
+        verbose_name = 'Письмо'
+        indexes = [models.Index(fields=['status', 'next_attempt_at'])]
+
+    def __str__(self):
+        return f"{self.subject} -> {', '.join(self.recipients)}"
@@ -0,0 +1,41 @@
+import threading
+
+from .models import Menu, Category
+from .projections import CategoryProjection, MenuProjection
+from .versions import get_versions, version_key
+
+# Дерево меню -> категории строится один раз на процесс и хранится в памяти.
+# Актуальность проверяется по строкам CatalogVersion меню и категорий, которые
+# увеличиваются сигналами, поэтому правка в админке сбрасывает копию во всех воркерах.
+NAVIGATION_KEYS = (version_key(Menu), version_key(Category))
+
+
+class NavigationSnapshot:
+    def __init__(self, version):
+        self.version = version
+        self.menus = MenuProjection().serialize_queryset(Menu.objects.order_by('pk'))
+        self.categories = CategoryProjection().serialize_queryset(Category.objects.order_by('pk'))
+        self.menus_by_id = {menu['id']: menu for menu in self.menus}
+        self.categories_by_id = {category['id']: category for category in self.categories}
+
+
+_snapshot = None
+_lock = threading.Lock()
+
+
+def get_snapshot(versions=None, keys=()):
+    """
+    Текущий снимок навигации. versions — версии, уже прочитанные
+    CatalogVersionMixin для ключей keys, чтобы не делать второй запрос.
+    """
+    global _snapshot
+    if versions is None or not set(NAVIGATION_KEYS) <= set(keys):
+        versions = get_versions(NAVIGATION_KEYS)
+    version = tuple(versions.get(key, (0, None))[0] for key in NAVIGATION_KEYS)
+    snapshot = _snapshot
+    if snapshot is None or snapshot.version != version:
+        with _lock:
+            snapshot = _snapshot
+            if snapshot is None or snapshot.version != version:
+                snapshot = _snapshot = NavigationSnapshot(version)
+    return snapshot
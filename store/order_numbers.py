@@ -0,0 +1,126 @@
+import os
+import threading
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import F
+
+from .models import NumberSequence
+
+# Номера заказов без коллизий и без запроса на каждый заказ: процесс
+# резервирует блок значений последовательности одним UPDATE и выдаёт их из
+# памяти. Значение перемешивается обратимой перестановкой 40-битного
+# пространства (соседние заказы не угадываются по номеру), кодируется
+# 8 символами Crockford base32 и дополняется контрольным символом Luhn mod 32:
+# 9 символов, например RG5YYP5DV. Неиспользованный остаток блока при
+# перезапуске процесса пропадает — в номерах бывают пропуски.
+SEQUENCE_NAME = 'order_number'
+ALPHABET = '0123456789ABCDEFGHJKMNPQRSTVWXYZ'
+CODE_LENGTH = 8
+BITS = CODE_LENGTH * 5
+MASK = (1 << BITS) - 1
+# Нечётный множитель — перестановка по модулю 2**40
+MULTIPLIER = 0x9E3779B97F & MASK | 1
+XOR_KEY = 0x5A3C96E1D2 & MASK
+INVERSE_MULTIPLIER = pow(MULTIPLIER, -1, MASK + 1)
+
+# Ошибки чтения по Crockford: O -> 0, I и L -> 1
+NORMALIZE = str.maketrans('OIL', '011')
+
+
+def scramble(value):
+    return ((value * MULTIPLIER) & MASK) ^ XOR_KEY
+
+
+def unscramble(number):
+    return ((number ^ XOR_KEY) * INVERSE_MULTIPLIER) & MASK
+
+
+def check_symbol(digits):
+    """Контрольный символ Luhn mod 32 для списка цифр base32."""
+    total = 0
+    factor = 2
+    for digit in reversed(digits):
+        addend = factor * digit
+        total += addend // 32 + addend % 32
+        factor = 1 if factor == 2 else 2
+    return (32 - total % 32) % 32
+
+
+def encode(value):
+    if not 0 < value <= MASK:
+        raise ValueError('Номер вне диапазона')
+    number = scramble(value)
+    digits = [(number >> shift) & 31 for shift in range(BITS - 5, -1, -5)]
+    digits.append(check_symbol(digits))
+    return ''.join(ALPHABET[digit] for digit in digits)
+
+
+def _digits(code):
+    code = code.replace('-', '').upper().translate(NORMALIZE)
+    if len(code) != CODE_LENGTH + 1 or any(char not in ALPHABET for char in code):
+        return None
+    digits = [ALPHABET.index(char) for char in code]
+    return digits if check_symbol(digits[:-1]) == digits[-1] else None
+
+
+def is_valid(code):
+    """Проверяет контрольный символ; регистр, дефисы и O/I/L не важны."""
+    return _digits(code) is not None
+
+
+def decode(code):
+    """Значение последовательности по номеру; ValueError для неверного номера."""
+    digits = _digits(code)
+    if digits is None:
+        raise ValueError('Неверный номер заказа')
+    number = 0
+    for digit in digits[:-1]:
+        number = number << 5 | digit
+    return unscramble(number)
+
+
+def reserve_block(size):
+    """
+    Резервирует size значений; возвращает (первое, последнее).
+    Вызывается вне транзакции: при откате внешней транзакции блок вернулся бы
+    в последовательность, а процесс продолжил бы выдавать номера из него.
+    """
+    for _ in range(2):
+        with transaction.atomic():
+            # UPDATE блокирует строку до конца транзакции, значение читается уже своё
+            if NumberSequence.objects.filter(name=SEQUENCE_NAME).update(value=F('value') + size):
+                end = NumberSequence.objects.get(name=SEQUENCE_NAME).value
+                return end - size + 1, end
+        try:
+            with transaction.atomic():
+                NumberSequence.objects.create(name=SEQUENCE_NAME, value=0)
+        except IntegrityError:
+            # Строку одновременно создал другой процесс
+            pass
+    raise RuntimeError('Не удалось зарезервировать номера заказов')
+
+
+class OrderNumberAllocator:
+    def __init__(self, block_size):
+        self.block_size = block_size
+        self.lock = threading.Lock()
+        self.pid = None
+        self.next_value = self.end = 0
+
+    def next(self):
+        with self.lock:
+            # После fork дочерний процесс не должен выдавать номера из блока родителя
+            if self.pid != os.getpid() or self.next_value > self.end:
+                self.next_value, self.end = reserve_block(self.block_size)
+                self.pid = os.getpid()
+            value = self.next_value
+            self.next_value += 1
+        return encode(value)
+
+
+allocator = OrderNumberAllocator(settings.ORDER_NUMBER_BLOCK_SIZE)
+
+
+def next_order_number():
+    return allocator.next()
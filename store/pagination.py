@@ -0,0 +1,169 @@
+import base64
+import hashlib
+import json
+import operator
+from functools import reduce
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import F, Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+from .models import Product
+
+COUNT_CACHE_TIMEOUT = 60
+
+
+def ordering_key(ordering):
+    return ','.join(('-' if descending else '') + field_name for field_name, descending in ordering)
+
+
+class ProductKeysetPagination(BasePagination):
+    """
+    Постраничный вывод по курсору (keyset): следующая страница выбирается
+    условием (поля сортировки..., id) > (значения последнего товара), без
+    OFFSET и COUNT(*). Курсор хранит сортировку и значения всех её полей.
+    Включается параметром ?pagination=cursor или наличием ?cursor=.
+    """
+    cursor_query_param = 'cursor'
+    mode_query_param = 'pagination'
+    count_query_param = 'with_count'
+    page_size = settings.REST_FRAMEWORK['PAGE_SIZE']
+    ordering_fields = ('price', 'date')
+    invalid_cursor_message = 'Некорректный курсор'
+
+    @classmethod
+    def is_requested(cls, request):
+        params = request.query_params
+        return cls.cursor_query_param in params or params.get(cls.mode_query_param) == 'cursor'
+
+    def get_ordering(self, request):
+        """Сортировка — [(поле, по убыванию)]; те же правила, что в ProductViewSet и OrderingFilter."""
+        params = request.query_params
+        ordering = []
+        if params.get('min_price') is not None:
+            ordering = [('price', False)]
+        elif params.get('max_price') is not None:
+            ordering = [('price', True)]
+
+        ordering_param = params.get('ordering')
+        if ordering_param == 'views_count':
+            # Индексированная колонка, порядок доопределяет id; товар, набравший
+            # просмотры между запросами страниц, может сместиться через курсор
+            ordering = [('views_count', True)]
+        elif ordering_param:
+            fields = []
+            for field in ordering_param.split(','):
+                field = field.strip()
+                field_name = field.lstrip('-')
+                if field_name in self.ordering_fields and field_name not in [name for name, _ in fields]:
+                    fields.append((field_name, field.startswith('-')))
+            if fields:
+                ordering = fields
+        return ordering
+
+    def encode_cursor(self, ordering, values, pk):
+        values = [
+            value if value is None or isinstance(value, int)
+            else value.isoformat() if hasattr(value, 'isoformat') else str(value)
+            for value in values
+        ]
+        data = json.dumps([ordering_key(ordering), values, pk]).encode()
+        return base64.urlsafe_b64encode(data).decode()
+
+    def decode_cursor(self, cursor, ordering):
+        try:
+            key, values, pk = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+            # Курсор от другой сортировки указывал бы на случайное место списка
+            if key != ordering_key(ordering) or len(values) != len(ordering):
+                raise ValueError(key)
+            values = [
+                None if value is None else Product._meta.get_field(field_name).to_python(value)
+                for (field_name, _), value in zip(ordering, values)
+            ]
+            return values, int(pk)
+        except Exception:
+            raise NotFound(self.invalid_cursor_message)
+
+    def beyond(self, field_name, descending, value):
+        """Строго после value по одному полю или None, если таких значений нет."""
+        # NULL идут первыми при возрастании и последними при убывании
+        if descending:
+            if value is None:
+                return None
+            return Q(**{f'{field_name}__lt': value}) | Q(**{f'{field_name}__isnull': True})
+        if value is None:
+            return Q(**{f'{field_name}__isnull': False})
+        return Q(**{f'{field_name}__gt': value})
+
+    def after(self, ordering, values, pk):
+        """Условие «после курсора»: первые поля равны, следующее — дальше по сортировке."""
+        conditions = []
+        equal = Q()
+        for (field_name, descending), value in zip(ordering, values):
+            beyond = self.beyond(field_name, descending, value)
+            if beyond is not None:
+                conditions.append(equal & beyond)
+            equal &= Q(**{f'{field_name}__isnull': True}) if value is None else Q(**{field_name: value})
+        id_descending = bool(ordering) and ordering[0][1]
+        conditions.append(equal & Q(**{'id__lt' if id_descending else 'id__gt': pk}))
+        return reduce(operator.or_, conditions)
+
+    def get_count(self, queryset, request):
+        params = sorted(
+            (key, value) for key, value in request.query_params.lists()
+            if key not in (self.cursor_query_param, self.mode_query_param, self.count_query_param)
+        )
+        key = 'store:product_count:%s' % hashlib.md5(
+            json.dumps(params, ensure_ascii=False).encode()).hexdigest()
+        return cache.get_or_set(key, lambda: queryset.order_by().count(), COUNT_CACHE_TIMEOUT)
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        ordering = self.get_ordering(request)
+        # Фильтры по размеру и меню соединяют таблицы и могут дублировать товары
+        queryset = queryset.distinct()
+        self.count = None
+        if request.query_params.get(self.count_query_param) in ('1', 'true'):
+            self.count = self.get_count(queryset, request)
+
+        order_by = [
+            F(field_name).desc(nulls_last=True) if descending else F(field_name).asc(nulls_first=True)
+            for field_name, descending in ordering
+        ]
+        # id в направлении первого поля: порядок полностью определён
+        order_by.append('-id' if ordering and ordering[0][1] else 'id')
+        queryset = queryset.order_by(*order_by)
+
+        cursor = request.query_params.get(self.cursor_query_param)
+        if cursor:
+            values, pk = self.decode_cursor(cursor, ordering)
+            queryset = queryset.filter(self.after(ordering, values, pk))
+
+        results = list(queryset[:self.page_size + 1])
+        self.next_cursor = None
+        if len(results) > self.page_size:
+            results = results[:self.page_size]
+            # Строки .values() (проекции) или экземпляры модели
+            last = results[-1]
+            if isinstance(last, dict):
+                pk, values = last['id'], [last[field_name] for field_name, _ in ordering]
+            else:
+                pk, values = last.pk, [getattr(last, field_name) for field_name, _ in ordering]
+            self.next_cursor = self.encode_cursor(ordering, values, pk)
+        return results
+
+    def get_next_link(self):
+        if self.next_cursor is None:
+            return None
+        url = self.request.build_absolute_uri()
+        return replace_query_param(url, self.cursor_query_param, self.next_cursor)
+
+    def get_paginated_response(self, data):
+        response = {'next': self.get_next_link(), 'results': data}
+        if self.count is not None:
+            response['count'] = self.count
+        return Response(response)
@@ -0,0 +1,225 @@
+import asyncio
+import threading
+import time
+import weakref
+
+import httpx
+import requests
+from django.conf import settings
+from requests.adapters import HTTPAdapter
+
+from .models import PaymentRecord
+
+# Клиент API ЮKassa: один на процесс, с пулом HTTP-соединений, таймаутами
+# на каждый вызов и автоматом-предохранителем (circuit breaker). SDK yookassa
+# создаёт новую сессию без таймаута на каждый запрос и хранит ключи в
+# глобальной Configuration, поэтому платёж создаётся напрямую через REST API.
+# Асинхронное представление ходит в API через httpx.AsyncClient, не занимая
+# поток; предохранитель у синхронного и асинхронного вызовов общий.
+
+
+class PaymentGatewayError(Exception):
+    pass
+
+
+class CircuitOpenError(PaymentGatewayError):
+    pass
+
+
+class CircuitBreaker:
+    """
+    После failure_threshold ошибок подряд вызовы отклоняются сразу на
+    reset_timeout секунд, затем пропускается один пробный вызов.
+    """
+
+    def __init__(self, failure_threshold, reset_timeout):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at = None
+        self.trial_running = False
+        self.lock = threading.Lock()
+
+    def allow(self):
+        with self.lock:
+            if self.opened_at is None:
+                return True
+            if self.trial_running or time.monotonic() - self.opened_at < self.reset_timeout:
+                return False
+            self.trial_running = True
+            return True
+
+    def record_success(self):
+        with self.lock:
+            self.failures = 0
+            self.opened_at = None
+            self.trial_running = False
+
+    def record_failure(self):
+        with self.lock:
+            self.failures += 1
+            self.trial_running = False
+            if self.opened_at is not None or self.failures >= self.failure_threshold:
+                self.opened_at = time.monotonic()
+
+
+class YookassaClient:
+    def __init__(self, api_url, account_id, secret_key, connect_timeout, read_timeout,
+                 pool_size, breaker):
+        self.api_url = api_url.rstrip('/')
+        self.timeout = (connect_timeout, read_timeout)
+        self.auth = (str(account_id), str(secret_key))
+        self.pool_size = pool_size
+        self.breaker = breaker
+        self.session = requests.Session()
+        self.session.auth = self.auth
+        # Повторы не нужны: создание платежа защищено Idempotence-Key,
+        # а повторять запрос должен вызывающий код
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, max_retries=0)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+        self._async_clients = weakref.WeakKeyDictionary()
+
+    def async_client(self):
+        # Соединения httpx.AsyncClient привязаны к циклу событий: клиент на каждый цикл
+        loop = asyncio.get_running_loop()
+        client = self._async_clients.get(loop)
+        if client is None:
+            connect_timeout, read_timeout = self.timeout
+            client = self._async_clients[loop] = httpx.AsyncClient(
+                auth=self.auth,
+                timeout=httpx.Timeout(read_timeout, connect=connect_timeout),
+                limits=httpx.Limits(max_connections=self.pool_size),
+            )
+        return client
+
+    def check_circuit(self):
+        if not self.breaker.allow():
+            raise CircuitOpenError('Платёжный сервис временно недоступен')
+
+    def handle_response(self, status_code, text, load_json):
+        if status_code >= 500 or status_code == 429:
+            self.breaker.record_failure()
+            raise PaymentGatewayError(f'Платёжный сервис вернул {status_code}')
+        # Ошибка в запросе (4xx) — сервис при этом работает
+        self.breaker.record_success()
+        if status_code != 200:
+            raise PaymentGatewayError(f'Платёж отклонён: {status_code} {text[:200]}')
+        try:
+            return load_json()
+        except ValueError:
+            raise PaymentGatewayError('Некорректный ответ платёжного сервиса')
+
+    def request(self, method, path, body=None, idempotence_key=None):
+        self.check_circuit()
+        headers = {'Idempotence-Key': idempotence_key} if idempotence_key else None
+        try:
+            response = self.session.request(
+                method, self.api_url + path, json=body, headers=headers, timeout=self.timeout)
+        except requests.Timeout:
+            self.breaker.record_failure()
+            raise PaymentGatewayError('Платёжный сервис не ответил вовремя')
+        except requests.RequestException:
+            self.breaker.record_failure()
+            raise PaymentGatewayError('Нет соединения с платёжным сервисом')
+        return self.handle_response(response.status_code, response.text, response.json)
+
+    async def request_async(self, method, path, body=None, idempotence_key=None):
+        self.check_circuit()
+        headers = {'Idempotence-Key': idempotence_key} if idempotence_key else None
+        try:
+            response = await self.async_client().request(
+                method, self.api_url + path, json=body, headers=headers)
+        except httpx.TimeoutException:
+            self.breaker.record_failure()
+            raise PaymentGatewayError('Платёжный сервис не ответил вовремя')
+        except httpx.HTTPError:
+            self.breaker.record_failure()
+            raise PaymentGatewayError('Нет соединения с платёжным сервисом')
+        return self.handle_response(response.status_code, response.text, response.json)
+
+    @staticmethod
+    def payment_body(amount, description, return_url):
+        return {
+            'amount': {'value': str(amount), 'currency': 'RUB'},
+            'confirmation': {'type': 'redirect', 'return_url': return_url},
+            'description': description,
+        }
+
+    def create_payment(self, amount, description, return_url, idempotence_key):
+        return self.request('POST', '/payments', self.payment_body(amount, description, return_url),
+                            idempotence_key)
+
+    async def create_payment_async(self, amount, description, return_url, idempotence_key):
+        return await self.request_async(
+            'POST', '/payments', self.payment_body(amount, description, return_url), idempotence_key)
+
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def get_client():
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                _client = YookassaClient(
+                    settings.YOOKASSA_API_URL,
+                    settings.YOOKASSA_ACCOUNT_ID,
+                    settings.YOOKASSA_SECRET_KEY,
+                    settings.YOOKASSA_CONNECT_TIMEOUT,
+                    settings.YOOKASSA_READ_TIMEOUT,
+                    settings.YOOKASSA_POOL_SIZE,
+                    CircuitBreaker(settings.YOOKASSA_BREAKER_FAILURES, settings.YOOKASSA_BREAKER_RESET),
+                )
+    return _client
+
+
+def idempotence_key(order_id):
+    # Ключ зависит только от заказа: повтор после таймаута или 503 вернёт
+    # уже созданный платёж, а не создаст второй
+    return f'order-{order_id}'
+
+
+def request_payment(order_id, amount):
+    """Создаёт платёж в ЮKassa. Только сеть, без обращений к базе."""
+    return get_client().create_payment(
+        amount,
+        "Оплата заказа №" + str(order_id),
+        settings.YOOKASSA_RETURN_URL,
+        idempotence_key(order_id),
+    )
+
+
+def parse_payment(payment):
+    """(сумма, статус, ссылка на оплату) из ответа ЮKassa."""
+    try:
+        return (payment['amount']['value'], payment['status'],
+                payment['confirmation']['confirmation_url'])
+    except (KeyError, TypeError):
+        raise PaymentGatewayError('Некорректный ответ платёжного сервиса')
+
+
+def record_payment(order, payment):
+    """Сохраняет платёж заказа; возвращает (ссылка на оплату, создана ли запись)."""
+    amount, status, confirmation_url = parse_payment(payment)
+    # При повторе для того же заказа запись уже может быть
+    _, created = PaymentRecord.objects.update_or_create(
+        order=order, defaults={'amount': amount, 'status': status})
+    return confirmation_url, created
+
+
+def start_payment(order):
+    """Создаёт платёж для заказа; возвращает (ссылка на оплату, создана ли запись)."""
+    return record_payment(order, request_payment(order.id, order.amount))
+
+
+async def request_payment_async(order_id, amount):
+    """То же, что request_payment, но без блокировки потока на время запроса."""
+    return await get_client().create_payment_async(
+        amount,
+        "Оплата заказа №" + str(order_id),
+        settings.YOOKASSA_RETURN_URL,
+        idempotence_key(order_id),
+    )
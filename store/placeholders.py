@@ -0,0 +1,71 @@
+import logging
+
+from .image_processing import render_placeholder
+from .images import images_changed
+from .models import ProductImage, ImageCollection
+from .renditions import read_source
+
+logger = logging.getLogger(__name__)
+
+# Основной цвет и размытое превью (LQIP) считаются пакетами для всех
+# изображений, у которых их ещё нет (dominant_color = ''), в пуле процессов
+# команды process_images (или разово compute_image_placeholders).
+PLACEHOLDER_WIDTH = 16
+PLACEHOLDER_QUALITY = 40
+BATCH_SIZE = 50
+
+
+def pending_images(model):
+    return model.objects.filter(dominant_color='').exclude(image_url='').order_by('pk')
+
+
+def compute_batch(model, images, executor):
+    """
+    Считает цвет и превью для пачки изображений и сохраняет одним bulk_update.
+    Возвращает (обработано, [(модель, pk) изображений с ошибкой]).
+    """
+    sources, futures, failed = [], [], []
+    for image in images:
+        try:
+            data = read_source(image)
+        except OSError:
+            logger.exception('Не удалось прочитать изображение %s', image.image_url.name)
+            failed.append((model, image.pk))
+            continue
+        sources.append(image)
+        futures.append(executor.submit(render_placeholder, data, PLACEHOLDER_WIDTH, PLACEHOLDER_QUALITY))
+
+    updated = []
+    for image, future in zip(sources, futures):
+        try:
+            image.dominant_color, image.placeholder = future.result()
+        except Exception:
+            logger.exception('Не удалось посчитать превью для %s', image.image_url.name)
+            failed.append((model, image.pk))
+            continue
+        updated.append(image)
+    if updated:
+        model.objects.bulk_update(updated, ['dominant_color', 'placeholder'])
+        images_changed(model, updated)
+    return len(updated), failed
+
+
+def compute_placeholders(executor, batch_size=BATCH_SIZE, skip=()):
+    """
+    Обрабатывает все изображения без цвета, кроме skip — множества (модель, pk).
+    Возвращает (обработано, [(модель, pk) изображений с ошибкой]).
+    """
+    computed, failed = 0, []
+    for model in (ProductImage, ImageCollection):
+        skipped = [pk for skip_model, pk in skip if skip_model is model]
+        last_pk = 0
+        while True:
+            # Пачками по pk: ошибочные изображения не выбираются повторно
+            batch = list(pending_images(model).exclude(pk__in=skipped).filter(pk__gt=last_pk)[:batch_size])
+            if not batch:
+                break
+            last_pk = batch[-1].pk
+            batch_computed, batch_failed = compute_batch(model, batch, executor)
+            computed += batch_computed
+            failed += batch_failed
+    return computed, failed
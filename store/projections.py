@@ -0,0 +1,128 @@
+from django.db.models import Min
+
+from .models import Product, Collection, Category, Menu, ImageCollection
+from .renditions import card_image_url
+from .serializers import MENU_NAMES, ProductNameSerializer, primary_image_fields
+from .utils import primary_images
+
+# Проекции для горячих списков: строки .values() сразу превращаются в словари
+# того же вида, что отдают ModelSerializer, без создания экземпляров моделей
+# и обхода полей сериализатора. Порядок и значения ключей должны совпадать.
+
+
+class Projection:
+    model = None
+    values_fields = ()
+
+    def __init__(self, context=None):
+        self.context = context or {}
+
+    @property
+    def request(self):
+        return self.context.get('request')
+
+    def get_queryset(self):
+        return self.model._default_manager.all()
+
+    def rows(self, queryset=None):
+        queryset = self.get_queryset() if queryset is None else queryset
+        return queryset.values(*self.values_fields)
+
+    def prepare(self, rows):
+        """Пакетная загрузка связанных данных для всех строк."""
+
+    def to_representation(self, row):
+        raise NotImplementedError
+
+    def serialize(self, rows):
+        rows = list(rows)
+        self.prepare(rows)
+        return [self.to_representation(row) for row in rows]
+
+    def serialize_queryset(self, queryset=None):
+        return self.serialize(self.rows(queryset))
+
+    def serialize_ids(self, ids):
+        """Сериализует объекты в порядке ids; отсутствующие пропускаются."""
+        rows = {row['id']: row for row in self.rows(self.get_queryset().filter(pk__in=ids))}
+        return self.serialize(rows[pk] for pk in ids if pk in rows)
+
+
+class ProductNameProjection(Projection):
+    """Формат ProductNameSerializer."""
+    model = Product
+    # date и views_count не выводятся, но нужны курсорной пагинации
+    values_fields = ('id', 'collection_id', 'collection__collection_name', 'product_name', 'price',
+                     'date', 'views_count')
+
+    # Поле цены сериализатора — то же форматирование Decimal
+    price_field = ProductNameSerializer().fields['price']
+
+    def prepare(self, rows):
+        self.images = primary_images(row['id'] for row in rows)
+
+    def to_representation(self, row):
+        image = self.images.get(row['id'])
+        data = {
+            'id': row['id'],
+            **primary_image_fields(image, self.request),
+        }
+        # Как у сериализатора: без коллекции ключа collection_name нет
+        if row['collection_id'] is not None:
+            data['collection_name'] = row['collection__collection_name']
+        data['product_name'] = row['product_name']
+        data['price'] = self.price_field.to_representation(row['price'])
+        return data
+
+
+class CategoryProjection(Projection):
+    """Формат CategorySerializer."""
+    model = Category
+    values_fields = ('id', 'category_name')
+
+    def to_representation(self, row):
+        return {'id': row['id'], 'category_name': row['category_name']}
+
+
+class CollectionNameProjection(Projection):
+    """Формат CollectionNameSerializer."""
+    model = Collection
+    values_fields = ('id', 'collection_name')
+
+    def prepare(self, rows):
+        first_image_ids = dict(
+            Collection.images.through.objects.filter(collection_id__in=[row['id'] for row in rows])
+            .values('collection_id').annotate(first_id=Min('imagecollection_id'))
+            .values_list('collection_id', 'first_id')
+        )
+        images = ImageCollection.objects.in_bulk(first_image_ids.values())
+        self.images = {
+            collection_id: images.get(image_id) for collection_id, image_id in first_image_ids.items()
+        }
+
+    def to_representation(self, row):
+        return {
+            'id': row['id'],
+            'image': card_image_url(self.images.get(row['id']), self.request),
+            'collection_name': row['collection_name'],
+        }
+
+
+class MenuProjection(Projection):
+    """Формат MenuSerializer."""
+    model = Menu
+    values_fields = ('id', 'menu_name')
+
+    def prepare(self, rows):
+        self.categories = {}
+        for menu_id, category_id, category_name in Category.menu_item.through.objects.filter(
+                menu_id__in=[row['id'] for row in rows]).order_by('category_id').values_list(
+                'menu_id', 'category_id', 'category__category_name'):
+            self.categories.setdefault(menu_id, []).append({'id': category_id, 'name': category_name})
+
+    def to_representation(self, row):
+        return {
+            'id': row['id'],
+            'menu_name': MENU_NAMES.get(row['menu_name']),
+            'categories': self.categories.get(row['id'], []),
+        }
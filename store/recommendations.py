@@ -0,0 +1,151 @@
+import heapq
+import threading
+
+from django.db import transaction
+from django.db.models import Count, Q
+
+from .models import Product, ProductRecommendation
+from .utils import DebouncedTask
+from .versions import bump_versions, version_key
+
+RECOMMENDATIONS_COUNT = 12
+
+CATEGORY_WEIGHT = 1.0
+PRICE_WEIGHT = 1.0
+COLLECTION_WEIGHT = 0.5
+
+
+def score_candidate(product, category_count, shared_categories, price, collection_id):
+    # Доля общих категорий + близость цены + та же коллекция
+    score = CATEGORY_WEIGHT * shared_categories / max(category_count, 1)
+    highest_price = max(product.price, price)
+    if highest_price:
+        score += PRICE_WEIGHT * (1 - float(abs(product.price - price) / highest_price))
+    if product.collection_id is not None and collection_id == product.collection_id:
+        score += COLLECTION_WEIGHT
+    return score
+
+
+def compute_recommendations(product, limit=RECOMMENDATIONS_COUNT):
+    category_ids = list(product.category.values_list('id', flat=True))
+    lookup = Q(category__in=category_ids)
+    if product.collection_id is not None:
+        lookup |= Q(collection_id=product.collection_id)
+
+    candidates = Product.objects.filter(lookup).exclude(pk=product.pk).values(
+        'id', 'price', 'collection_id'
+    ).annotate(
+        shared=Count('category', filter=Q(category__in=category_ids), distinct=True)
+    ).order_by()
+
+    scored = (
+        (score_candidate(product, len(category_ids), row['shared'], row['price'],
+                         row['collection_id']), -row['id'])
+        for row in candidates
+    )
+    return [(-negative_id, score) for score, negative_id in heapq.nlargest(limit, scored)]
+
+
+def update_recommendations(product_ids):
+    products = Product.objects.filter(pk__in=product_ids)
+    current = {}
+    for product_id, recommended_id in ProductRecommendation.objects.filter(
+            product_id__in=product_ids).order_by('product_id', 'rank').values_list('product_id', 'recommended_id'):
+        current.setdefault(product_id, []).append(recommended_id)
+    for product in products:
+        recommendations = compute_recommendations(product)
+        if [recommended_id for recommended_id, _ in recommendations] == current.get(product.pk, []):
+            continue
+        rows = [
+            ProductRecommendation(product=product, recommended_id=recommended_id,
+                                  score=score, rank=rank)
+            for rank, (recommended_id, score) in enumerate(recommendations)
+        ]
+        with transaction.atomic():
+            ProductRecommendation.objects.filter(product=product).delete()
+            ProductRecommendation.objects.bulk_create(rows)
+            # Рекомендации входят в ответ товара: его ETag должен смениться
+            bump_versions([version_key(Product, product.pk)])
+
+
+def entering_neighbours(product):
+    """
+    Товары с общей категорией или коллекцией, в чей топ product проходит по
+    оценке: полный список короче RECOMMENDATIONS_COUNT или последняя оценка не выше.
+    """
+    category_ids = list(product.category.values_list('id', flat=True))
+    lookup = Q(category__in=category_ids)
+    if product.collection_id is not None:
+        lookup |= Q(collection_id=product.collection_id)
+    # Соседи выбираются подзапросом: иначе соединение фильтра по категориям
+    # попало бы и в подсчёт всех категорий соседа
+    neighbours = Product.objects.filter(pk__in=Product.objects.filter(lookup).values('pk')).exclude(
+        pk=product.pk).values('id', 'price', 'collection_id').annotate(
+        category_count=Count('category', distinct=True),
+        shared=Count('category', filter=Q(category__in=category_ids), distinct=True),
+    ).order_by()
+    neighbours = list(neighbours)
+    thresholds = dict(ProductRecommendation.objects.filter(
+        product_id__in=[row['id'] for row in neighbours], rank=RECOMMENDATIONS_COUNT - 1,
+    ).values_list('product_id', 'score'))
+    entering = set()
+    for row in neighbours:
+        neighbour = Product(pk=row['id'], price=row['price'], collection_id=row['collection_id'])
+        score = score_candidate(neighbour, row['category_count'], row['shared'],
+                                product.price, product.collection_id)
+        if row['id'] not in thresholds or score >= thresholds[row['id']]:
+            entering.add(row['id'])
+    return entering
+
+
+def affected_products(product_ids):
+    """
+    Товары, чьи рекомендации могут измениться после правки product_ids:
+    сами товары, товары, которые их сейчас рекомендуют (оценка могла упасть),
+    и соседи, в чей топ правленый товар теперь проходит. Остальные товары
+    категории не пересчитываются: их топ от правки не меняется.
+    """
+    product_ids = {product_id for product_id in product_ids if product_id is not None}
+    if not product_ids:
+        return set()
+    affected = set(product_ids)
+    for product in Product.objects.filter(pk__in=product_ids):
+        affected |= entering_neighbours(product)
+    affected.update(ProductRecommendation.objects.filter(
+        recommended_id__in=product_ids).values_list('product_id', flat=True))
+    return affected
+
+
+# Пересчёт идёт в фоне: товаров с общей категорией может быть много
+_pending = set()
+_pending_lock = threading.Lock()
+
+
+def update_pending():
+    with _pending_lock:
+        product_ids = set(_pending)
+        _pending.clear()
+    update_recommendations(product_ids)
+
+
+update_task = DebouncedTask(update_pending)
+
+
+def _queue_update(product_ids):
+    with _pending_lock:
+        _pending.update(product_ids)
+    update_task.schedule()
+
+
+def schedule_update(product_ids):
+    product_ids = set(product_ids)
+    if product_ids:
+        transaction.on_commit(lambda: _queue_update(product_ids))
+
+
+def get_recommendations(product):
+    # Только сохранённые рекомендации: считает их фоновая задача
+    # и команда rebuild_recommendations
+    recommendations = ProductRecommendation.objects.filter(
+        product=product).select_related('recommended__collection')
+    return [recommendation.recommended for recommendation in recommendations]
@@ -0,0 +1,50 @@
+import codecs
+
+import orjson
+from django.conf import settings
+from rest_framework.exceptions import ParseError
+from rest_framework.parsers import JSONParser
+from rest_framework.renderers import JSONRenderer
+
+# orjson вместо json: тот же компактный UTF-8 вывод, что у JSONRenderer
+# (UNICODE_JSON и COMPACT_JSON по умолчанию), но кодирование в несколько раз быстрее.
+ORJSON_OPTIONS = orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_PASSTHROUGH_DATACLASS
+
+
+class ORJSONRenderer(JSONRenderer):
+    def __init__(self):
+        self._encoder = self.encoder_class()
+
+    def _default(self, obj):
+        # Decimal, даты, ленивые строки и т.п. — как в JSONEncoder DRF
+        return self._encoder.default(obj)
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        indent = self.get_indent(accepted_media_type, renderer_context or {})
+        if indent is not None or self.ensure_ascii or not self.compact:
+            return super().render(data, accepted_media_type, renderer_context)
+        try:
+            ret = orjson.dumps(data, default=self._default, option=ORJSON_OPTIONS)
+        except TypeError:
+            # Нестроковые ключи, целые больше 64 бит и т.п.
+            return super().render(data, accepted_media_type, renderer_context)
+        # Как JSONRenderer: \u2028 и \u2029 всегда экранируются
+        return ret.replace('\u2028'.encode(), b'\\u2028').replace('\u2029'.encode(), b'\\u2029')
+
+
+class ORJSONParser(JSONParser):
+    renderer_class = ORJSONRenderer
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        parser_context = parser_context or {}
+        encoding = parser_context.get('encoding', settings.DEFAULT_CHARSET)
+        try:
+            data = stream.read()
+            if codecs.lookup(encoding).name != 'utf-8':
+                data = data.decode(encoding)
+            # orjson, как и strict-режим JSONParser, не принимает NaN и Infinity
+            return orjson.loads(data)
+        except (ValueError, UnicodeDecodeError) as exc:
+            raise ParseError('JSON parse error - %s' % str(exc))
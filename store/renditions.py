@@ -0,0 +1,153 @@
+import logging
+import os
+from concurrent.futures import FIRST_COMPLETED, wait
+
+from django.core.files.base import ContentFile
+from django.db.models import F, Q
+
+from .image_processing import render_renditions
+from .images import images_changed
+
+logger = logging.getLogger(__name__)
+
+# Варианты изображений хранятся в products/renditions/ (в хранилище по хэшу
+# содержимого имя станет products/renditions/<sha256>.<формат>), список — в поле renditions модели:
+# {'source': имя оригинала, 'width': ..., 'height': ..., 'jpeg': {'320': имя, ...}, 'webp': {...}}.
+# Веб-процессы варианты не создают: новые изображения обрабатывает команда
+# process_images (или разово rebuild_image_renditions) в своём пуле процессов.
+RENDITION_WIDTHS = (320, 640, 1280)
+RENDITION_FORMATS = ('jpeg', 'webp')
+RENDITION_QUALITY = 82
+RENDITION_WORKERS = min(4, os.cpu_count() or 1)
+# Ширина карточки товара в списке (300px на экранах с плотностью 2x)
+CARD_WIDTH = 640
+
+def needs_renditions(image):
+    return bool(image.image_url) and image.renditions.get('source') != image.image_url.name
+
+
+def pending_images(model):
+    """Изображения без вариантов для текущего файла — то же, что needs_renditions, в SQL."""
+    return model.objects.exclude(image_url='').filter(
+        Q(renditions__source__isnull=True) | ~Q(renditions__source=F('image_url'))).order_by('pk')
+
+
+def rendition_name(name, width, image_format):
+    directory, filename = os.path.split(name)
+    stem = os.path.splitext(filename)[0]
+    return os.path.join(directory, 'renditions', f'{stem}-{width}w.{image_format}')
+
+
+def read_source(image):
+    with image.image_url.storage.open(image.image_url.name, 'rb') as f:
+        return f.read()
+
+
+def submit(image, executor):
+    """Отправляет изображение в пул процессов, возвращает Future."""
+    return executor.submit(render_renditions, read_source(image), RENDITION_WIDTHS,
+                           RENDITION_FORMATS, RENDITION_QUALITY)
+
+
+def save_renditions(model, pk, source, result):
+    """Сохраняет файлы вариантов и записывает их в модель, если оригинал не сменился."""
+    current = model.objects.filter(pk=pk, image_url=source)
+    if not current.exists():
+        return False
+    storage = model._meta.get_field('image_url').storage
+    renditions = {'source': source, 'width': result['width'], 'height': result['height']}
+    for image_format, files in result['files'].items():
+        renditions[image_format] = {
+            str(width): storage.save(rendition_name(source, width, image_format), ContentFile(data))
+            for width, data in files.items()
+        }
+    # Старые варианты не удаляются: файлы с хэшем в имени могут быть общими,
+    # их убирает сборщик неиспользуемых файлов.
+    # UPDATE без save(): сигналы каталога не отправляются, кэши сбрасываются точечно
+    if not current.update(renditions=renditions):
+        return False
+    images_changed(model, [pk])
+    return True
+
+
+def render_images(images, executor, max_pending):
+    """
+    Создаёт варианты для изображений в пуле процессов. В работе не больше
+    max_pending задач: файлы читаются по мере обработки.
+    Возвращает (создано, [(модель, pk) изображений с ошибкой]).
+    """
+    pending = {}
+    created, failed = 0, []
+
+    def collect():
+        nonlocal created
+        done, _ = wait(pending, return_when=FIRST_COMPLETED)
+        for future in done:
+            model, pk, source = pending.pop(future)
+            try:
+                if save_renditions(model, pk, source, future.result()):
+                    created += 1
+            except Exception:
+                logger.exception('Не удалось создать варианты изображения %s', source)
+                failed.append((model, pk))
+
+    for image in images:
+        while len(pending) >= max_pending:
+            collect()
+        try:
+            future = submit(image, executor)
+        except OSError:
+            logger.exception('Не удалось прочитать изображение %s', image.image_url.name)
+            failed.append((type(image), image.pk))
+            continue
+        pending[future] = (type(image), image.pk, image.image_url.name)
+    while pending:
+        collect()
+    return created, failed
+
+
+def rendition_url(image, width, image_format='jpeg'):
+    """URL наименьшего варианта не уже width, иначе самого большого, иначе оригинала."""
+    variants = image.renditions.get(image_format) if image.renditions.get('source') == image.image_url.name else None
+    if not variants:
+        return image.image_url.url
+    widths = sorted(int(variant_width) for variant_width in variants)
+    chosen = next((variant_width for variant_width in widths if variant_width >= width), widths[-1])
+    return image.image_url.storage.url(variants[str(chosen)])
+
+
+def source_format(image):
+    extension = os.path.splitext(image.image_url.name)[1].lower().lstrip('.')
+    return 'jpeg' if extension == 'jpg' else extension
+
+
+def srcset(image, request=None):
+    """
+    {'jpeg': 'url 320w, ...', 'webp': ...} или None, пока вариантов нет.
+    Формат без единого варианта (маленький оригинал другого формата) пропускается.
+    """
+    if not image.image_url or image.renditions.get('source') != image.image_url.name:
+        return None
+    storage = image.image_url.storage
+    result = {}
+    for image_format in RENDITION_FORMATS:
+        variants = image.renditions.get(image_format) or {}
+        entries = []
+        for variant_width in sorted(variants, key=int):
+            url = storage.url(variants[variant_width])
+            entries.append(f'{request.build_absolute_uri(url) if request else url} {variant_width}w')
+        if image_format == 'jpeg' or image_format == source_format(image):
+            # Оригинал — самый широкий вариант: в своём формате и в jpeg,
+            # наборе для <img>, который понимают все браузеры
+            url = image.image_url.url
+            entries.append(f"{request.build_absolute_uri(url) if request else url} {image.renditions['width']}w")
+        if entries:
+            result[image_format] = ', '.join(entries)
+    return result
+
+
+def card_image_url(image, request=None, width=CARD_WIDTH):
+    if image is None or not image.image_url:
+        return None
+    url = rendition_url(image, width)
+    return request.build_absolute_uri(url) if request else url
@@ -0,0 +1,166 @@
+import logging
+import re
+from functools import lru_cache
+
+from django.db import connection
+from django.db.models.expressions import RawSQL
+from rest_framework import filters
+
+from .models import Product
+
+try:
+    import pymorphy3
+except ImportError:
+    pymorphy3 = None
+
+logger = logging.getLogger(__name__)
+
+FTS_TABLE = 'store_product_fts'
+SEARCH_FIELDS = ('product_name', 'description', 'model_parameters', 'details', 'care')
+# Веса полей для bm25() в порядке SEARCH_FIELDS
+FIELD_WEIGHTS = (10.0, 2.0, 1.0, 1.0, 1.0)
+
+WORD_RE = re.compile(r'\w+')
+
+_morph = None
+_index_exists = False
+
+
+def get_morph():
+    global _morph
+    if _morph is None:
+        if pymorphy3 is None:
+            logger.error('pymorphy3 не установлен: поиск работает без лемматизации')
+            _morph = False
+        else:
+            try:
+                _morph = pymorphy3.MorphAnalyzer()
+            except Exception:
+                # Без словарей ищем по словам в нижнем регистре
+                logger.exception('Не удалось загрузить pymorphy3: поиск работает без лемматизации')
+                _morph = False
+    return _morph or None
+
+
+@lru_cache(maxsize=100000)
+def lemmatize_word(word):
+    word = word.lower()
+    morph = get_morph()
+    if morph is None:
+        return word
+    return morph.parse(word)[0].normal_form
+
+
+def lemmatize(text):
+    return ' '.join(lemmatize_word(word) for word in WORD_RE.findall(text or ''))
+
+
+def is_supported():
+    return connection.vendor == 'sqlite'
+
+
+def index_exists():
+    global _index_exists
+    if not _index_exists and is_supported():
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT 1 FROM sqlite_master WHERE name = %s', [FTS_TABLE])
+            _index_exists = cursor.fetchone() is not None
+    return _index_exists
+
+
+def create_index():
+    """
+    Создаёт таблицу FTS5, если её нет. Вызывается после migrate (post_migrate)
+    и командой rebuild_search_index; возвращает True, если таблица создана.
+    """
+    global _index_exists
+    if index_exists():
+        return False
+    with connection.cursor() as cursor:
+        cursor.execute(
+            'CREATE VIRTUAL TABLE %s USING fts5(%s, tokenize="unicode61 remove_diacritics 2")'
+            % (FTS_TABLE, ', '.join(SEARCH_FIELDS))
+        )
+    _index_exists = True
+    return True
+
+
+def index_products(products):
+    # Без таблицы (migrate ещё не выполнен) индекс заполнит rebuild_search_index
+    if not index_exists():
+        return
+    rows = [
+        [product.pk] + [lemmatize(getattr(product, field)) for field in SEARCH_FIELDS]
+        for product in products
+    ]
+    if not rows:
+        return
+    with connection.cursor() as cursor:
+        cursor.executemany('DELETE FROM %s WHERE rowid = %%s' % FTS_TABLE, [[row[0]] for row in rows])
+        cursor.executemany(
+            'INSERT INTO %s (rowid, %s) VALUES (%s)'
+            % (FTS_TABLE, ', '.join(SEARCH_FIELDS), ', '.join(['%s'] * (len(SEARCH_FIELDS) + 1))),
+            rows,
+        )
+
+
+def remove_products(product_ids):
+    if not index_exists():
+        return
+    with connection.cursor() as cursor:
+        cursor.executemany('DELETE FROM %s WHERE rowid = %%s' % FTS_TABLE, [[pk] for pk in product_ids])
+
+
+def rebuild_index(queryset=None, chunk_size=500):
+    if queryset is None:
+        queryset = Product.objects.all()
+    create_index()
+    with connection.cursor() as cursor:
+        cursor.execute('DELETE FROM %s' % FTS_TABLE)
+    batch = []
+    total = 0
+    for product in queryset.only('pk', *SEARCH_FIELDS).iterator(chunk_size=chunk_size):
+        batch.append(product)
+        if len(batch) >= chunk_size:
+            index_products(batch)
+            total += len(batch)
+            batch = []
+    index_products(batch)
+    return total + len(batch)
+
+
+def build_match_query(search_terms):
+    lemmas = [lemmatize_word(word) for term in search_terms for word in WORD_RE.findall(term)]
+    # Каждая лемма — префиксный запрос в кавычках, все леммы должны найтись (AND)
+    return ' '.join('"%s"*' % lemma for lemma in lemmas)
+
+
+def search_queryset(queryset, search_terms):
+    match = build_match_query(search_terms)
+    if not match:
+        return queryset.none()
+    table = connection.ops.quote_name(FTS_TABLE)
+    pk = '%s.%s' % (connection.ops.quote_name(Product._meta.db_table),
+                    connection.ops.quote_name(Product._meta.pk.column))
+    # Соединение с таблицей FTS5: MATCH вычисляется один раз на запрос, в выборку
+    # попадают все совпадения — количество и страницы точные
+    queryset = queryset.extra(
+        tables=[FTS_TABLE], where=['%s.rowid = %s' % (table, pk), '%s MATCH %%s' % table], params=[match])
+    if not queryset.ordered:
+        # Без явной сортировки — по релевантности (меньше bm25 — лучше), затем по id
+        rank = RawSQL('bm25(%s, %s)' % (table, ', '.join(str(weight) for weight in FIELD_WEIGHTS)), ())
+        queryset = queryset.order_by(rank, 'pk')
+    return queryset
+
+
+class ProductSearchFilter(filters.SearchFilter):
+    """
+    Полнотекстовый поиск по FTS5-индексу лемм с ранжированием bm25.
+    На других СУБД и до создания индекса работает как обычный SearchFilter.
+    """
+
+    def filter_queryset(self, request, queryset, view):
+        search_terms = self.get_search_terms(request)
+        if not search_terms or not index_exists():
+            return super().filter_queryset(request, queryset, view)
+        return search_queryset(queryset, search_terms)
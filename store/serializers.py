@@ -1,12 +1,21 @@
+from django.db.models import Manager, prefetch_related_objects
 from rest_framework import serializers
 
 from .models import Product, ProductImage, ImageCollection, Collection, Menu, Size, Category, ProductColor, Color, Order, PaymentRecord
+from .utils import attach_primary_images, get_primary_image
+from .variants import VariantMatrix
+from .renditions import card_image_url, srcset
 
 
 class ImageCollectionSerializer(serializers.ModelSerializer):
+    srcset = serializers.SerializerMethodField()
+
     class Meta:
         model = ImageCollection
-        fields = ['id', 'image_url']
+        fields = ['id', 'image_url', 'srcset', 'dominant_color', 'placeholder']
+
+    def get_srcset(self, obj):
+        return srcset(obj, self.context.get('request'))
 
     def get_image(self, obj):
         if 'request' in self.context:
@@ -29,10 +38,9 @@ class CollectionNameSerializer(serializers.ModelSerializer):
     image = serializers.SerializerMethodField()
 
     def get_image(self, obj):
-        first_image = obj.images.first()
-        first_image_serializer = ImageProductSerializer(
-            first_image, context={'request': self.context.get('request')})
-        return first_image_serializer.data['image_url']
+        # Берём из images.all(), чтобы использовать prefetch_related('images')
+        first_image = min(obj.images.all(), key=lambda image: image.pk, default=None)
+        return card_image_url(first_image, self.context.get('request'))
 
     class Meta:
         model = Collection
@@ -45,6 +53,9 @@ class CategorySerializer(serializers.ModelSerializer):
         fields = ['id', 'category_name']
 
 
+MENU_NAMES = dict(Menu.CHOICES)
+
+
 class MenuSerializer(serializers.ModelSerializer):
     menu_name = serializers.SerializerMethodField()
     categories = serializers.SerializerMethodField()
@@ -54,7 +65,7 @@ class MenuSerializer(serializers.ModelSerializer):
         fields = ['id', 'menu_name', 'categories']
 
     def get_menu_name(self, obj):
-        return dict(Menu.CHOICES).get(obj.menu_name)
+        return MENU_NAMES.get(obj.menu_name)
 
     def get_categories(self, obj):
         categories = obj.menu_item.all()
@@ -68,10 +79,11 @@ class SizeChoiceField(serializers.MultipleChoiceField):
 
 class ImageProductSerializer(serializers.ModelSerializer):
     image_url = serializers.SerializerMethodField()
+    srcset = serializers.SerializerMethodField()
 
     class Meta:
         model = ProductImage
-        fields = '__all__'
+        fields = ['id', 'image_url', 'srcset', 'dominant_color', 'placeholder']
 
     def get_image_url(self, obj):
         if 'request' in self.context:
@@ -80,6 +92,9 @@ class ImageProductSerializer(serializers.ModelSerializer):
             return request.build_absolute_uri(image_url)
         return None
 
+    def get_srcset(self, obj):
+        return srcset(obj, self.context.get('request'))
+
 
 class SizeSerializer(serializers.ModelSerializer):
     class Meta:
@@ -123,47 +138,81 @@ class ProductColorSerializer(serializers.ModelSerializer):
         fields = ['id', 'images', 'color']
 
 
-class RelatedProductSerializer(serializers.ModelSerializer):
+class ProductListSerializer(serializers.ListSerializer):
+    # Коллекции и первые изображения подгружаются сразу для всей страницы
+    def to_representation(self, data):
+        iterable = data.all() if isinstance(data, Manager) else data
+        products = list(iterable)
+        prefetch_related_objects(products, 'collection')
+        attach_primary_images(products)
+        return super().to_representation(products)
+
+
+def image_srcset(image, request=None):
+    return srcset(image, request) if image else None
+
+
+def image_color(image, request=None):
+    return image.dominant_color or None if image else None
+
+
+def image_placeholder(image, request=None):
+    return image.placeholder or None if image else None
+
+
+# Поля первого изображения в карточке товара: имя поля -> значение по
+# изображению и запросу. Общие для сериализаторов и ProductNameProjection
+PRIMARY_IMAGE_FIELDS = {
+    # Вариант под ширину карточки, пока его нет — оригинал
+    'image': card_image_url,
+    'image_srcset': image_srcset,
+    'image_color': image_color,
+    'image_placeholder': image_placeholder,
+}
+
+
+def primary_image_fields(image, request=None):
+    return {name: value(image, request) for name, value in PRIMARY_IMAGE_FIELDS.items()}
+
+
+class PrimaryImageField(serializers.ReadOnlyField):
+    """Поле первого изображения товара из PRIMARY_IMAGE_FIELDS по имени поля."""
+
+    def __init__(self, **kwargs):
+        super().__init__(source='*', **kwargs)
+
+    def to_representation(self, obj):
+        return PRIMARY_IMAGE_FIELDS[self.field_name](get_primary_image(obj), self.context.get('request'))
+
+
+class PrimaryImageFieldsMixin(serializers.Serializer):
+    image = PrimaryImageField()
+    image_srcset = PrimaryImageField()
+    image_color = PrimaryImageField()
+    image_placeholder = PrimaryImageField()
+
+
+class RelatedProductSerializer(PrimaryImageFieldsMixin, serializers.ModelSerializer):
     collection_name = serializers.CharField(
         source='collection.collection_name', read_only=True)
-    image = serializers.SerializerMethodField()
 
     class Meta:
         model = Product
-        fields = ['id', 'collection_name', 'product_name', 'price', 'image']
-
-    def get_image(self, obj):
-        first_image = obj.productcolors.first().images.first(
-        ) if obj.productcolors.exists() else None
-        if first_image:
-            image_url = first_image.image_url.url
-            request = self.context.get('request')
-            if request:
-                return request.build_absolute_uri(image_url)
-            return image_url
-        return None
+        fields = ['id', 'collection_name', 'product_name', 'price', 'image', 'image_srcset',
+                  'image_color', 'image_placeholder']
+        list_serializer_class = ProductListSerializer
 
 
 
-class ProductNameSerializer(serializers.ModelSerializer):
+class ProductNameSerializer(PrimaryImageFieldsMixin, serializers.ModelSerializer):
     collection_name = serializers.CharField(
         source='collection.collection_name', read_only=True)
-    image = serializers.SerializerMethodField()
 
     class Meta:
         model = Product
-        fields = ['id', 'image', 'collection_name', 'product_name', 'price', ]
-
-    def get_image(self, obj):
-        first_image = obj.productcolors.first().images.first(
-        ) if obj.productcolors.exists() else None
-        if first_image:
-            image_url = first_image.image_url.url
-            request = self.context.get('request')
-            if request:
-                return request.build_absolute_uri(image_url)
-            return image_url
-        return None
+        fields = ['id', 'image', 'image_srcset', 'image_color', 'image_placeholder',
+                  'collection_name', 'product_name', 'price', ]
+        list_serializer_class = ProductListSerializer
 
 
 class ProductSerializer(serializers.ModelSerializer):
@@ -175,40 +224,12 @@ class ProductSerializer(serializers.ModelSerializer):
     colors = serializers.SerializerMethodField()
     
     def get_views(self, obj):
-        # Получение количества просмотров с учетом уникальных IP-адресов
-        return obj.views.values('ip').distinct().count()
+        # Оценка уникальных IP-адресов, обновляется пакетами (store.view_counter)
+        return obj.views_count
 
     def get_colors(self, obj):
-        color_data = []
-        processed_colors = set()
-
-        for product_color in obj.productcolors.select_related('color', 'size').order_by('color__id'):
-            color_id = product_color.color.id
-
-            if color_id not in processed_colors:
-                color_images = product_color.images.all()  # Get all images for this color
-                image_data = ImageProductSerializer(color_images, many=True, context=self.context).data
-
-                color_data.append({
-                    'id': product_color.color.id,
-                    'color_hex': product_color.color.color_hex,
-                    'color_name': product_color.color.color_name,
-                    'sizes': [],
-                    'images': image_data,  # Include images in the color data
-                })
-                processed_colors.add(color_id)
-
-            for existing_color in color_data:
-                if existing_color['id'] == color_id:
-                    if product_color.size:
-                        existing_color['sizes'].append({
-                            'size': {'id': product_color.size.id, 'name': product_color.size.name},
-                            'quantity': product_color.quantity
-                        })
-
-        return color_data
-
-
+        return VariantMatrix.for_product(obj).to_representation(
+            ImageProductSerializer, context=self.context)
 
     def get_instructions(self, obj):
         instructions = {
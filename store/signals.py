@@ -1,12 +1,20 @@
-from django.db.models.signals import post_save
+from django.db.models.signals import post_save, post_delete, pre_delete, m2m_changed, post_migrate
 from django.dispatch import receiver
-from django.core.mail import send_mail
+from django.db import DEFAULT_DB_ALIAS, transaction
 from django.template.loader import render_to_string
 from decouple import config
 from rest_framework.response import Response
 from django.db.models.signals import pre_save
 
-from .models import Order
+from .models import Order, Product, ProductColor, ProductImage, Collection, ImageCollection, Category, Menu, Color, Size
+from .home import invalidate_home_page
+from .recommendations import affected_products, schedule_update
+from .search import create_index as create_search_index, index_products, is_supported as search_supported, remove_products
+from .suggest import schedule_rebuild as schedule_suggest_rebuild
+from .catalog_index import schedule_rebuild as schedule_catalog_index_rebuild
+from .versions import bump_versions, version_key
+from . import list_cache, renditions, mail_queue
+from .tracking import fields_changed
 
 # Сигнал для создания заказа
 @receiver(post_save, sender=Order)
@@ -32,20 +40,15 @@ def order_created(sender, instance, created, **kwargs):
         from_email = config('EMAIL_HOST_USER') # Замените на ваш адрес отправителя
         recipient_list = [instance.email]  # Это должен быть адрес электронной почты пользователя
 
-        send_mail(subject, message, from_email, recipient_list)
+        # Письмо уходит из очереди (send_queued_emails), а не внутри Order.save()
+        mail_queue.enqueue(subject, message, recipient_list, from_email)
 
-@receiver(pre_save, sender=Order)
-def order_data_delivery_updated(sender, instance, **kwargs):
-    if instance._state.adding or instance._state.db is None:
-        # Объект создается, а не обновляется
-        return
-
-    try:
-        old_order = Order.objects.get(pk=instance.pk)
-    except Order.DoesNotExist:
-        return
 
-    if old_order.delivery_date != instance.delivery_date:
+# Изменения полей приходят из FieldTracker (store.tracking) — после save()
+# и после tracking.bulk_update(), без повторного чтения заказа из базы
+@receiver(fields_changed, sender=Order)
+def order_data_delivery_updated(sender, instance, changed_fields, **kwargs):
+    if 'delivery_date' in changed_fields:
         # Поле data_delivery было изменено
         subject = 'Изменение даты доставки'
         message = f'Номер заказа: {instance.order_number}\n\n' \
@@ -68,4 +71,228 @@ def order_data_delivery_updated(sender, instance, **kwargs):
         from_email =  config('EMAIL_HOST_USER')  # Замените на ваш адрес отправителя
         recipient_list = [instance.email]  # Это должен быть адрес электронной почты пользователя
 
-        send_mail(subject, message, from_email, recipient_list)
+        # Письмо уходит из очереди (send_queued_emails), а не внутри Order.save()
+        mail_queue.enqueue(subject, message, recipient_list, from_email)
+
+
+# Снимок главной страницы пересобирается только после изменения каталога
+@receiver(post_save, sender=Product)
+@receiver(post_delete, sender=Product)
+@receiver(post_save, sender=ProductColor)
+@receiver(post_delete, sender=ProductColor)
+@receiver(post_save, sender=ProductImage)
+@receiver(post_delete, sender=ProductImage)
+@receiver(post_save, sender=Collection)
+@receiver(post_delete, sender=Collection)
+@receiver(post_save, sender=ImageCollection)
+@receiver(post_delete, sender=ImageCollection)
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+@receiver(m2m_changed, sender=Product.category.through)
+@receiver(m2m_changed, sender=ProductColor.images.through)
+@receiver(m2m_changed, sender=Collection.images.through)
+def home_page_catalog_changed(sender, **kwargs):
+    invalidate_home_page()
+
+
+# Рекомендации пересчитываются только для затронутых товаров
+@receiver(post_save, sender=Product)
+@receiver(pre_delete, sender=Product)
+def product_recommendations_changed(sender, instance, **kwargs):
+    schedule_update(affected_products([instance.pk]))
+
+
+@receiver(m2m_changed, sender=Product.category.through)
+def product_categories_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    if action == 'pre_clear':
+        # После очистки pk_set пуст, а товаров категории уже не найти
+        if reverse:
+            instance._recommendation_product_ids = set(instance.product_set.values_list('pk', flat=True))
+        else:
+            instance._recommendation_product_ids = {instance.pk}
+        return
+    if action == 'post_clear':
+        product_ids = getattr(instance, '_recommendation_product_ids', set())
+    elif action in ('post_add', 'post_remove'):
+        # reverse: изменены товары категории, instance — категория
+        product_ids = set(pk_set) if reverse else {instance.pk}
+    else:
+        return
+    schedule_update(affected_products(product_ids))
+
+
+# Таблица поиска создаётся после migrate, заполняет её rebuild_search_index
+@receiver(post_migrate)
+def search_index_table(sender, using=DEFAULT_DB_ALIAS, verbosity=1, **kwargs):
+    if sender.label != 'store' or using != DEFAULT_DB_ALIAS or not search_supported():
+        return
+    if create_search_index() and verbosity >= 1:
+        print('Создана таблица полнотекстового поиска: заполните её командой rebuild_search_index')
+
+
+# Поисковый индекс обновляется после фиксации транзакции
+@receiver(post_save, sender=Product)
+def product_search_index_saved(sender, instance, **kwargs):
+    transaction.on_commit(lambda: index_products([instance]))
+
+
+@receiver(post_delete, sender=Product)
+def product_search_index_deleted(sender, instance, **kwargs):
+    product_id = instance.pk
+    transaction.on_commit(lambda: remove_products([product_id]))
+
+
+# Индекс подсказок пересобирается в фоне после изменения названий
+@receiver(post_save, sender=Product)
+@receiver(post_delete, sender=Product)
+@receiver(post_save, sender=Collection)
+@receiver(post_delete, sender=Collection)
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+def suggest_index_changed(sender, **kwargs):
+    schedule_suggest_rebuild()
+
+
+# Индекс каталога для фильтрации списка товаров пересобирается в фоне
+@receiver(post_save, sender=Product)
+@receiver(post_delete, sender=Product)
+@receiver(post_save, sender=ProductColor)
+@receiver(post_delete, sender=ProductColor)
+@receiver(post_save, sender=Collection)
+@receiver(post_delete, sender=Collection)
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+@receiver(post_save, sender=Menu)
+@receiver(post_delete, sender=Menu)
+@receiver(post_save, sender=Color)
+@receiver(post_delete, sender=Color)
+@receiver(post_save, sender=Size)
+@receiver(post_delete, sender=Size)
+@receiver(m2m_changed, sender=Product.category.through)
+@receiver(m2m_changed, sender=Category.menu_item.through)
+def catalog_index_changed(sender, **kwargs):
+    schedule_catalog_index_rebuild()
+
+
+# Версии для ETag каталожных эндпоинтов
+VERSIONED_MODELS = (Product, ProductColor, ProductImage, Collection,
+                    ImageCollection, Category, Menu, Color, Size)
+
+
+def catalog_version_changed(sender, **kwargs):
+    bump_versions([version_key(sender)])
+
+
+# Обработчик подключается только к этим моделям, а не к каждому save() в проекте
+for versioned_model in VERSIONED_MODELS:
+    post_save.connect(catalog_version_changed, sender=versioned_model)
+    post_delete.connect(catalog_version_changed, sender=versioned_model)
+
+
+@receiver(m2m_changed, sender=Product.category.through)
+@receiver(m2m_changed, sender=ProductColor.images.through)
+@receiver(m2m_changed, sender=Collection.images.through)
+@receiver(m2m_changed, sender=Category.menu_item.through)
+def catalog_relation_version_changed(sender, instance, action, model, **kwargs):
+    if action in ('post_add', 'post_remove', 'post_clear'):
+        bump_versions([version_key(type(instance)), version_key(model)])
+
+
+# Сброс кэша списка товаров: теги товара до и после изменения
+@receiver(pre_save, sender=Product)
+@receiver(pre_delete, sender=Product)
+def product_list_cache_before_change(sender, instance, **kwargs):
+    if instance.pk is not None:
+        instance._list_cache_tags = list_cache.product_tags([instance.pk])
+
+
+@receiver(post_save, sender=Product)
+@receiver(post_delete, sender=Product)
+def product_list_cache_changed(sender, instance, **kwargs):
+    tags = getattr(instance, '_list_cache_tags', set())
+    if kwargs.get('signal') is post_save:
+        tags = tags | list_cache.product_tags([instance.pk])
+    list_cache.schedule_invalidation(tags)
+
+
+@receiver(pre_save, sender=ProductColor)
+@receiver(pre_delete, sender=ProductColor)
+def product_color_list_cache_before_change(sender, instance, **kwargs):
+    if instance.pk is None:
+        return
+    if instance.has_loaded('product'):
+        # Товар до изменения известен из снимка FieldTracker
+        product_ids = [instance.previous('product')]
+    else:
+        product_ids = list(ProductColor.objects.filter(pk=instance.pk).values_list('product_id', flat=True))
+    instance._list_cache_tags = list_cache.product_tags(product_ids)
+
+
+@receiver(post_save, sender=ProductColor)
+@receiver(post_delete, sender=ProductColor)
+def product_color_list_cache_changed(sender, instance, **kwargs):
+    tags = getattr(instance, '_list_cache_tags', set())
+    if kwargs.get('signal') is post_save:
+        tags = tags | list_cache.product_tags([instance.product_id])
+    list_cache.schedule_invalidation(tags)
+
+
+@receiver(m2m_changed, sender=Product.category.through)
+def product_category_list_cache_changed(sender, instance, action, pk_set, **kwargs):
+    if isinstance(instance, Product):
+        product_ids = [instance.pk]
+    elif pk_set is not None:
+        product_ids = list(pk_set)
+    else:
+        product_ids = list(instance.product_set.values_list('pk', flat=True))
+    if action in ('pre_add', 'pre_remove', 'pre_clear', 'post_add', 'post_remove'):
+        list_cache.schedule_invalidation(list_cache.product_tags(product_ids))
+
+
+def _image_product_ids(image_ids):
+    return list(ProductColor.images.through.objects.filter(
+        productimage_id__in=image_ids).values_list('productcolor__product_id', flat=True))
+
+
+@receiver(post_save, sender=ProductImage)
+@receiver(pre_delete, sender=ProductImage)
+def product_image_list_cache_changed(sender, instance, **kwargs):
+    # Картинка меняет только вид товара в списке, не состав страниц
+    list_cache.schedule_invalidation(
+        f'product:{product_id}' for product_id in _image_product_ids([instance.pk]))
+
+
+@receiver(m2m_changed, sender=ProductColor.images.through)
+def product_color_images_list_cache_changed(sender, instance, action, pk_set, **kwargs):
+    if action not in ('post_add', 'post_remove', 'pre_clear'):
+        return
+    if isinstance(instance, ProductColor):
+        product_ids = [instance.product_id]
+    else:
+        product_ids = _image_product_ids([instance.pk])
+    list_cache.schedule_invalidation(f'product:{product_id}' for product_id in product_ids)
+
+
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+@receiver(post_save, sender=Collection)
+@receiver(post_delete, sender=Collection)
+@receiver(post_save, sender=Menu)
+@receiver(post_delete, sender=Menu)
+@receiver(post_save, sender=Color)
+@receiver(post_delete, sender=Color)
+@receiver(post_save, sender=Size)
+@receiver(post_delete, sender=Size)
+@receiver(m2m_changed, sender=Category.menu_item.through)
+def catalog_list_cache_changed(sender, **kwargs):
+    list_cache.schedule_invalidation(['catalog'])
+
+
+# Новый файл изображения: цвет и превью будут посчитаны заново; их и
+# уменьшенные копии создаёт команда process_images
+@receiver(pre_save, sender=ProductImage)
+@receiver(pre_save, sender=ImageCollection)
+def image_file_changed(sender, instance, update_fields=None, **kwargs):
+    if update_fields is None and renditions.needs_renditions(instance):
+        instance.dominant_color = ''
+        instance.placeholder = ''
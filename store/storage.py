@@ -0,0 +1,84 @@
+import hashlib
+import os
+import re
+
+from django.core.files import File
+from django.core.files.storage import FileSystemStorage
+from django.core.files.utils import validate_file_name
+from django.utils.deconstruct import deconstructible
+from django.views.static import serve
+
+# Имя файла — SHA-256 содержимого: products/<64 hex>.png.
+# Одинаковые загрузки ложатся в один файл, а содержимое по имени
+# никогда не меняется, поэтому его можно кэшировать навсегда.
+CONTENT_ADDRESSED_RE = re.compile(r'(^|/)[0-9a-f]{64}(\.[0-9a-z]+)?$')
+IMMUTABLE_CACHE_CONTROL = 'public, max-age=31536000, immutable'
+
+
+def is_content_addressed(name):
+    return bool(CONTENT_ADDRESSED_RE.search(name or ''))
+
+
+def file_digest(content):
+    digest = hashlib.sha256()
+    if hasattr(content, 'seek'):
+        content.seek(0)
+    for chunk in content.chunks():
+        digest.update(chunk)
+    if hasattr(content, 'seek'):
+        content.seek(0)
+    return digest.hexdigest()
+
+
+@deconstructible
+class ContentAddressedStorage(FileSystemStorage):
+    """Файловое хранилище с именами по хэшу содержимого и дедупликацией."""
+
+    def hashed_name(self, name, content):
+        directory = os.path.dirname(name)
+        extension = os.path.splitext(name)[1].lower()
+        return os.path.join(directory, file_digest(content) + extension).replace('\\', '/')
+
+    def save(self, name, content, max_length=None):
+        if name is None:
+            name = content.name
+        if not hasattr(content, 'chunks'):
+            content = File(content, name)
+        name = self.hashed_name(name, content)
+        validate_file_name(name, allow_relative_path=True)
+        if self.exists(name):
+            # Файл с таким именем — то же самое содержимое
+            return name
+        return self._save(name, content)
+
+    def get_available_name(self, name, max_length=None):
+        # Вызывается из FileSystemStorage._save, когда файл появился между
+        # проверкой и записью. Другого имени у этого содержимого нет —
+        # ошибка пробрасывается в _save вместо бесконечного повтора
+        raise FileExistsError(name)
+
+    def _save(self, name, content):
+        try:
+            return super()._save(name, content)
+        except FileExistsError:
+            # Тот же файл одновременно сохранил другой процесс
+            return name
+
+    def delete(self, name):
+        # Файл могут использовать другие записи; удаляет только сборщик мусора
+        # по явному запросу (force_delete)
+        pass
+
+    def force_delete(self, name):
+        super().delete(name)
+
+
+content_storage = ContentAddressedStorage()
+
+
+def serve_media(request, path, document_root=None, show_indexes=False):
+    """django.views.static.serve с вечным кэшем для файлов с хэшем в имени."""
+    response = serve(request, path, document_root, show_indexes)
+    if response.status_code == 200 and is_content_addressed(path):
+        response['Cache-Control'] = IMMUTABLE_CACHE_CONTROL
+    return response
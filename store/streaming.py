@@ -0,0 +1,63 @@
+from django.http import StreamingHttpResponse
+from rest_framework.response import Response
+
+from .renderers import ORJSONRenderer
+
+# Потоковая выдача больших списков без пагинации: строки читаются из базы
+# пачками через queryset.iterator(chunk_size), каждая пачка сериализуется и
+# сразу уходит клиенту как кусок JSON-массива. Память на запрос не растёт
+# с размером таблицы, первый байт уходит после первой пачки.
+STREAM_CHUNK_SIZE = 200
+
+
+def iter_batches(queryset, chunk_size=STREAM_CHUNK_SIZE):
+    # prefetch_related вместе с iterator() выполняется для каждой пачки
+    batch = []
+    for obj in queryset.iterator(chunk_size=chunk_size):
+        batch.append(obj)
+        if len(batch) >= chunk_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def iter_json_array(batches, serialize_batch, renderer):
+    yield b'['
+    first = True
+    for batch in batches:
+        items = serialize_batch(batch)
+        if not items:
+            continue
+        chunk = b','.join(renderer.render(item) for item in items)
+        yield chunk if first else b',' + chunk
+        first = False
+    yield b']'
+
+
+class StreamingListMixin:
+    """
+    list() отдаёт StreamingHttpResponse с JSON-массивом. Для Browsable API
+    и других форматов остаётся обычный Response со всем списком в памяти.
+    Ошибка посреди потока обрывает ответ: статус уже отправлен.
+    """
+    stream_chunk_size = STREAM_CHUNK_SIZE
+
+    def get_stream_queryset(self):
+        return self.filter_queryset(self.get_queryset())
+
+    def serialize_batch(self, batch):
+        return self.get_serializer(batch, many=True).data
+
+    def stream_list(self, queryset):
+        request = self.request
+        if getattr(request, 'accepted_renderer', None) is None or request.accepted_renderer.format != 'json':
+            return Response(self.serialize_batch(list(queryset)))
+        batches = iter_batches(queryset, self.stream_chunk_size)
+        return StreamingHttpResponse(
+            iter_json_array(batches, self.serialize_batch, ORJSONRenderer()),
+            content_type='application/json',
+        )
+
+    def list(self, request, *args, **kwargs):
+        return self.stream_list(self.get_stream_queryset())
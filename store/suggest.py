@@ -0,0 +1,209 @@
+import json
+import mmap
+import os
+import re
+import struct
+from array import array
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count
+
+from .models import Product, Collection, Category
+from .utils import DebouncedTask
+
+# Формат файла: заголовок, таблица смещений записей (uint32), записи,
+# отсортированные по ключу: "ключ\tвес\tтип\tid\tназвание\n", и JSON
+# с готовыми лучшими записями для частых префиксов.
+# Файл отображается в память (mmap), поэтому все воркеры делят одни страницы.
+MAGIC = b'SUG2'
+HEADER = struct.Struct('<4sIII')
+
+SUGGESTIONS_LIMIT = 10
+MAX_SUGGESTIONS = 50
+# Префиксы, под которые попадает больше SCAN_LIMIT записей (обычно одна-две
+# буквы), не просматриваются при запросе: для них при сборке сохраняются
+# MAX_SUGGESTIONS лучших записей по весу. Остальные диапазоны не длиннее SCAN_LIMIT.
+SCAN_LIMIT = 2000
+
+WHITESPACE_RE = re.compile(r'\s+')
+WORD_START_RE = re.compile(r'(?:^|\s)(?=\w)')
+
+
+def get_index_path():
+    return os.path.join(settings.STORE_INDEX_DIR, 'suggest.idx')
+
+
+def normalize(text):
+    return WHITESPACE_RE.sub(' ', (text or '').lower().replace('ё', 'е')).strip()
+
+
+def _entries(kind, rows):
+    for object_id, name, weight in rows:
+        label = WHITESPACE_RE.sub(' ', name or '').strip()
+        key = normalize(label)
+        # Подсказка находится по началу любого слова названия
+        for match in WORD_START_RE.finditer(key):
+            suffix = key[match.end():]
+            yield suffix.encode(), weight, kind, object_id, label
+
+
+def _ranked(entries, indexes):
+    # Одна запись на объект, по убыванию веса, затем по названию
+    best = {}
+    for index in indexes:
+        _, weight, kind, object_id, label = entries[index]
+        best.setdefault((kind, object_id), (-weight, label, index))
+    return [index for _, _, index in sorted(best.values())[:MAX_SUGGESTIONS]]
+
+
+def top_records(entries):
+    """{префикс: номера лучших записей} для префиксов с диапазоном длиннее SCAN_LIMIT."""
+    keys = [entry[0].decode() for entry in entries]
+    top = {}
+    ranges = [(0, len(keys))]
+    length = 1
+    while ranges:
+        heavy = []
+        for start, end in ranges:
+            group_start = start
+            while group_start < end:
+                prefix = keys[group_start][:length]
+                if len(prefix) < length:
+                    # Ключ короче length — его префиксы разобраны на прошлых шагах
+                    group_start += 1
+                    continue
+                group_end = group_start + 1
+                while group_end < end and keys[group_end].startswith(prefix):
+                    group_end += 1
+                if group_end - group_start > SCAN_LIMIT:
+                    top[prefix] = _ranked(entries, range(group_start, group_end))
+                    heavy.append((group_start, group_end))
+                group_start = group_end
+        ranges = heavy
+        length += 1
+    return top
+
+
+def build_suggest_index(path=None):
+    path = path or get_index_path()
+    entries = []
+    entries.extend(_entries('product', Product.objects.values_list(
+        'id', 'product_name', 'views_count')))
+    entries.extend(_entries('collection', Collection.objects.annotate(
+        weight=Count('product')).values_list('id', 'collection_name', 'weight')))
+    entries.extend(_entries('category', Category.objects.annotate(
+        weight=Count('product')).values_list('id', 'category_name', 'weight')))
+    entries.sort(key=lambda entry: (entry[0], -entry[1]))
+
+    records = [
+        b'%s\t%d\t%s\t%d\t%s\n' % (key, weight, kind.encode(), object_id, label.encode())
+        for key, weight, kind, object_id, label in entries
+    ]
+    offsets = array('I')
+    position = HEADER.size + offsets.itemsize * len(records)
+    for record in records:
+        offsets.append(position)
+        position += len(record)
+    top = json.dumps(top_records(entries), ensure_ascii=False).encode()
+
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = '%s.%d.tmp' % (path, os.getpid())
+    with open(tmp_path, 'wb') as f:
+        f.write(HEADER.pack(MAGIC, len(records), position, len(top)))
+        offsets.tofile(f)
+        f.writelines(records)
+        f.write(top)
+    # Атомарная замена: читатели видят либо старый, либо новый файл целиком
+    os.replace(tmp_path, path)
+    return len(records)
+
+
+class SuggestIndex:
+    def __init__(self, path):
+        with open(path, 'rb') as f:
+            self._data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, count, top_offset, top_size = HEADER.unpack_from(self._data)
+        if magic != MAGIC:
+            raise ValueError('Неизвестный формат индекса подсказок: %s' % path)
+        self._count = count
+        self._offsets = memoryview(self._data)[
+            HEADER.size:HEADER.size + array('I').itemsize * count].cast('I')
+        self._top = json.loads(self._data[top_offset:top_offset + top_size])
+
+    def _key(self, index):
+        start = self._offsets[index]
+        return self._data[start:self._data.find(b'\t', start)]
+
+    def _record(self, index):
+        start = self._offsets[index]
+        line = self._data[start:self._data.find(b'\n', start)].decode()
+        _, weight, kind, object_id, label = line.split('\t', 4)
+        return int(weight), kind, int(object_id), label
+
+    def _lower_bound(self, prefix):
+        low, high = 0, self._count
+        while low < high:
+            middle = (low + high) // 2
+            if self._key(middle) < prefix:
+                low = middle + 1
+            else:
+                high = middle
+        return low
+
+    def lookup(self, query, limit=SUGGESTIONS_LIMIT):
+        query = normalize(query)
+        if not query:
+            return []
+        found = {}
+        top = self._top.get(query)
+        if top is not None:
+            # Частый префикс: лучшие записи посчитаны при сборке
+            indexes = top[:limit]
+        else:
+            # Диапазон префикса не длиннее SCAN_LIMIT (см. top_records)
+            prefix = query.encode()
+            start = end = self._lower_bound(prefix)
+            while end < self._count and self._key(end).startswith(prefix):
+                end += 1
+            indexes = range(start, end)
+        for index in indexes:
+            weight, kind, object_id, label = self._record(index)
+            found.setdefault((kind, object_id), (weight, label))
+        ranked = sorted(found.items(), key=lambda item: (-item[1][0], item[1][1]))
+        return [
+            {'type': kind, 'id': object_id, 'name': label}
+            for (kind, object_id), (weight, label) in ranked[:limit]
+        ]
+
+
+_index = None
+_index_stat = None
+
+rebuild_task = DebouncedTask(build_suggest_index)
+
+
+def get_index():
+    global _index, _index_stat
+    path = get_index_path()
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        rebuild_task.schedule()
+        return None
+    # Файл заменён другим процессом — открываем новую версию
+    if _index is None or _index_stat != (stat.st_ino, stat.st_mtime_ns):
+        _index = SuggestIndex(path)
+        _index_stat = (stat.st_ino, stat.st_mtime_ns)
+    return _index
+
+
+def suggest(query, limit=SUGGESTIONS_LIMIT):
+    index = get_index()
+    if index is None:
+        return []
+    return index.lookup(query, limit)
+
+
+def schedule_rebuild():
+    transaction.on_commit(rebuild_task.schedule)
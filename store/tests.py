@@ -1,3 +1,1157 @@
-from django.test import TestCase
+import io
+import json
+import os
+import shutil
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from datetime import timedelta
+from unittest import mock
 
-# Create your tests here.
+import httpx
+from asgiref.sync import async_to_sync
+from django.core import mail
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.management import call_command
+from django.db import DatabaseError, connection
+from django.db.models.signals import post_save
+from django.test import TestCase, modify_settings, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from PIL import Image
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
+from rest_framework.test import APIClient, APIRequestFactory
+
+from . import (catalog_index, checkout, fulfilment, home, list_cache, mail_queue, media_gc,
+               navigation, order_numbers, payments, placeholders, recommendations, renditions, search,
+               suggest, tracking)
+from .models import (Category, Collection, Color, ImageCollection, Menu, NumberSequence, Order,
+                     OutboundEmail, PaymentRecord, Product, ProductColor, ProductImage,
+                     ProductRecommendation, ProductView, ProductViewSketch, Size)
+from .projections import (CategoryProjection, CollectionNameProjection, MenuProjection,
+                          ProductNameProjection)
+from .renderers import ORJSONRenderer
+from .serializers import (CategorySerializer, CollectionNameSerializer, CollectionSerializer,
+                          MenuSerializer, ProductNameSerializer)
+from .view_counter import HyperLogLog, ViewCounter, flush_on_exit, merge_sketches, view_counter
+from .management.commands.process_images import Command as ProcessImagesCommand
+from .pagination import ProductKeysetPagination
+from .storage import content_storage
+from .tracking import fields_changed
+from .versions import get_versions, version_key
+from .views import CollectionViewSet
+
+
+def app_queries(queries):
+    """Запросы приложения без служебных запросов django-silk: EXPLAIN и запись в таблицы silk_*."""
+    return [query for query in queries
+            if not query['sql'].startswith('EXPLAIN') and '"silk_' not in query['sql']]
+
+
+# Профилировщик django-silk (core.settings) пишет каждый запрос в свои
+# таблицы; запрос, начатый им в другом тесте, ещё и добавляет EXPLAIN
+@modify_settings(MIDDLEWARE={'remove': ['silk.middleware.SilkyMiddleware']})
+class StoreTestCase(TestCase):
+    """
+    Временные MEDIA_ROOT и STORE_INDEX_DIR, без фоновых пересборок индексов.
+    Количество запросов считается одинаково с django-silk и без него.
+    """
+
+    def setUp(self):
+        super().setUp()
+        for setting in ('MEDIA_ROOT', 'STORE_INDEX_DIR'):
+            directory = tempfile.mkdtemp()
+            self.addCleanup(shutil.rmtree, directory, ignore_errors=True)
+            settings_override = override_settings(**{setting: directory})
+            settings_override.enable()
+            self.addCleanup(settings_override.disable)
+        # get_index() без файла индекса и сигналы каталога запускают пересборку
+        # в фоновом потоке через пару секунд — уже внутри другого теста
+        for task in (catalog_index.rebuild_task, suggest.rebuild_task):
+            patcher = mock.patch.object(task, 'schedule')
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        # Просмотры из запросов к API не копятся в общем счётчике процесса
+        patcher = mock.patch.object(view_counter, 'record')
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    @contextmanager
+    def capture_queries(self):
+        with CaptureQueriesContext(connection) as context:
+            queries = []
+            yield queries
+        queries += app_queries(context.captured_queries)
+
+    @contextmanager
+    def assertNumQueries(self, num):
+        with self.capture_queries() as queries:
+            yield
+        self.assertEqual(len(queries), num, '\n'.join(query['sql'] for query in queries))
+
+
+class ContentAddressedStorageTests(TestCase):
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root, ignore_errors=True)
+        settings_override = override_settings(MEDIA_ROOT=self.media_root)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+    def test_same_content_same_name(self):
+        first = content_storage.save('products/a.PNG', ContentFile(b'image'))
+        second = content_storage.save('products/b.png', ContentFile(b'image'))
+        self.assertEqual(first, second)
+        self.assertRegex(first, r'^products/[0-9a-f]{64}\.png$')
+
+    def test_repeated_save_does_not_write(self):
+        name = content_storage.save('products/a.png', ContentFile(b'image'))
+        path = content_storage.path(name)
+        before = os.stat(path)
+        with mock.patch.object(content_storage, '_save', side_effect=AssertionError('file written')):
+            self.assertEqual(content_storage.save('products/b.png', ContentFile(b'image')), name)
+        after = os.stat(path)
+        self.assertEqual((after.st_ino, after.st_mtime_ns), (before.st_ino, before.st_mtime_ns))
+        self.assertEqual(content_storage.listdir('products')[1], [os.path.basename(name)])
+
+    def test_concurrent_save_returns_existing_name(self):
+        name = content_storage.hashed_name('products/a.png', ContentFile(b'image'))
+        content_storage.save('products/a.png', ContentFile(b'image'))
+        # Файл появился после проверки exists(): запись не повторяется с другим именем
+        self.assertEqual(content_storage._save(name, ContentFile(b'image')), name)
+        self.assertEqual(content_storage.listdir('products')[1], [name.split('/')[1]])
+
+    def test_model_delete_keeps_shared_file(self):
+        first = ProductImage.objects.create(image_url=ContentFile(b'image', name='a.png'))
+        second = ProductImage.objects.create(image_url=ContentFile(b'image', name='b.png'))
+        self.assertEqual(first.image_url.name, second.image_url.name)
+
+        first.image_url.delete(save=False)
+        first.delete()
+
+        self.assertTrue(content_storage.exists(second.image_url.name))
+        with second.image_url.open('rb') as f:
+            self.assertEqual(f.read(), b'image')
+
+    def test_force_delete_removes_file(self):
+        name = content_storage.save('products/a.png', ContentFile(b'image'))
+        content_storage.force_delete(name)
+        self.assertFalse(content_storage.exists(name))
+
+
+class ListCacheIndexRebuildTests(TestCase):
+    def setUp(self):
+        index_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, index_dir, ignore_errors=True)
+        settings_override = override_settings(STORE_INDEX_DIR=index_dir)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        list_cache.get_cache().clear()
+        list_cache.pop_index_rebuild_tags()
+        self.request = Request(APIRequestFactory().get('/api/products/', {'menu': 'women'}))
+
+    def cache_page(self):
+        versions = list_cache.get_tag_versions(list_cache.request_tags(self.request))
+        list_cache.set_page(self.request, {'results': []}, versions)
+
+    def test_page_cached_before_index_rebuild_is_invalidated(self):
+        self.cache_page()
+        with self.captureOnCommitCallbacks(execute=True):
+            list_cache.schedule_invalidation(['menu:women'])
+        self.assertIsNone(list_cache.get_page(self.request))
+
+        # Запрос между коммитом и пересборкой видит старый индекс
+        self.cache_page()
+        self.assertIsNotNone(list_cache.get_page(self.request))
+
+        catalog_index.rebuild_catalog_index()
+        self.assertIsNone(list_cache.get_page(self.request))
+
+        # После пересборки страница кэшируется как обычно
+        self.cache_page()
+        self.assertIsNotNone(list_cache.get_page(self.request))
+        catalog_index.rebuild_catalog_index()
+        self.assertIsNotNone(list_cache.get_page(self.request))
+
+
+class HomePageCacheTests(StoreTestCase):
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+        self.request = APIRequestFactory().get('/api/home/')
+
+    def test_cached_page_checks_shared_generation(self):
+        first = home.get_home_page(self.request)
+        # Снимок из кэша процесса: только чтение поколения
+        with self.assertNumQueries(1):
+            self.assertEqual(home.get_home_page(self.request), first)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Collection.objects.create(collection_name='Лето', video_url='https://example.com/v')
+        page = home.get_home_page(self.request)
+        self.assertEqual([item['collection_name'] for item in page['all_collections']], ['Лето'])
+
+    def test_generation_bumped_by_other_process(self):
+        home.get_home_page(self.request)
+        # Другой процесс меняет каталог: его сигналы не трогают наш кэш
+        Collection.objects.bulk_create([Collection(collection_name='Осень', video_url='https://example.com/v')])
+        self.assertEqual(home.get_home_page(self.request)['all_collections'], [])
+        home.bump_versions([home.HOME_PAGE_VERSION_KEY])
+        self.assertEqual(len(home.get_home_page(self.request)['all_collections']), 1)
+
+
+class NavigationTests(StoreTestCase):
+    def setUp(self):
+        super().setUp()
+        self.menu = Menu.objects.create(menu_name='women')
+        self.category = Category.objects.create(category_name='Платья')
+        self.category.menu_item.add(self.menu)
+
+    def menu_categories(self):
+        return [category['name'] for category in APIClient().get('/api/menu/').json()[0]['categories']]
+
+    def test_snapshot_reused_while_versions_match(self):
+        snapshot = navigation.get_snapshot()
+        # Только чтение версий, снимок не перестраивается
+        with self.assertNumQueries(1):
+            self.assertIs(navigation.get_snapshot(), snapshot)
+        # Коллекции в навигацию не входят
+        Collection.objects.create(collection_name='Лето')
+        self.assertIs(navigation.get_snapshot(), snapshot)
+
+    def test_category_change_invalidates_snapshot(self):
+        self.assertEqual(self.menu_categories(), ['Платья'])
+        self.category.category_name = 'Платья и сарафаны'
+        self.category.save()
+        self.assertEqual(self.menu_categories(), ['Платья и сарафаны'])
+        self.assertEqual(APIClient().get(f'/api/category/{self.category.pk}/').json()['category_name'],
+                         'Платья и сарафаны')
+
+        Category.objects.create(category_name='Юбки').menu_item.add(self.menu)
+        self.assertEqual(self.menu_categories(), ['Платья и сарафаны', 'Юбки'])
+        self.category.menu_item.remove(self.menu)
+        self.assertEqual(self.menu_categories(), ['Юбки'])
+
+
+class StreamingListTests(StoreTestCase):
+    def setUp(self):
+        super().setUp()
+        for number in range(5):
+            collection = Collection.objects.create(collection_name=f'Коллекция {number}',
+                                                   video_url='https://video.example/1')
+            collection.images.add(ImageCollection.objects.create(
+                image_url=ContentFile(f'image {number}'.encode(), name='a.png'), dominant_color='#112233'))
+
+    def expected(self):
+        request = Request(APIRequestFactory().get('/api/collection/'))
+        data = CollectionSerializer(CollectionViewSet.queryset.all(), many=True, context={'request': request}).data
+        return json.loads(JSONRenderer().render(data))
+
+    def streamed(self):
+        response = APIClient().get('/api/collection/', HTTP_ACCEPT='application/json')
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        return json.loads(b''.join(response.streaming_content))
+
+    def test_stream_matches_serializer_output(self):
+        # Пачки по 2: ответ склеивается из нескольких кусков массива
+        with mock.patch.object(CollectionViewSet, 'stream_chunk_size', 2):
+            data = self.streamed()
+        self.assertEqual(len(data), 5)
+        self.assertEqual(data, self.expected())
+
+    def test_empty_stream_is_empty_array(self):
+        Collection.objects.all().delete()
+        self.assertEqual(self.streamed(), [])
+
+
+class CatalogVersionTests(StoreTestCase):
+    url = '/api/colors&sizes/'
+
+    def test_only_etag_answers_304(self):
+        Size.objects.create(name='M')
+        response = APIClient().get(self.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('Last-Modified', response)
+        etag = response['ETag']
+        self.assertEqual(APIClient().get(self.url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        # Без If-None-Match время не сравнивается
+        response = APIClient().get(self.url, HTTP_IF_MODIFIED_SINCE='Fri, 01 Jan 2100 00:00:00 GMT')
+        self.assertEqual(response.status_code, 200)
+
+    def test_versioned_model_change_updates_etag(self):
+        etag = APIClient().get(self.url)['ETag']
+        Size.objects.create(name='XL')
+        # Правка в ту же секунду: ETag всё равно другой
+        response = APIClient().get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_other_models_do_not_bump_versions(self):
+        OutboundEmail.objects.create(subject='s', body='b', from_email='shop@example.com', recipients=['a@example.com'])
+        self.assertEqual(get_versions([version_key(OutboundEmail)]), {})
+
+
+def make_product(name, **kwargs):
+    fields = dict(price=1000, delivery_info='', sku='SKU', model_parameters='', description='')
+    fields.update(kwargs)
+    return Product(product_name=name, **fields)
+
+
+class ProductSearchTests(TestCase):
+    def test_lemmatizes_russian_words(self):
+        self.assertIsNotNone(search.get_morph())
+        self.assertEqual(search.lemmatize('Летние платья'), 'летний платье')
+
+    def test_name_match_ranks_first(self):
+        Product.objects.bulk_create([
+            make_product('Блузка', description='Носится с платьем'),
+            make_product('Платье летнее'),
+        ])
+        search.rebuild_index()
+        names = search.search_queryset(Product.objects.all(), ['платья']).values_list('product_name', flat=True)
+        self.assertEqual(list(names), ['Платье летнее', 'Блузка'])
+
+    def test_returns_all_matches(self):
+        Product.objects.bulk_create([make_product(f'Платье {number}') for number in range(1100)])
+        Product.objects.bulk_create([make_product('Юбка')])
+        search.rebuild_index()
+        self.assertEqual(search.search_queryset(Product.objects.all(), ['платье']).count(), 1100)
+        self.assertEqual(search.search_queryset(Product.objects.all(), ['юбки']).count(), 1)
+
+
+@mock.patch.object(ProductKeysetPagination, 'page_size', 2)
+class KeysetPaginationTests(StoreTestCase):
+    def setUp(self):
+        super().setUp()
+        list_cache.get_cache().clear()
+        start = timezone.now()
+        # Одинаковые цены: порядок внутри цены задаёт дата, затем id
+        for number, (price, days) in enumerate([(100, 1), (200, 3), (100, 2), (200, 1), (100, 2), (300, 0)]):
+            product = make_product(f'Товар {number}', price=price)
+            product.save()
+            Product.objects.filter(pk=product.pk).update(date=start - timedelta(days=days))
+
+    def walk(self, **params):
+        ids, cursor = [], None
+        while True:
+            query = dict(params, pagination='cursor', **({'cursor': cursor} if cursor else {}))
+            response = APIClient().get('/api/product/', query)
+            self.assertEqual(response.status_code, 200)
+            ids += [item['id'] for item in response.json()['results']]
+            if not response.json()['next']:
+                return ids
+            cursor = response.json()['next'].split('cursor=')[1].split('&')[0]
+
+    def test_cursor_follows_every_ordering_field(self):
+        expected = list(Product.objects.order_by('price', '-date', 'id').values_list('id', flat=True))
+        self.assertEqual(self.walk(ordering='price,-date'), expected)
+        expected = list(Product.objects.order_by('-price', 'date', '-id').values_list('id', flat=True))
+        self.assertEqual(self.walk(ordering='-price,date'), expected)
+
+    def test_cursor_from_other_ordering_is_rejected(self):
+        response = APIClient().get('/api/product/', {'pagination': 'cursor', 'ordering': 'price'})
+        cursor = response.json()['next'].split('cursor=')[1].split('&')[0]
+        response = APIClient().get('/api/product/', {'cursor': cursor, 'ordering': '-date'})
+        self.assertEqual(response.status_code, 404)
+
+    def test_views_count_ordering_uses_cursor(self):
+        for views_count, product in zip([5, 0, 5, 7, 0, 5], Product.objects.order_by('pk')):
+            Product.objects.filter(pk=product.pk).update(views_count=views_count)
+        expected = list(Product.objects.order_by('-views_count', '-id').values_list('id', flat=True))
+        self.assertEqual(self.walk(ordering='views_count'), expected)
+
+
+class FacetTests(StoreTestCase):
+    def setUp(self):
+        super().setUp()
+        category = Category.objects.create(category_name='Платья')
+        collection = Collection.objects.create(collection_name='Лето')
+        white = Color.objects.create(color_name='Белый', color_hex='#FFFFFF')
+        black = Color.objects.create(color_name='Чёрный', color_hex='#000000')
+        self.colors = {'Белый': white.pk, 'Чёрный': black.pk}
+        medium = Size.objects.create(name='M')
+        large = Size.objects.create(name='L')
+        variants = {
+            'Платье': [(white, medium)],
+            'Платье в пол': [(black, medium), (black, large)],
+            'Сарафан': [(white, large)],
+        }
+        for name, product_variants in variants.items():
+            product = make_product(name, collection=collection if name == 'Сарафан' else None)
+            product.save()
+            if name != 'Сарафан':
+                product.category.add(category)
+            for color, size in product_variants:
+                ProductColor.objects.create(product=product, color=color, size=size, quantity=1)
+
+    def facets(self, **params):
+        response = APIClient().get('/api/product/facets/', params)
+        self.assertEqual(response.status_code, 200)
+        return {
+            facet: {row.get('name') or row.get('color_name') or row.get('category_name')
+                    or row.get('collection_name'): row['count'] for row in rows}
+            for facet, rows in response.data['facets'].items()
+        }
+
+    def test_counts_without_filters(self):
+        self.assertEqual(self.facets(), {
+            'sizes': {'M': 2, 'L': 2},
+            'colors': {'Белый': 2, 'Чёрный': 1},
+            'categories': {'Платья': 2},
+            'collections': {'Лето': 1},
+        })
+
+    def test_active_facet_ignores_own_filter(self):
+        facets = self.facets(color='Белый')
+        # Остальные цвета остаются доступны для выбора
+        self.assertEqual(facets['colors'], {'Белый': 2, 'Чёрный': 1})
+        self.assertEqual(facets['sizes'], {'M': 1, 'L': 1})
+        self.assertEqual(facets['categories'], {'Платья': 1})
+        self.assertEqual(facets['collections'], {'Лето': 1})
+
+        facets = self.facets(color='Белый', size='M')
+        self.assertEqual(facets['colors'], {'Белый': 1, 'Чёрный': 1})
+        self.assertEqual(facets['sizes'], {'M': 1, 'L': 1})
+        self.assertEqual(facets['categories'], {'Платья': 1})
+        self.assertEqual(facets['collections'], {})
+
+
+@mock.patch.object(recommendations.update_task, 'schedule')
+class RecommendationTests(StoreTestCase):
+    def setUp(self):
+        super().setUp()
+        self.category = Category.objects.create(category_name='Платья')
+        self.first = make_product('Платье')
+        self.first.save()
+        self.first.category.add(self.category)
+        recommendations.update_recommendations([self.first.pk])
+
+    def add_product(self, name):
+        product = make_product(name)
+        with self.captureOnCommitCallbacks(execute=True):
+            product.save()
+            product.category.add(self.category)
+        recommendations.update_pending()
+        return product
+
+    def test_get_recommendations_only_reads(self, schedule):
+        with self.assertNumQueries(1):
+            self.assertEqual(recommendations.get_recommendations(self.first), [])
+        self.assertFalse(ProductRecommendation.objects.exists())
+
+    def test_new_product_enters_neighbours_recommendations(self, schedule):
+        second = self.add_product('Платье в пол')
+        self.assertEqual(recommendations.get_recommendations(self.first), [second])
+        self.assertEqual(recommendations.get_recommendations(second), [self.first])
+        schedule.assert_called()
+
+    def test_changed_recommendations_update_product_etag(self, schedule):
+        key = version_key(Product, self.first.pk)
+        url = f'/api/product/{self.first.pk}/'
+        etag = APIClient().get(url)['ETag']
+        # Пересчёт без изменений не трогает версию товара
+        recommendations.update_recommendations([self.first.pk])
+        self.assertEqual(APIClient().get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+        # Новый товар в категории попадает в рекомендации первого
+        second = make_product('Платье в пол')
+        second.save()
+        second.category.add(self.category)
+        version = get_versions([key]).get(key, (0, None))[0]
+        recommendations.update_recommendations([self.first.pk])
+        self.assertEqual(get_versions([key])[key][0], version + 1)
+        self.assertEqual(APIClient().get(url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_clearing_category_products_updates_them(self, schedule):
+        self.add_product('Платье в пол')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.category.product_set.clear()
+        recommendations.update_pending()
+        self.assertFalse(ProductRecommendation.objects.exists())
+
+    def test_edit_recomputes_only_neighbours_whose_top_can_change(self, schedule):
+        products = [self.first]
+        for number in range(recommendations.RECOMMENDATIONS_COUNT):
+            product = make_product(f'Платье {number}', price=1000 + number)
+            product.save()
+            product.category.add(self.category)
+            products.append(product)
+        recommendations.update_recommendations([product.pk for product in products])
+
+        # Дорогой товар проигрывает всем полным спискам категории
+        outlier = make_product('Платье от кутюр', price=100000)
+        outlier.save()
+        outlier.category.add(self.category)
+        self.assertEqual(recommendations.affected_products([outlier.pk]), {outlier.pk})
+
+        # Товар, который сейчас рекомендуют, пересчитывает своих соседей;
+        # у дорогого товара списка ещё нет, в него проходит любой сосед
+        first = products[1]
+        first.price = 100000
+        first.save()
+        affected = recommendations.affected_products([first.pk])
+        recommending = set(ProductRecommendation.objects.filter(
+            recommended=first).values_list('product_id', flat=True))
+        self.assertTrue(recommending)
+        self.assertEqual(affected, recommending | {first.pk, outlier.pk})
+
+        # Пересчёт затронутых даёт тот же результат, что и пересчёт всех
+        recommendations.update_recommendations(affected | {outlier.pk})
+        partial = sorted(ProductRecommendation.objects.values_list('product_id', 'recommended_id', 'rank'))
+        recommendations.update_recommendations(Product.objects.values_list('pk', flat=True))
+        full = sorted(ProductRecommendation.objects.values_list('product_id', 'recommended_id', 'rank'))
+        self.assertEqual(partial, full)
+
+
+class FakeGateway:
+    """Клиент ЮKassa: ответы по очереди, исключения выбрасываются."""
+
+    def __init__(self, *responses):
+        self.responses = list(responses)
+        self.keys = []
+
+    def create_payment(self, amount, description, return_url, idempotence_key):
+        self.keys.append(idempotence_key)
+        response = self.responses.pop(0)
+        if isinstance(response, Exception):
+            raise response
+        return response
+
+    async def create_payment_async(self, amount, description, return_url, idempotence_key):
+        return self.create_payment(amount, description, return_url, idempotence_key)
+
+
+def payment_response(amount='2000.00'):
+    return {
+        'id': 'pay-1',
+        'status': 'pending',
+        'amount': {'value': amount, 'currency': 'RUB'},
+        'confirmation': {'type': 'redirect', 'confirmation_url': 'https://pay.example/1'},
+    }
+
+
+class PaymentTests(StoreTestCase):
+    url = '/api/payments/yookassa/'
+
+    def setUp(self):
+        super().setUp()
+        self.product = make_product('Платье', price=1000)
+        self.product.save()
+        self.cart = {
+            'products': [{'product_id': self.product.pk, 'quantity': 2}],
+            'client_data': {'first_name': 'Анна'},
+        }
+
+    def post(self, gateway, data):
+        with mock.patch.object(payments, 'get_client', return_value=gateway):
+            return APIClient().post(self.url, data, format='json')
+
+    def test_retry_after_gateway_error_reuses_order(self):
+        gateway = FakeGateway(payments.PaymentGatewayError('Платёжный сервис не ответил вовремя'),
+                              payment_response())
+        response = self.post(gateway, self.cart)
+        self.assertEqual(response.status_code, 503)
+        order_number = response.json()['order_number']
+
+        response = self.post(gateway, {'order_number': order_number})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['confirmation_url'], 'https://pay.example/1')
+
+        order = Order.objects.get()
+        self.assertEqual(order.order_number, order_number)
+        self.assertEqual(gateway.keys, [f'order-{order.pk}'] * 2)
+        self.assertEqual(PaymentRecord.objects.get().order, order)
+
+    def test_repeated_success_keeps_one_record(self):
+        gateway = FakeGateway(payment_response(), payment_response())
+        self.post(gateway, self.cart)
+        order = Order.objects.get()
+        order_number = order.order_number
+        response = self.post(gateway, {'order_number': order_number})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(PaymentRecord.objects.filter(order=order).count(), 1)
+
+    def test_unknown_order_number(self):
+        response = self.post(FakeGateway(), {'order_number': 'XXXXXXXXX'})
+        self.assertEqual(response.status_code, 400)
+
+    def test_malformed_response_is_gateway_error(self):
+        response = self.post(FakeGateway({'id': 'pay-1', 'status': 'pending'}), self.cart)
+        self.assertEqual(response.status_code, 503)
+        self.assertFalse(PaymentRecord.objects.exists())
+
+    def test_async_view_uses_async_gateway_call(self):
+        gateway = FakeGateway(payment_response())
+        with mock.patch.object(payments, 'get_client', return_value=gateway), \
+                mock.patch.object(gateway, 'create_payment', wraps=gateway.create_payment) as create_payment, \
+                mock.patch.object(payments, 'request_payment', side_effect=AssertionError('blocking call')):
+            response = APIClient().post('/api/payments/yookassa/async/', self.cart, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['confirmation_url'], 'https://pay.example/1')
+        create_payment.assert_called_once()
+
+
+class CheckoutTests(StoreTestCase):
+    def setUp(self):
+        super().setUp()
+        self.products = []
+        for number in range(5):
+            product = make_product(f'Платье {number}', price=1000 + number)
+            product.save()
+            self.products.append(product)
+        self.color = Color.objects.create(color_name='Белый', color_hex='#FFFFFF')
+        self.size = Size.objects.create(name='M')
+
+    def cart(self, products, **extra):
+        return [{'product_id': product.pk, 'quantity': 2, 'color_id': self.color.pk,
+                 'size_id': self.size.pk, **extra} for product in products]
+
+    def order_queries(self, products):
+        lines = checkout.parse_lines(self.cart(products))
+        with self.capture_queries() as queries:
+            checkout.create_order(lines, {}, f'N{len(products)}')
+        return len(queries)
+
+    def test_cart_size_does_not_change_queries(self):
+        self.assertEqual(self.order_queries(self.products[:1]), self.order_queries(self.products))
+        item = Order.objects.get(order_number='N5').order_items.order_by('pk').last()
+        self.assertEqual(list(item.colors.all()), [self.color])
+        self.assertEqual(list(item.sizes.all()), [self.size])
+
+    def test_client_prices_are_ignored(self):
+        lines = checkout.parse_lines(self.cart(self.products[:2], price=1, amount=1, subtotal=1))
+        order = checkout.create_order(lines, {'first_name': 'Анна', 'amount': 1}, 'N1')
+        self.assertEqual(order.amount, (1000 + 1001) * 2)
+        order.refresh_from_db()
+        self.assertEqual(order.amount, 4002)
+        self.assertEqual(order.first_name, 'Анна')
+
+    def test_unknown_product_creates_nothing(self):
+        lines = checkout.parse_lines(self.cart(self.products[:1]) + [{'product_id': 999, 'quantity': 1}])
+        with self.assertRaisesMessage(checkout.CheckoutError, 'Продукт с ID 999 не найден'):
+            checkout.create_order(lines, {}, 'N1')
+        self.assertFalse(Order.objects.exists())
+
+
+class OrderNumberTests(TestCase):
+    def test_decode_inverts_encode(self):
+        for value in (1, 2, 31, 32, 12345, order_numbers.MASK // 2, order_numbers.MASK):
+            code = order_numbers.encode(value)
+            self.assertEqual(len(code), order_numbers.CODE_LENGTH + 1)
+            self.assertEqual(order_numbers.decode(code), value)
+            # Как вводит покупатель: строчные, дефис, O вместо 0
+            typed = f'{code[:4]}-{code[4:]}'.lower().replace('0', 'o')
+            self.assertEqual(order_numbers.decode(typed), value)
+
+    def test_single_changed_symbol_is_rejected(self):
+        code = order_numbers.encode(12345)
+        for position, original in enumerate(code):
+            for char in order_numbers.ALPHABET:
+                if char != original:
+                    changed = code[:position] + char + code[position + 1:]
+                    self.assertFalse(order_numbers.is_valid(changed), changed)
+        with self.assertRaises(ValueError):
+            order_numbers.decode(code[:-1] + ('0' if code[-1] != '0' else '1'))
+
+    def test_allocators_never_share_numbers(self):
+        # Два процесса с небольшими блоками выдают номера вперемешку
+        first = order_numbers.OrderNumberAllocator(3)
+        second = order_numbers.OrderNumberAllocator(3)
+        codes = [allocator.next() for _ in range(10) for allocator in (first, second)]
+        self.assertEqual(len(set(codes)), len(codes))
+        # Все значения из зарезервированных блоков; остаток последнего блока пропадает
+        reserved = NumberSequence.objects.get(name=order_numbers.SEQUENCE_NAME).value
+        self.assertLessEqual(max(map(order_numbers.decode, codes)), reserved)
+
+    def test_forked_process_reserves_its_own_block(self):
+        allocator = order_numbers.OrderNumberAllocator(5)
+        parent = allocator.next()
+        with mock.patch.object(order_numbers.os, 'getpid', return_value=-1):
+            child = allocator.next()
+        self.assertEqual(order_numbers.decode(parent), 1)
+        self.assertEqual(order_numbers.decode(child), 6)
+
+
+class YookassaClientTests(TestCase):
+    def make_client(self, handler):
+        client = payments.YookassaClient('https://api.example/v3', 1, 'secret', 1, 1, 2,
+                                         payments.CircuitBreaker(2, 60))
+        mock_client = httpx.AsyncClient(transport=httpx.MockTransport(handler), auth=client.auth)
+        self.addCleanup(async_to_sync(mock_client.aclose))
+        client.async_client = lambda: mock_client
+        return client
+
+    def test_async_request_sends_idempotence_key(self):
+        requests_seen = []
+
+        def handler(request):
+            requests_seen.append(request)
+            return httpx.Response(200, json=payment_response())
+
+        client = self.make_client(handler)
+        payment = async_to_sync(client.create_payment_async)('2000.00', 'Заказ', 'https://shop/return', 'order-1')
+        self.assertEqual(payment['status'], 'pending')
+        self.assertEqual(requests_seen[0].headers['Idempotence-Key'], 'order-1')
+        self.assertEqual(str(requests_seen[0].url), 'https://api.example/v3/payments')
+
+    def test_breaker_is_shared_with_sync_calls(self):
+        client = self.make_client(lambda request: httpx.Response(500))
+        for _ in range(2):
+            with self.assertRaises(payments.PaymentGatewayError):
+                async_to_sync(client.request_async)('POST', '/payments')
+        with mock.patch.object(client.session, 'request') as sync_request:
+            with self.assertRaises(payments.CircuitOpenError):
+                client.request('POST', '/payments')
+        sync_request.assert_not_called()
+
+
+class CatalogIndexFilterTests(TestCase):
+    def setUp(self):
+        index_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, index_dir, ignore_errors=True)
+        settings_override = override_settings(STORE_INDEX_DIR=index_dir)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        for name in ('Платья', 'Dresses'):
+            product = make_product(name)
+            product.save()
+            product.category.add(Category.objects.create(category_name=name))
+        catalog_index.build_catalog_index()
+        self.index = catalog_index.CatalogIndex(catalog_index.get_index_path())
+
+    def test_icontains_matches_database(self):
+        for value in ('Платья', 'платья', 'ПЛАТЬЯ', 'dress', 'DRESS', 'атья'):
+            expected = list(Product.objects.filter(
+                category__category_name__icontains=value).order_by('id').values_list('id', flat=True))
+            self.assertEqual(self.index.resolve({'category': value}), expected, value)
+
+
+class ViewCounterTests(TestCase):
+    def setUp(self):
+        index_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, index_dir, ignore_errors=True)
+        settings_override = override_settings(STORE_INDEX_DIR=index_dir)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        self.product = make_product('Платье')
+        self.product.save()
+
+    def sketch(self, *ips):
+        sketch = HyperLogLog()
+        for ip in ips:
+            sketch.add(ip)
+        return sketch
+
+    def test_merges_sketch_created_concurrently(self):
+        # Другой процесс сохранил первый просмотр после нашего SELECT
+        ProductViewSketch.objects.create(
+            product=self.product, registers=bytes(self.sketch('10.0.0.1').registers))
+        select_for_update = ProductViewSketch.objects.select_for_update
+        with mock.patch.object(ProductViewSketch.objects, 'select_for_update', side_effect=[
+                ProductViewSketch.objects.none(), select_for_update()]):
+            merge_sketches({self.product.pk: self.sketch('10.0.0.2')})
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.views_count, 2)
+
+    def test_flush_updates_index_in_place(self):
+        catalog_index.build_catalog_index()
+        index = catalog_index.get_index()
+        counter = ViewCounter()
+        for ip in ('10.0.0.1', '10.0.0.2', '10.0.0.3'):
+            counter.record(self.product.pk, ip)
+        with mock.patch.object(catalog_index.rebuild_task, 'schedule') as schedule:
+            counter.flush()
+        schedule.assert_not_called()
+        self.assertIs(catalog_index.get_index(), index)
+        self.assertEqual(list(index.columns['views']), [3])
+        self.assertEqual(index.resolve({'ordering': 'views_count'}), [self.product.pk])
+
+    def test_view_without_ip_is_counted(self):
+        counter = ViewCounter()
+        counter.record(self.product.pk, None)
+        counter.record(self.product.pk, None)
+        counter.flush()
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.views_count, 1)
+
+    def test_flush_on_exit_tolerates_closed_database(self):
+        with mock.patch.object(view_counter, 'flush', side_effect=DatabaseError('no such table')), \
+                self.assertLogs('store.view_counter', 'WARNING'):
+            flush_on_exit()
+
+    def test_compact_moves_rows_into_sketches(self):
+        products = [self.product]
+        for name in ('Юбка', 'Пояс'):
+            product = make_product(name)
+            product.save()
+            products.append(product)
+        for product, ips in zip(products, [('10.0.0.1', '10.0.0.2', '10.0.0.1'), ('10.0.0.3',), ('10.0.0.4', '10.0.0.5')]):
+            product.views.add(*[ProductView.objects.create(ip=ip) for ip in ips])
+
+        call_command('compact_product_views', '--batch-size', '2', stdout=io.StringIO())
+        self.assertEqual(sorted(Product.objects.values_list('views_count', flat=True)), [1, 2, 2])
+        self.assertFalse(Product.views.through.objects.exists())
+        self.assertFalse(ProductView.objects.exists())
+
+
+@mock.patch.object(suggest, 'SCAN_LIMIT', 5)
+class SuggestTests(TestCase):
+    def setUp(self):
+        index_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, index_dir, ignore_errors=True)
+        self.path = f'{index_dir}/suggest.idx'
+        products = [make_product(f'Платье {number:02}', views_count=number) for number in range(1, 21)]
+        products.append(make_product('Пояс', views_count=100))
+        Product.objects.bulk_create(products)
+        suggest.build_suggest_index(self.path)
+        self.index = suggest.SuggestIndex(self.path)
+
+    def names(self, query, limit=3):
+        return [item['name'] for item in self.index.lookup(query, limit)]
+
+    def test_short_prefix_returns_most_popular(self):
+        # Больше SCAN_LIMIT записей: популярный товар в конце алфавита не теряется
+        self.assertEqual(self.names('п'), ['Пояс', 'Платье 20', 'Платье 19'])
+        self.assertEqual(self.names('ПЛА'), ['Платье 20', 'Платье 19', 'Платье 18'])
+        self.assertEqual(self.names('платье 1'), ['Платье 19', 'Платье 18', 'Платье 17'])
+
+    def test_long_prefix_scans_range(self):
+        self.assertEqual(self.names('платье 0', limit=2), ['Платье 09', 'Платье 08'])
+        self.assertEqual(self.names('05'), ['Платье 05'])
+        self.assertEqual(self.names('юбка'), [])
+
+
+class ProductDetailQueryTests(StoreTestCase):
+    def setUp(self):
+        super().setUp()
+        self.product = make_product('Платье')
+        self.product.save()
+        self.sizes = [Size.objects.create(name=name) for name in ('S', 'M', 'L')]
+
+    def add_color(self, name):
+        color = Color.objects.create(color_name=name, color_hex='#000000')
+        image = ProductImage.objects.create(image_url=ContentFile(name.encode(), name=f'{name}.png'))
+        for size in self.sizes:
+            variant = ProductColor.objects.create(product=self.product, color=color, size=size, quantity=1)
+            variant.images.add(image)
+
+    def detail_queries(self):
+        with self.capture_queries() as queries:
+            response = APIClient().get(f'/api/product/{self.product.pk}/')
+        self.assertEqual(response.status_code, 200)
+        return len(queries), response.json()
+
+    def test_variant_count_does_not_change_queries(self):
+        self.add_color('Белый')
+        count, data = self.detail_queries()
+        # Версии, товар, рекомендации, коллекция, категории, связанные товары, варианты с изображениями
+        self.assertLessEqual(count, 8)
+        self.assertEqual(len(data['colors']), 1)
+        self.assertEqual(len(data['colors'][0]['sizes']), 3)
+
+        for name in ('Чёрный', 'Красный', 'Синий'):
+            self.add_color(name)
+        with self.assertNumQueries(count):
+            _, data = self.detail_queries()
+        self.assertEqual(len(data['colors']), 4)
+        self.assertEqual([len(color['images']) for color in data['colors']], [1] * 4)
+
+
+class FailingConnection:
+    def __init__(self, *args, **kwargs):
+        pass
+
+    def open(self):
+        raise ConnectionRefusedError('Connection refused')
+
+    def close(self):
+        pass
+
+
+@override_settings(EMAIL_BACKEND='django.core.mail.backends.locmem.EmailBackend')
+class MailQueueTests(TestCase):
+    def test_enqueue_then_drain(self):
+        order = Order.objects.create(amount=2000, first_name='Анна')
+        mail_queue.enqueue('Новый заказ', 'Текст', ['shop@example.com', ''],
+                           html_template='email_templates/new_order_notification.html', order=order)
+        self.assertEqual(len(mail.outbox), 0)
+
+        self.assertEqual(mail_queue.drain(), (1, 0))
+        self.assertEqual(len(mail.outbox), 1)
+        message = mail.outbox[0]
+        self.assertEqual(message.to, ['shop@example.com'])
+        self.assertIn('Анна', message.alternatives[0][0])
+        email = OutboundEmail.objects.get(subject='Новый заказ')
+        self.assertEqual((email.status, email.attempts), ('sent', 1))
+        # Отправленное письмо больше не берётся
+        self.assertEqual(mail_queue.drain(), (0, 0))
+
+    def test_batch_saves_with_one_insert(self):
+        with self.assertNumQueries(1):
+            with mail_queue.batch():
+                for number in range(3):
+                    mail_queue.enqueue(f'Письмо {number}', 'Текст', ['a@example.com'])
+        self.assertEqual(mail_queue.drain(batch_size=2), (3, 0))
+        self.assertEqual(len(mail.outbox), 3)
+
+    def test_failed_connection_retries_with_backoff(self):
+        email = mail_queue.enqueue('Тема', 'Текст', ['a@example.com'])
+        with mock.patch.object(mail_queue, 'get_connection', FailingConnection), \
+                self.assertLogs('store.mail_queue', 'WARNING'):
+            before = timezone.now()
+            self.assertEqual(mail_queue.drain(), (0, 1))
+            email.refresh_from_db()
+            self.assertEqual((email.status, email.attempts), ('pending', 1))
+            self.assertIn('Connection refused', email.last_error)
+            self.assertGreaterEqual(email.next_attempt_at, before + timedelta(seconds=60))
+            # До следующей попытки письмо не берётся
+            self.assertEqual(mail_queue.drain(), (0, 0))
+
+            for _ in range(2, mail_queue.MAX_ATTEMPTS + 1):
+                OutboundEmail.objects.filter(pk=email.pk).update(next_attempt_at=timezone.now())
+                mail_queue.drain()
+            email.refresh_from_db()
+            self.assertEqual((email.status, email.attempts), ('failed', mail_queue.MAX_ATTEMPTS))
+
+        self.assertEqual(mail_queue.drain(), (0, 0))
+        self.assertEqual(len(mail.outbox), 0)
+
+    def test_retry_delay_grows_to_limit(self):
+        self.assertEqual(mail_queue.retry_delay(1), timedelta(seconds=60))
+        self.assertEqual(mail_queue.retry_delay(3), timedelta(seconds=240))
+        self.assertEqual(mail_queue.retry_delay(20), timedelta(seconds=mail_queue.RETRY_MAX_DELAY))
+
+
+class ProjectionTests(TestCase):
+    def setUp(self):
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root, ignore_errors=True)
+        settings_override = override_settings(MEDIA_ROOT=media_root)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        self.context = {'request': APIRequestFactory().get('/')}
+
+        menu = Menu.objects.create(menu_name='women')
+        collection = Collection.objects.create(
+            collection_name='Лето "2024"', description='Описание', video_url='https://example.com/v')
+        collection.images.add(ImageCollection.objects.create(
+            image_url=ContentFile(b'collection', name='c.png')))
+        color = Color.objects.create(color_name='Белый', color_hex='#FFFFFF')
+        for number in range(5):
+            category = Category.objects.create(category_name=f'Категория {number}')
+            category.menu_item.add(menu)
+            product = make_product(f'Платье {number}', price='1999.90', collection=collection)
+            product.save()
+            product.category.add(category)
+            variant = ProductColor.objects.create(product=product, color=color, quantity=1)
+            if number % 2:
+                variant.images.add(ProductImage.objects.create(
+                    image_url=ContentFile(f'image {number}'.encode(), name=f'{number}.png')))
+
+    def assert_same_output(self, serializer_class, projection_class, queryset):
+        expected = JSONRenderer().render(serializer_class(queryset, many=True, context=self.context).data)
+        actual = ORJSONRenderer().render(projection_class(self.context).serialize_queryset(queryset))
+        self.assertEqual(actual, expected)
+
+    def test_product_output_matches_serializer(self):
+        self.assert_same_output(ProductNameSerializer, ProductNameProjection,
+                                Product.objects.select_related('collection').order_by('pk'))
+
+    def test_category_output_matches_serializer(self):
+        self.assert_same_output(CategorySerializer, CategoryProjection, Category.objects.order_by('pk'))
+
+    def test_collection_output_matches_serializer(self):
+        self.assert_same_output(CollectionNameSerializer, CollectionNameProjection,
+                                Collection.objects.prefetch_related('images').order_by('pk'))
+
+    def test_menu_output_matches_serializer(self):
+        self.assert_same_output(MenuSerializer, MenuProjection,
+                                Menu.objects.prefetch_related('menu_item').order_by('pk'))
+
+    def test_product_projection_queries_do_not_grow(self):
+        with CaptureQueriesContext(connection) as queries:
+            ProductNameProjection(self.context).serialize_queryset(Product.objects.order_by('pk')[:2])
+        with self.assertNumQueries(len(queries)):
+            ProductNameProjection(self.context).serialize_queryset(Product.objects.order_by('pk'))
+
+
+def png_file(name, width=800, height=600):
+    buffer = io.BytesIO()
+    Image.new('RGB', (width, height), (200, 40, 40)).save(buffer, 'PNG')
+    return ContentFile(buffer.getvalue(), name=name)
+
+
+@mock.patch('store.management.commands.process_images.ProcessPoolExecutor', ThreadPoolExecutor)
+class ImageProcessingTests(TestCase):
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root, ignore_errors=True)
+        settings_override = override_settings(MEDIA_ROOT=self.media_root)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+    def process(self):
+        call_command('process_images', '--once', '--workers', '1', stdout=io.StringIO())
+
+    def test_upload_is_left_for_worker(self):
+        image = ProductImage.objects.create(image_url=png_file('a.png'))
+        self.assertEqual(list(renditions.pending_images(ProductImage)), [image])
+
+        self.process()
+        image.refresh_from_db()
+        self.assertEqual(image.renditions['source'], image.image_url.name)
+        self.assertEqual(sorted(image.renditions['webp'], key=int), ['320', '640'])
+        self.assertRegex(image.dominant_color, r'^#[0-9a-f]{6}$')
+        self.assertTrue(image.placeholder.startswith('data:image/webp;base64,'))
+        self.assertFalse(renditions.pending_images(ProductImage).exists())
+
+    def test_replaced_file_is_pending_again(self):
+        image = ProductImage.objects.create(image_url=png_file('a.png'))
+        self.process()
+        image.refresh_from_db()
+        image.image_url = png_file('b.png', width=700)
+        image.save()
+        self.assertEqual(list(renditions.pending_images(ProductImage)), [image])
+
+    def test_broken_image_is_not_retried(self):
+        ProductImage.objects.create(image_url=ContentFile(b'not an image', name='a.png'))
+        failed = set()
+        with self.assertLogs('store', 'ERROR'), ThreadPoolExecutor(1) as executor:
+            self.assertEqual(ProcessImagesCommand().process(executor, 1, failed), (0, 0))
+            self.assertEqual(len(failed), 1)
+            with mock.patch('store.renditions.submit') as submit:
+                self.assertEqual(ProcessImagesCommand().process(executor, 1, failed), (0, 0))
+        submit.assert_not_called()
+
+    def test_placeholder_errors_use_module_logger(self):
+        image = ProductImage.objects.create(image_url=ContentFile(b'not an image', name='a.png'))
+        with self.assertLogs('store.placeholders', 'ERROR'), ThreadPoolExecutor(1) as executor:
+            computed, failed = placeholders.compute_placeholders(executor)
+        self.assertEqual((computed, failed), (0, [(ProductImage, image.pk)]))
+        with ThreadPoolExecutor(1) as executor:
+            self.assertEqual(placeholders.compute_placeholders(executor, skip=set(failed)), (0, []))
+
+    def test_save_renditions_skips_model_signals(self):
+        image = ProductImage.objects.create(image_url=png_file('a.png'))
+        result = {'width': 800, 'height': 600, 'files': {'jpeg': {320: b'jpeg'}, 'webp': {320: b'webp'}}}
+        key = version_key(ProductImage)
+        before = get_versions([key]).get(key, (0, None))[0]
+        saved = []
+        receiver = lambda sender, **kwargs: saved.append(sender)
+        post_save.connect(receiver, sender=ProductImage)
+        self.addCleanup(post_save.disconnect, receiver, sender=ProductImage)
+
+        self.assertTrue(renditions.save_renditions(ProductImage, image.pk, image.image_url.name, result))
+        self.assertEqual(saved, [])
+        # Кэши сбрасываются без сигналов каталога
+        self.assertEqual(get_versions([key])[key][0], before + 1)
+        image.refresh_from_db()
+        self.assertEqual(set(image.renditions['jpeg']), {'320'})
+
+    def test_save_renditions_ignores_replaced_source(self):
+        image = ProductImage.objects.create(image_url=png_file('a.png'))
+        result = {'width': 800, 'height': 600, 'files': {'jpeg': {}, 'webp': {}}}
+        self.assertFalse(renditions.save_renditions(ProductImage, image.pk, 'products/old.png', result))
+        image.refresh_from_db()
+        self.assertEqual(image.renditions, {})
+
+    def test_webp_srcset_does_not_list_original(self):
+        image = ProductImage.objects.create(image_url=png_file('a.png'))
+        self.process()
+        image.refresh_from_db()
+        result = renditions.srcset(image)
+        self.assertNotIn(image.image_url.url, result['webp'])
+        self.assertTrue(result['webp'].endswith(' 640w'))
+        self.assertTrue(result['jpeg'].endswith(f'{image.image_url.url} 800w'))
+
+
+class FieldTrackingTests(TestCase):
+    def setUp(self):
+        Order.objects.create(order_number='N1', amount=1000, email='anna@example.com')
+        Order.objects.create(order_number='N2', amount=2000, email='ivan@example.com')
+        OutboundEmail.objects.all().delete()
+        self.order = Order.objects.get(order_number='N1')
+        self.receiver = mock.Mock()
+        fields_changed.connect(self.receiver, sender=Order, weak=False)
+        self.addCleanup(fields_changed.disconnect, self.receiver, sender=Order)
+
+    def delivery_emails(self):
+        return OutboundEmail.objects.filter(subject='Изменение даты доставки').count()
+
+    def test_untracked_change_skips_handlers(self):
+        self.order.first_name = 'Анна'
+        with CaptureQueriesContext(connection) as queries:
+            self.order.save()
+        # Прежние значения не перечитываются из базы
+        self.assertFalse([query for query in queries if query['sql'].startswith('SELECT')])
+        self.receiver.assert_not_called()
+        self.assertEqual(self.delivery_emails(), 0)
+
+    def test_tracked_change_runs_handlers_once(self):
+        self.order.delivery_date = timezone.localdate()
+        self.order.save()
+        self.receiver.assert_called_once()
+        self.assertEqual(self.receiver.call_args.kwargs['changed_fields'], {'delivery_date'})
+        self.assertEqual(self.delivery_emails(), 1)
+
+        # Снимок обновлён после сохранения: повторный save ничего не отправляет
+        self.order.save()
+        self.receiver.assert_called_once()
+        self.assertEqual(self.delivery_emails(), 1)
+
+    def test_bulk_update_reports_only_changed_orders(self):
+        orders = list(Order.objects.order_by('pk'))
+        orders[1].track_number = 'TRACK-1'
+        tracking.bulk_update(orders, ['track_number', 'delivery_date'])
+        self.receiver.assert_called_once()
+        self.assertEqual(self.receiver.call_args.kwargs['instance'], orders[1])
+        self.assertEqual(self.receiver.call_args.kwargs['changed_fields'], {'track_number'})
+        self.assertEqual(self.delivery_emails(), 0)
+
+
+class FulfilmentImportTests(TestCase):
+    def test_long_website_url_is_rejected(self):
+        url = 'https://example.com/' + 'a' * 200
+        with self.assertRaisesMessage(ValueError, 'слишком длинная ссылка'):
+            fulfilment.parse_row({'website_url': url})
+        self.assertEqual(fulfilment.parse_row({'website_url': 'https://example.com/t'}),
+                         {'website_url': 'https://example.com/t'})
+
+    def test_long_website_url_rejects_only_its_row(self):
+        lines = ['order_number,website_url', f'A1,https://example.com/{"a" * 200}', 'B2,https://example.com/t']
+        report = fulfilment.import_fulfilment(lines)
+        self.assertEqual(report.errors, [(2, 'слишком длинная ссылка'), (3, 'заказ B2 не найден')])
+
+
+class MediaGarbageTests(TestCase):
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root, ignore_errors=True)
+        settings_override = override_settings(MEDIA_ROOT=self.media_root)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        self.image = ProductImage.objects.create(image_url=ContentFile(b'image', name='a.png'))
+        self.rendition = content_storage.save('products/renditions/a-320w.webp', ContentFile(b'webp'))
+        ProductImage.objects.filter(pk=self.image.pk).update(renditions={
+            'source': self.image.image_url.name, 'width': 800, 'height': 600, 'webp': {'320': self.rendition}})
+        self.orphans = [content_storage.save(name, ContentFile(name.encode())) for name in (
+            'products/orphan.png', 'products/renditions/orphan-320w.webp', 'products.png/x.png')]
+
+    def test_orphans_found_with_small_sort_runs(self):
+        # Куски по два имени: и ссылки, и файлы проходят через слияние нескольких кусков
+        with mock.patch.object(media_gc, 'SORT_CHUNK_SIZE', 2):
+            found = [name for name, _ in media_gc.find_orphans(self.media_root, ['products', 'products.png'])]
+        self.assertEqual(found, sorted(self.orphans))
+
+    def test_command_deletes_only_orphans(self):
+        out = io.StringIO()
+        call_command('collect_media_garbage', '--min-age', '0', '--directory', 'products',
+                     '--directory', 'products.png', stdout=out)
+        self.assertIn('Удалено файлов: 3', out.getvalue())
+        for name in self.orphans:
+            self.assertFalse(content_storage.exists(name), name)
+        self.assertTrue(content_storage.exists(self.image.image_url.name))
+        self.assertTrue(content_storage.exists(self.rendition))
@@ -0,0 +1,79 @@
+from django.dispatch import Signal
+
+# Отслеживание изменений полей без повторного чтения из базы: значения
+# tracked_fields запоминаются при загрузке объекта (from_db) и после каждого
+# сохранения. После save() и bulk_update() отправляется fields_changed с
+# набором изменившихся полей, поэтому обработчикам не нужен лишний SELECT.
+
+# sender — модель, instance — объект, changed_fields — set имён полей
+fields_changed = Signal()
+
+
+class FieldTracker:
+    tracked_fields = ()
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance.reset_tracking()
+        return instance
+
+    def _tracked_attnames(self, fields=None):
+        for name in self.tracked_fields:
+            if fields is None or name in fields:
+                yield name, self._meta.get_field(name).attname
+
+    def reset_tracking(self, fields=None):
+        """Запоминает текущие значения; fields — только эти поля."""
+        values = getattr(self, '_tracked_values', {}) if fields is not None else {}
+        for name, attname in self._tracked_attnames(fields):
+            # Отложенные (defer/only) поля не загружены и в снимок не попадают
+            if attname in self.__dict__:
+                values[attname] = self.__dict__[attname]
+        self._tracked_values = values
+
+    def has_loaded(self, field_name):
+        attname = self._meta.get_field(field_name).attname
+        return attname in getattr(self, '_tracked_values', {})
+
+    def previous(self, field_name):
+        """Значение поля на момент загрузки или последнего сохранения."""
+        field = self._meta.get_field(field_name)
+        return getattr(self, '_tracked_values', {}).get(field.attname)
+
+    def has_changed(self, field_name):
+        # Новый объект или поле без снимка считаются изменёнными
+        if self._state.adding or not self.has_loaded(field_name):
+            return True
+        field = self._meta.get_field(field_name)
+        return field.to_python(getattr(self, field.attname)) != self._tracked_values[field.attname]
+
+    @property
+    def changed_fields(self):
+        return {name for name in self.tracked_fields if self.has_changed(name)}
+
+    def save(self, *args, **kwargs):
+        adding = self._state.adding
+        update_fields = kwargs.get('update_fields')
+        changed = set() if adding else self.changed_fields
+        if update_fields is not None:
+            changed &= set(update_fields)
+        super().save(*args, **kwargs)
+        self.reset_tracking(None if adding else update_fields)
+        if changed:
+            fields_changed.send(sender=type(self), instance=self, changed_fields=changed)
+
+
+def bulk_update(instances, fields, batch_size=None):
+    """QuerySet.bulk_update с сигналом fields_changed для изменившихся объектов."""
+    instances = list(instances)
+    if not instances:
+        return 0
+    model = type(instances[0])
+    changes = [(instance, instance.changed_fields & set(fields)) for instance in instances]
+    updated = model._default_manager.bulk_update(instances, fields, batch_size=batch_size)
+    for instance, changed in changes:
+        instance.reset_tracking(fields)
+        if changed:
+            fields_changed.send(sender=model, instance=instance, changed_fields=changed)
+    return updated
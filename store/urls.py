@@ -4,7 +4,7 @@ from rest_framework import routers
 from django.conf import settings
 from django.conf.urls.static import static
 
-from .views import ProductViewSet, MenuViewSet, CollectionViewSet, ColorAndSizesViewSet, CategoryViewSet, HomePageViewSet, OrderViewSet, YookassaPaymentCreateAPIView
+from .views import ProductViewSet, MenuViewSet, CollectionViewSet, ColorAndSizesViewSet, CategoryViewSet, HomePageViewSet, OrderViewSet, SuggestViewSet, YookassaPaymentCreateAPIView, YookassaPaymentCreateAsyncView
 """ , PaymentConfirmationView, PaymentCancellationView """
 
 router = routers.DefaultRouter()
@@ -15,11 +15,14 @@ router.register(r'category', CategoryViewSet)
 router.register(r'collection', CollectionViewSet)
 router.register(r'colors&sizes', ColorAndSizesViewSet, basename='filter')
 router.register(r'home', HomePageViewSet, basename='home')
+router.register(r'suggest', SuggestViewSet, basename='suggest')
 
 
 urlpatterns = [
     path('payments/yookassa/', YookassaPaymentCreateAPIView.as_view(),
          name='yookassa-payment-create'),
+    path('payments/yookassa/async/', YookassaPaymentCreateAsyncView.as_view(),
+         name='yookassa-payment-create-async'),
     # path('confirm-payment/', PaymentConfirmationView.as_view(), name='confirm-payment'),
     # path('cancel-payment/', PaymentCancellationView.as_view(), name='cancel-payment'),
     path('orders/', OrderViewSet.as_view(), name='order-list'),
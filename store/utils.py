@@ -0,0 +1,88 @@
+import logging
+import threading
+
+from django.db import connection
+from django.db.models import Min
+
+from .models import ProductColor
+
+logger = logging.getLogger(__name__)
+
+
+def primary_images(product_ids):
+    """
+    Первое изображение каждого товара: {id товара: ProductImage}.
+    Два запроса на любое количество товаров вместо трёх на каждый товар.
+    """
+    product_ids = set(product_ids)
+    if not product_ids:
+        return {}
+
+    # Первый цвет товара (как productcolors.first())
+    first_colors = dict(
+        ProductColor.objects.filter(product_id__in=product_ids)
+        .values('product_id')
+        .annotate(first_id=Min('id'))
+        .values_list('product_id', 'first_id')
+    )
+
+    # Первое изображение первого цвета (как images.first())
+    first_images = {}
+    through_rows = ProductColor.images.through.objects.filter(
+        productcolor_id__in=first_colors.values()
+    ).select_related('productimage').order_by('productcolor_id', 'productimage_id')
+    for row in through_rows:
+        first_images.setdefault(row.productcolor_id, row.productimage)
+
+    return {
+        product_id: first_images.get(color_id)
+        for product_id, color_id in first_colors.items()
+    }
+
+
+def attach_primary_images(products):
+    """Проставляет товарам первое изображение (атрибут _primary_image)."""
+    products = [product for product in products
+                if not hasattr(product, '_primary_image')]
+    if not products:
+        return
+    images = primary_images(product.pk for product in products)
+    for product in products:
+        product._primary_image = images.get(product.pk)
+
+
+def get_primary_image(product):
+    if not hasattr(product, '_primary_image'):
+        attach_primary_images([product])
+    return product._primary_image
+
+
+class DebouncedTask:
+    """
+    Запускает функцию в фоновом потоке не чаще одного раза за delay секунд:
+    серия изменений каталога приводит к одной пересборке.
+    """
+
+    def __init__(self, func, delay=2.0):
+        self.func = func
+        self.delay = delay
+        self._timer = None
+        self._lock = threading.Lock()
+
+    def schedule(self):
+        with self._lock:
+            if self._timer is not None:
+                return
+            self._timer = threading.Timer(self.delay, self._run)
+            self._timer.daemon = True
+            self._timer.start()
+
+    def _run(self):
+        with self._lock:
+            self._timer = None
+        try:
+            self.func()
+        except Exception:
+            logger.exception('Background task %s failed', self.func.__name__)
+        finally:
+            connection.close()
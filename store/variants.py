@@ -0,0 +1,47 @@
+class VariantMatrix:
+    """
+    Матрица вариантов товара: цвет -> размеры с количеством и изображения цвета.
+    Строится за один проход по строкам ProductColor. Для одного товара без
+    prefetch — два запроса, с prefetch 'productcolors' — ни одного.
+    """
+
+    def __init__(self, product_colors):
+        self.colors = {}
+
+        for product_color in product_colors:
+            color = product_color.color
+            entry = self.colors.get(color.id)
+            if entry is None:
+                # Изображения цвета берутся из первой строки этого цвета
+                entry = self.colors[color.id] = {
+                    'color': color,
+                    'images': list(product_color.images.all()),
+                    'sizes': [],
+                }
+            if product_color.size:
+                entry['sizes'].append((product_color.size, product_color.quantity))
+
+    @classmethod
+    def for_product(cls, product):
+        if 'productcolors' in getattr(product, '_prefetched_objects_cache', {}):
+            product_colors = product.productcolors.all()
+        else:
+            product_colors = product.productcolors.select_related(
+                'color', 'size').prefetch_related('images').order_by('color__id', 'id')
+        return cls(product_colors)
+
+    def to_representation(self, image_serializer_class, context=None):
+        color_data = []
+        for entry in self.colors.values():
+            color = entry['color']
+            color_data.append({
+                'id': color.id,
+                'color_hex': color.color_hex,
+                'color_name': color.color_name,
+                'sizes': [
+                    {'size': {'id': size.id, 'name': size.name}, 'quantity': quantity}
+                    for size, quantity in entry['sizes']
+                ],
+                'images': image_serializer_class(entry['images'], many=True, context=context).data,
+            })
+        return color_data
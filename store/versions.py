@@ -0,0 +1,104 @@
+import hashlib
+
+from django.db import IntegrityError, transaction
+from django.db.models import F
+from django.utils import timezone
+from django.utils.http import http_date, parse_etags
+from rest_framework import status
+from rest_framework.exceptions import APIException
+from rest_framework.response import Response
+
+from .models import CatalogVersion
+
+
+def version_key(model, pk=None):
+    key = model._meta.label_lower
+    return key if pk is None else f'{key}:{pk}'
+
+
+def bump_versions(keys):
+    keys = set(keys)
+    if not keys:
+        return
+    now = timezone.now()
+    with transaction.atomic():
+        CatalogVersion.objects.filter(key__in=keys).update(version=F('version') + 1, updated_at=now)
+        existing = set(CatalogVersion.objects.filter(key__in=keys).values_list('key', flat=True))
+        missing = keys - existing
+        if missing:
+            try:
+                with transaction.atomic():
+                    CatalogVersion.objects.bulk_create(
+                        [CatalogVersion(key=key, version=1, updated_at=now) for key in missing])
+            except IntegrityError:
+                # Строку успел создать другой процесс
+                CatalogVersion.objects.filter(key__in=missing).update(
+                    version=F('version') + 1, updated_at=now)
+
+
+def get_versions(keys):
+    return {
+        key: (version, updated_at)
+        for key, version, updated_at in CatalogVersion.objects.filter(key__in=keys).values_list(
+            'key', 'version', 'updated_at')
+    }
+
+
+class NotModified(APIException):
+    status_code = status.HTTP_304_NOT_MODIFIED
+
+
+class CatalogVersionMixin:
+    """
+    Условный GET: ETag и Last-Modified считаются по версиям моделей
+    (CatalogVersion) одним запросом. Если клиент прислал совпадающий
+    If-None-Match, ответ 304 отдаётся до сериализатора и запросов к данным.
+    If-Modified-Since не проверяется: время с точностью до секунды не
+    различает две правки за секунду, поэтому 304 отдаётся только по ETag.
+    """
+    version_models = ()
+    conditional_actions = ('list', 'retrieve')
+
+    def get_version_keys(self):
+        return [version_key(model) for model in self.version_models]
+
+    def not_modified(self, request):
+        pass
+
+    def initial(self, request, *args, **kwargs):
+        super().initial(request, *args, **kwargs)
+        self._validators = None
+        self.versions = None
+        if request.method not in ('GET', 'HEAD') or self.action not in self.conditional_actions:
+            return
+
+        keys = sorted(self.get_version_keys())
+        versions = self.versions = get_versions(keys)
+        source = '|'.join(
+            [request.get_full_path(), request.get_host(), request.accepted_media_type or '']
+            + ['%s:%s' % (key, versions.get(key, (0, None))[0]) for key in keys]
+        )
+        etag = '"%s"' % hashlib.sha1(source.encode()).hexdigest()
+        timestamps = [updated_at for _, updated_at in versions.values()]
+        last_modified = int(max(timestamps).timestamp()) if timestamps else None
+        self._validators = (etag, last_modified)
+
+        if_none_match = request.META.get('HTTP_IF_NONE_MATCH')
+        if if_none_match is not None and (etag in parse_etags(if_none_match) or if_none_match.strip() == '*'):
+            self.not_modified(request)
+            raise NotModified()
+
+    def handle_exception(self, exc):
+        if isinstance(exc, NotModified):
+            return Response(status=status.HTTP_304_NOT_MODIFIED)
+        return super().handle_exception(exc)
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        response = super().finalize_response(request, response, *args, **kwargs)
+        validators = getattr(self, '_validators', None)
+        if validators and response.status_code in (200, 304):
+            etag, last_modified = validators
+            response['ETag'] = etag
+            if last_modified is not None:
+                response['Last-Modified'] = http_date(last_modified)
+        return response
@@ -0,0 +1,134 @@
+import atexit
+import hashlib
+import logging
+import math
+import threading
+
+from django.db import DatabaseError, transaction
+
+from . import catalog_index, list_cache
+from .models import Product, ProductViewSketch
+from .utils import DebouncedTask
+from .versions import bump_versions, version_key
+
+logger = logging.getLogger(__name__)
+
+FLUSH_INTERVAL = 5.0
+
+
+class HyperLogLog:
+    """Оценка числа уникальных значений: 1024 однобайтовых регистра, погрешность ~3%."""
+    precision = 10
+    size = 1 << precision
+
+    def __init__(self, registers=None):
+        self.registers = bytearray(registers) if registers else bytearray(self.size)
+
+    def add(self, value):
+        digest = int.from_bytes(hashlib.sha1(value.encode()).digest()[:8], 'big')
+        index = digest >> (64 - self.precision)
+        rest = digest & ((1 << (64 - self.precision)) - 1)
+        rank = (64 - self.precision) - rest.bit_length() + 1
+        if rank > self.registers[index]:
+            self.registers[index] = rank
+
+    def merge(self, other):
+        self.registers = bytearray(map(max, self.registers, other.registers))
+
+    def count(self):
+        alpha = 0.7213 / (1 + 1.079 / self.size)
+        estimate = alpha * self.size * self.size / sum(2.0 ** -register for register in self.registers)
+        zeros = self.registers.count(0)
+        if estimate <= 2.5 * self.size and zeros:
+            # Малые значения — линейный подсчёт
+            estimate = self.size * math.log(self.size / zeros)
+        return int(round(estimate))
+
+
+class ViewCounter:
+    """
+    Просмотры копятся в памяти процесса и раз в FLUSH_INTERVAL секунд
+    в фоне объединяются с сохранёнными скетчами; Product.views_count
+    обновляется одним bulk_update. Запись просмотра не обращается к базе.
+    """
+
+    def __init__(self, flush_interval=FLUSH_INTERVAL):
+        self._pending = {}
+        self._lock = threading.Lock()
+        self._flush_task = DebouncedTask(self.flush, delay=flush_interval)
+
+    def record(self, product_id, ip):
+        with self._lock:
+            sketch = self._pending.get(product_id)
+            if sketch is None:
+                sketch = self._pending[product_id] = HyperLogLog()
+            # Запрос без адреса (прокси не передал REMOTE_ADDR): все такие
+            # просмотры считаются одним посетителем
+            sketch.add(ip or '')
+        self._flush_task.schedule()
+
+    def flush(self):
+        with self._lock:
+            pending, self._pending = self._pending, {}
+        if pending:
+            products = merge_sketches(pending)
+            # Сортировка по популярности: колонка просмотров в индексе каталога
+            # обновляется на месте, без пересборки, затем сбрасывается кэш списка
+            catalog_index.update_views({product.pk: product.views_count for product in products})
+            list_cache.invalidate_tags(['views'])
+
+
+def merge_sketches(pending):
+    """Объединяет скетчи {product_id: HyperLogLog} с сохранёнными и обновляет views_count."""
+    with transaction.atomic():
+        product_ids = set(Product.objects.filter(pk__in=pending).values_list('pk', flat=True))
+        stored = {
+            sketch.product_id: sketch
+            for sketch in ProductViewSketch.objects.select_for_update().filter(product_id__in=product_ids)
+        }
+        missing = product_ids - set(stored)
+        if missing:
+            # Первый просмотр товара мог одновременно сохранить другой процесс:
+            # пустые скетчи создаются без ошибки при конфликте, затем
+            # объединяются с тем, что оказалось в базе
+            ProductViewSketch.objects.bulk_create(
+                [ProductViewSketch(product_id=product_id, registers=bytes(HyperLogLog.size))
+                 for product_id in missing],
+                ignore_conflicts=True,
+            )
+            stored.update(
+                (sketch.product_id, sketch)
+                for sketch in ProductViewSketch.objects.select_for_update().filter(product_id__in=missing)
+            )
+        sketches, products = [], []
+        for product_id in product_ids:
+            merged = pending[product_id]
+            sketch = stored[product_id]
+            merged.merge(HyperLogLog(sketch.registers))
+            sketch.registers = bytes(merged.registers)
+            sketches.append(sketch)
+            products.append(Product(pk=product_id, views_count=merged.count()))
+        ProductViewSketch.objects.bulk_update(sketches, ['registers'])
+        Product.objects.bulk_update(products, ['views_count'])
+        bump_versions(version_key(Product, product_id) for product_id in product_ids)
+    return products
+
+
+def get_client_ip(request):
+    forwarded_for = request.META.get('HTTP_X_FORWARDED_FOR')
+    if forwarded_for:
+        return forwarded_for.split(',')[0].strip()
+    return request.META.get('REMOTE_ADDR')
+
+
+def flush_on_exit():
+    """Сохраняет накопленные просмотры при завершении процесса."""
+    try:
+        view_counter.flush()
+    except DatabaseError:
+        # База уже недоступна (например, тестовая удалена раньше atexit)
+        logger.warning('Просмотры не сохранены при завершении процесса', exc_info=True)
+
+
+view_counter = ViewCounter()
+atexit.register(flush_on_exit)
@@ -1,16 +1,20 @@
 from urllib.parse import unquote
 from .models import Order, OrderItem, Product
 from django.template.loader import render_to_string
-from django.core.mail import send_mail
-import string
-import random
 from .models import Order, OrderItem, PaymentRecord
 from profiles_app.models import Profile
-from yookassa import Configuration, Payment
 from rest_framework.views import APIView
 from django.conf import settings
+from django.http import Http404, JsonResponse
+from django.views import View
+from django.db import connection
+from asgiref.sync import sync_to_async
+from rest_framework.exceptions import APIException
+from rest_framework.request import Request
+from rest_framework.settings import api_settings
 import uuid
-from rest_framework import viewsets, filters
+from rest_framework import viewsets, filters, status
+from rest_framework.decorators import action
 from django_filters.rest_framework import DjangoFilterBackend
 from django_filters import FilterSet, CharFilter, Filter
 from rest_framework.response import Response
@@ -19,12 +23,31 @@ from rest_framework.permissions import IsAuthenticated
 
 from django.db.models import Count
 
-from .models import Product, Collection, Menu, ProductColor, Size, Category, ProductView, Color, Order
+from .models import Product, Collection, Menu, ProductColor, Size, Category, ProductView, Color, Order, ProductImage, ImageCollection
 from .serializers import ProductSerializer, CollectionSerializer, MenuSerializer, CategorySerializer, HomePageSerializer, RelatedProductSerializer, CollectionNameSerializer, ProductNameSerializer, ProductColorSerializer, OrderSerializer
-
-
-class ColorAndSizesViewSet(viewsets.ViewSet):
+from .utils import attach_primary_images
+from .home import get_home_page
+from .recommendations import get_recommendations
+from .search import ProductSearchFilter
+from .suggest import suggest, MAX_SUGGESTIONS, SUGGESTIONS_LIMIT
+from .facets import get_facets
+from .catalog_index import resolve_product_ids
+from .pagination import ProductKeysetPagination
+from .view_counter import view_counter, get_client_ip
+from .versions import CatalogVersionMixin, version_key
+from . import list_cache
+from .navigation import get_snapshot
+from .projections import ProductNameProjection
+from .streaming import StreamingListMixin
+from .checkout import CheckoutError, create_order, get_unpaid_order, parse_lines
+from .order_numbers import next_order_number
+from . import mail_queue
+from .payments import PaymentGatewayError, record_payment, request_payment_async, start_payment
+
+
+class ColorAndSizesViewSet(CatalogVersionMixin, viewsets.ViewSet):
     pagination_class = None
+    version_models = (Color, Size)
 
     def list(self, request):
         colors = Color.objects.values(
@@ -37,15 +60,35 @@ class ColorAndSizesViewSet(viewsets.ViewSet):
         return Response(data)
 
 
-class OrderViewSet(APIView):
+class SuggestViewSet(viewsets.ViewSet):
+    pagination_class = None
+
+    def list(self, request):
+        # Подсказки читаются из индекса в памяти, без запросов к базе
+        query = request.query_params.get('q', '')
+        try:
+            limit = min(int(request.query_params.get('limit', SUGGESTIONS_LIMIT)), MAX_SUGGESTIONS)
+        except ValueError:
+            limit = SUGGESTIONS_LIMIT
+        return Response({'query': query, 'suggestions': suggest(query, limit)})
+
+
+class OrderViewSet(StreamingListMixin, APIView):
     pagination_class = None
 
     permission_classes = [IsAuthenticated]
 
+    def get_stream_queryset(self):
+        return Order.objects.filter(
+            user__user=self.request.user).order_by('pk').prefetch_related('products__collection')
+
+    def serialize_batch(self, orders):
+        attach_primary_images(
+            product for order in orders for product in order.products.all())
+        return OrderSerializer(orders, many=True).data
+
     def get(self, request):
-        orders = Order.objects.filter(user__user = request.user)
-        serializer = OrderSerializer(orders, many=True)
-        return Response(serializer.data)
+        return self.stream_list(self.get_stream_queryset())
 
 
 class ProductColorViewSet(viewsets.ModelViewSet):
@@ -55,22 +98,56 @@ class ProductColorViewSet(viewsets.ModelViewSet):
     queryset = ProductColor.objects.all()
 
 
-class MenuViewSet(viewsets.ModelViewSet):
+def get_navigation(view):
+    # Меню и категории отдаются из снимка в памяти процесса (store.navigation)
+    return get_snapshot(view.versions, view.get_version_keys())
+
+
+def _int_or_none(value):
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+
+class MenuViewSet(CatalogVersionMixin, viewsets.ModelViewSet):
     pagination_class = None
+    version_models = (Menu, Category)
 
     queryset = Menu.objects.all()
     serializer_class = MenuSerializer
 
+    def list(self, request, *args, **kwargs):
+        return Response(get_navigation(self).menus)
+
+    def retrieve(self, request, *args, **kwargs):
+        menu = get_navigation(self).menus_by_id.get(_int_or_none(kwargs['pk']))
+        if menu is None:
+            raise Http404
+        return Response(menu)
+
 
-class CategoryViewSet(viewsets.ModelViewSet):
+class CategoryViewSet(CatalogVersionMixin, viewsets.ModelViewSet):
     pagination_class = None
+    # Версия меню тоже читается: снимок навигации общий с MenuViewSet
+    version_models = (Menu, Category)
 
     queryset = Category.objects.all()
     serializer_class = CategorySerializer
 
+    def list(self, request, *args, **kwargs):
+        return Response(get_navigation(self).categories)
 
-class CollectionViewSet(viewsets.ModelViewSet):
+    def retrieve(self, request, *args, **kwargs):
+        category = get_navigation(self).categories_by_id.get(_int_or_none(kwargs['pk']))
+        if category is None:
+            raise Http404
+        return Response(category)
+
+
+class CollectionViewSet(CatalogVersionMixin, StreamingListMixin, viewsets.ModelViewSet):
     pagination_class = None
+    version_models = (Collection, ImageCollection)
 
     queryset = Collection.objects.all().prefetch_related('images')
     serializer_class = CollectionSerializer
@@ -111,21 +188,75 @@ class ProductFilter(FilterSet):
         fields = []
 
 
-class ProductViewSet(viewsets.ModelViewSet):
+class ProductViewSet(CatalogVersionMixin, viewsets.ModelViewSet):
     queryset = Product.objects.all()
     serializer_class = ProductNameSerializer
     filter_backends = [DjangoFilterBackend,
-                       filters.SearchFilter, filters.OrderingFilter]
+                       ProductSearchFilter, filters.OrderingFilter]
     search_fields = ['product_name', 'description',
                      'model_parameters', 'details', 'care']
     ordering_fields = ['price', 'date']
     filterset_class = ProductFilter
+    version_models = (Product, ProductColor, ProductImage, Collection,
+                      ImageCollection, Category, Color, Size)
+    conditional_actions = ('retrieve',)
 
     def get_queryset(self):
+        return self.get_base_queryset(self.request)
+
+    def get_version_keys(self):
+        # Количество просмотров товара меняет версию самого товара
+        return super().get_version_keys() + [version_key(Product, self.kwargs.get('pk'))]
+
+    def record_view(self, request):
+        # Просмотр учитывается в памяти и сохраняется в фоне пакетом
+        pk = self.kwargs.get('pk')
+        if pk is not None and str(pk).isdigit():
+            view_counter.record(int(pk), get_client_ip(request))
+
+    def not_modified(self, request):
+        self.record_view(request)
+
+    @property
+    def paginator(self):
+        # ?pagination=cursor или ?cursor=... — постраничный вывод по курсору
+        if not hasattr(self, '_paginator'):
+            if ProductKeysetPagination.is_requested(self.request):
+                self._paginator = ProductKeysetPagination()
+            else:
+                self._paginator = self.pagination_class()
+        return self._paginator
+
+    def list(self, request, *args, **kwargs):
+        # Ответ кэшируется по параметрам запроса и сбрасывается по тегам (store.list_cache)
+        data = list_cache.get_page(request)
+        if data is not None:
+            return Response(data, headers={'X-Cache': 'HIT'})
+        scope_versions = list_cache.get_tag_versions(list_cache.request_tags(request))
+        response = self.list_products(request, *args, **kwargs)
+        if response.status_code == status.HTTP_200_OK:
+            list_cache.set_page(request, response.data, scope_versions)
+        response['X-Cache'] = 'MISS'
+        return response
+
+    def list_products(self, request, *args, **kwargs):
+        # Фильтрация, сортировка и пагинация по индексу каталога в памяти;
+        # из базы загружаются только товары текущей страницы
+        # Страница сериализуется проекцией из строк .values() (store.projections)
+        projection = ProductNameProjection(self.get_serializer_context())
+        product_ids = resolve_product_ids(request.query_params)
+        if product_ids is None:
+            queryset = self.filter_queryset(self.get_queryset())
+            page = self.paginate_queryset(projection.rows(queryset))
+            return self.get_paginated_response(projection.serialize(page))
+        page_ids = self.paginate_queryset(product_ids)
+        return self.get_paginated_response(projection.serialize_ids(page_ids))
+
+    def get_base_queryset(self, request):
         queryset = Product.objects.all()
 
-        min_price = self.request.query_params.get('min_price')
-        max_price = self.request.query_params.get('max_price')
+        min_price = request.query_params.get('min_price')
+        max_price = request.query_params.get('max_price')
 
         if min_price is not None and max_price is not None:
             queryset = queryset.filter(price__range=(
@@ -135,20 +266,34 @@ class ProductViewSet(viewsets.ModelViewSet):
         elif min_price is not None:
             queryset = queryset.filter(price__gte=min_price).order_by('price')
 
-        ordering = self.request.query_params.get('ordering')
+        ordering = request.query_params.get('ordering')
         if ordering == 'views_count':
-            queryset = queryset.annotate(views_count=Count(
-                'views__ip')).order_by('-views_count')
+            queryset = queryset.order_by('-views_count')
+
+        return queryset
 
+    def get_filtered_queryset(self, request):
+        # Все фильтры из запроса, кроме сортировки
+        queryset = self.get_base_queryset(request)
+        for backend in self.filter_backends:
+            if backend is not filters.OrderingFilter:
+                queryset = backend().filter_queryset(request, queryset, self)
         return queryset
 
+    @action(detail=False)
+    def facets(self, request):
+        queryset = self.filter_queryset(self.get_queryset())
+        page = self.paginate_queryset(queryset)
+        serializer = self.get_serializer(page, many=True)
+        response = self.get_paginated_response(serializer.data)
+        response.data['facets'] = get_facets(self, request)
+        return response
+
     def retrieve(self, request, *args, **kwargs):
         instance = self.get_object()
+        self.record_view(request)
 
-        recommendations = Product.objects.filter(
-            category__in=instance.category.all(),
-            price__gte=instance.price
-        ).exclude(id=instance.id)
+        recommendations = get_recommendations(instance)
 
         recommendations_serializer = RelatedProductSerializer(
             recommendations, many=True, context={'request': request})
@@ -160,20 +305,6 @@ class ProductViewSet(viewsets.ModelViewSet):
 
         return Response(instance_data)
 
-        """ # Получение IP-адреса пользователя
-        ip_address = self.request.META.get('HTTP_X_FORWARDED_FOR') or self.request.META.get('REMOTE_ADDR')
-        # Проверка, просмотрел ли пользователь товар ранее
-        product_view = ProductView.objects.filter(product=instance, ip=ip_address).first()
-        if not product_view:
-            # Создание объекта ProductView при первом просмотре товара пользователем с данным IP-адресом
-            product_view = ProductView.objects.create(product=instance, ip=ip_address)
-        
-        # Увеличение счетчика просмотров товара
-        instance.views.add(product_view)
-        serializer = self.get_serializer(instance)
-
-        return Response(serializer.data) """
-
 
 class HomePageViewSet(viewsets.ModelViewSet):
     pagination_class = None
@@ -181,206 +312,116 @@ class HomePageViewSet(viewsets.ModelViewSet):
     serializer_class = HomePageSerializer
 
     def list(self, request):
-        all_collections = Collection.objects.all().prefetch_related('images')
-        all_collection_serializer = CollectionNameSerializer(
-            all_collections, many=True, context={'request': request})
-
-        # Получение 5 последних элементов коллекций
-        collections = Collection.objects.order_by('-id')[:5]
-        collection_serializer = CollectionNameSerializer(
-            collections, many=True, context={'request': request})
-
-        # Получение 8 категорий с 4 последними продуктами для каждой категории
-        categories = Category.objects.all()[:8]
-        categories_data = []
-        for category in categories:
-            products = category.product_set.order_by('-id')[:4]
-            product_serializer = ProductNameSerializer(
-                products, many=True, context={'request': request})
-            category_data = {
-                'category': CategorySerializer(category).data,
-                'products': product_serializer.data
-            }
-            categories_data.append(category_data)
-
-        # Получение 4 коллекций с 2 последними продуктами
-        collections = Collection.objects.order_by('-id')[:4]
-        collections_data = []
-        for collection in collections:
-            products = collection.product_set.order_by('-id')[:2]
-            product_serializer = ProductNameSerializer(
-                products, many=True, context={'request': request})
-            collection_data = {
-                'collection': CollectionNameSerializer(collection, context={'request': request}).data,
-                'products': product_serializer.data
-            }
-            collections_data.append(collection_data)
-
-        # Составление и возврат данных в формате JSON
-        data = {
-            'all_collections': all_collection_serializer.data,
-            'collections': collection_serializer.data,
-            'categories': categories_data,
-            'collections_with_products': collections_data
-        }
-        return Response(data)
+        # Страница собирается несколькими запросами и хранится в кэше до изменения каталога
+        return Response(get_home_page(request))
+
+
+def checkout_order(request):
+    """Заказ из данных запроса DRF; CheckoutError — ошибка в корзине."""
+    user_profile = None
+    if request.user.is_authenticated:
+        user_profile = Profile.objects.get(user=request.user)
+
+    order_number = request.data.get("order_number")
+    if order_number:
+        # Повтор после ошибки платёжного сервиса: оплачивается тот же заказ
+        return get_unpaid_order(order_number, user_profile)
+
+    client_data = request.data.get("client_data", {})
+    if not isinstance(client_data, dict):
+        client_data = {}
+
+    # Заказ и позиции создаются в одной транзакции (store.checkout)
+    lines = parse_lines(request.data.get("products", []))
+    # Номер берётся из зарезервированного процессом блока, без запроса к базе
+    return create_order(lines, client_data, next_order_number(), user_profile)
 
 
-def generate_order_number():
-    # Генерируем случайный номер, состоящий из букв и цифр
-    letters_and_digits = string.ascii_uppercase + string.digits
-    order_number = ''.join(random.choice(letters_and_digits)
-                           for _ in range(10))
-    return order_number
+def send_new_order_notification(order):
+    # После создания заказа отправляем уведомление
+    subject = 'New Order Notification'
+    message = f'A new order has been placed. Order ID: {order.id}'
+    from_email = settings.DEFAULT_FROM_EMAIL
+    recipient_list = [admin_email for _, admin_email in settings.ADMINS]
 
+    # HTML-версия рендерится из шаблона при отправке из очереди (store.mail_queue)
+    mail_queue.enqueue(subject, message, recipient_list, from_email,
+                       html_template='email_templates/new_order_notification.html', order=order)
 
 
 class YookassaPaymentCreateAPIView(APIView):
     def post(self, request, format=None):
-        if request.user.is_authenticated:
-            user = request.user
-        else:
-            user = None
-
-        product_data_list = request.data.get("products", [])
-        order_items = []
-        total_amount = 0
-
-       # Получение данных о клиенте
-        client_data = request.data.get("client_data", {})
-        first_name = client_data.get("first_name")
-        last_name = client_data.get("last_name")
-        email = client_data.get("email")
-        phone = client_data.get("phone")
-        city = client_data.get("city")
-        delivery_method = client_data.get("delivery_method")
-        street = client_data.get("street")
-        house = client_data.get("house")
-        apartment_office = client_data.get("apartment_office")
-        postal_code = client_data.get("postal_code")
-        courier_comment = client_data.get("courier_comment")
-
-        # Создание заказа с автоматическим номером и суммой
-        order_number = generate_order_number()
-        if user is None:
-            order = Order.objects.create(
-                status='created',
-                amount=total_amount,
-                order_number=order_number,
-                first_name=first_name,
-                last_name=last_name,
-                email=email,
-                phone=phone,
-                city=city,
-                delivery_method=delivery_method,
-                street=street,
-                house=house,
-                apartment_office=apartment_office,
-                postal_code=postal_code,
-                courier_comment=courier_comment
-            )
-        else:
-            user_profile = Profile.objects.get(user=request.user)
-            order = Order.objects.create(
-                user=user_profile,
-                status='created',
-                amount=total_amount,
-                order_number=order_number,
-                first_name=first_name,
-                last_name=last_name,
-                email=email,
-                phone=phone,
-                city=city,
-                delivery_method=delivery_method,
-                street=street,
-                house=house,
-                apartment_office=apartment_office,
-                postal_code=postal_code,
-                courier_comment=courier_comment
-            )
-
-       # Обработка данных о продуктах
-        for product_data in product_data_list:
-            product_id = product_data.get("product_id")
-            quantity = product_data.get("quantity")
-            size_id = product_data.get("size_id")
-            color_id = product_data.get("color_id")
-            price = product_data.get("price")
-
-            if product_id is None or quantity is None:
-                return Response({"error": "Некорректные данные продукта"}, status=400)
-
-            try:
-                product = Product.objects.get(pk=product_id)
-                product_amount = price * quantity
-                total_amount += product_amount
-                order_item = OrderItem.objects.create(
-                    order=order,
-                    product=product,
-                    quantity=quantity,
-                )
-
-                if color_id:
-                    color = Color.objects.get(pk=color_id)
-                    order_item.colors.add(color)
-
-                if size_id:
-                    size = Size.objects.get(pk=size_id)
-                    order_item.sizes.add(size)
-
-                order_item.save()
-                order_items.append(order_item)
-
-            except Product.DoesNotExist:
-                return Response({"error": "Продукт с ID {} не найден".format(product_id)}, status=400)
-
-        order.amount = total_amount
-        order.save()
-
-        Configuration.account_id = settings.YOOKASSA_ACCOUNT_ID
-        Configuration.secret_key = settings.YOOKASSA_SECRET_KEY
-
-        payment = Payment.create({
-            "amount": {
-                "value": str(total_amount),
-                "currency": "RUB"
-            },
-            "confirmation": {
-                "type": "redirect",
-                "return_url": "https://www.example.com/return_url"
-            },
-            "description": "Оплата заказа №" + str(order.id)
-        })
-        # Получение данных о платеже
-        payment_status = payment.status
-        payment_amount = payment.amount.value
-        # Сохранение данных о платеже в модели Payment
-        payment_record = PaymentRecord.objects.create(
-            order=order,
-            amount=payment_amount,
-            status=payment_status
-        )
-        payment_record.save()
-        # После создания заказа отправляем уведомление
-        subject = 'New Order Notification'
-        message = f'A new order has been placed. Order ID: {order.id}'
-        from_email = settings.DEFAULT_FROM_EMAIL
-        recipient_list = [admin_email for _, admin_email in settings.ADMINS]
-
-        # Отправка письма с использованием шаблона
-        email_html_message = render_to_string(
-            'email_templates/new_order_notification.html', {'order': order})
         try:
-            send_mail(subject, message, from_email, recipient_list,
-                      html_message=email_html_message)
-            print("Email sent successfully")
-        except Exception as e:
-            print("Email sending failed:")
-        confirmation_url = payment.confirmation.confirmation_url
+            order = checkout_order(request)
+        except CheckoutError as e:
+            return Response({"error": str(e)}, status=400)
 
+        # Платёж создаётся общим клиентом с пулом соединений и таймаутами (store.payments)
+        try:
+            confirmation_url, created = start_payment(order)
+        except PaymentGatewayError as e:
+            # Повтор с этим order_number использует тот же заказ и ключ идемпотентности
+            return Response({"error": str(e), "order_number": order.order_number}, status=503)
+
+        if created:
+            send_new_order_notification(order)
         return Response({"confirmation_url": confirmation_url})
 
 
+def _async_checkout(request):
+    try:
+        return checkout_order(request)
+    finally:
+        # Соединение не держится, пока идёт запрос к платёжному сервису
+        connection.close()
+
+
+def _async_finish(order, payment):
+    try:
+        confirmation_url, created = record_payment(order, payment)
+        if created:
+            send_new_order_notification(order)
+        return confirmation_url
+    finally:
+        connection.close()
+
+
+class YookassaPaymentCreateAsyncView(View):
+    """
+    То же, что YookassaPaymentCreateAPIView, для ASGI: во время запроса
+    к ЮKassa не заняты ни поток-обработчик, ни соединение с базой.
+    """
+
+    @classmethod
+    def as_view(cls, **initkwargs):
+        # Как APIView: аутентификация по JWT, CSRF не проверяется
+        view = super().as_view(**initkwargs)
+        view.csrf_exempt = True
+        return view
+
+    async def post(self, request, *args, **kwargs):
+        request = Request(
+            request,
+            parsers=[parser() for parser in api_settings.DEFAULT_PARSER_CLASSES],
+            authenticators=[auth() for auth in api_settings.DEFAULT_AUTHENTICATION_CLASSES],
+        )
+        try:
+            order = await sync_to_async(_async_checkout)(request)
+        except CheckoutError as e:
+            return JsonResponse({"error": str(e)}, status=400)
+        except APIException as e:
+            # Ошибки аутентификации и разбора JSON — в формате ответов DRF
+            data = e.detail if isinstance(e.detail, (list, dict)) else {"detail": e.detail}
+            return JsonResponse(data, status=e.status_code, safe=False)
+
+        try:
+            payment = await request_payment_async(order.id, order.amount)
+            confirmation_url = await sync_to_async(_async_finish)(order, payment)
+        except PaymentGatewayError as e:
+            return JsonResponse({"error": str(e), "order_number": order.order_number}, status=503)
+        return JsonResponse({"confirmation_url": confirmation_url})
+
+
 """ import base64
 import requests
 from rest_framework.views import APIView